@@ -0,0 +1,444 @@
+"""Queries over every logged conference (see transcripts.py).
+
+    python analytics.py journalists --topic transfers
+    python analytics.py format
+    python analytics.py counts
+    python analytics.py search "rumour* striker"
+
+Each journalist turn is parsed into (journalist, outlet, question, turn) as
+it is read from the transcript log, checked against the `**Name (Outlet):**`
+format and the journalists actually in the room, and its words are added to
+an inverted index: term -> ids of the questions using it. The index records
+how far into the log it has read, so `refresh` only parses records appended
+since. It is cached next to the store, as JSON with the arrays' raw bytes
+in base64 (nothing that could run code, as a pickle could), and rebuilt
+only once compaction has rewritten the log (which is also when deleted
+sessions drop out of it).
+
+Queries are words to AND together, `word*` matching every term with that
+prefix (found by bisecting the sorted vocabulary), and ` OR ` between
+alternatives.
+"""
+
+import argparse
+import base64
+import bisect
+import json
+import os
+import re
+import sys
+import time
+from array import array
+from collections import Counter
+
+from history import QUESTION, parse_question
+from prompts import _rules
+from sse import END_MARKER
+from transcripts import (
+    END,
+    PROMPT,
+    START,
+    TURN,
+    StoreBusy,
+    TranscriptError,
+    TranscriptStore,
+    default_directory,
+)
+
+WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+ROOM = re.compile(r"^- (.+?) \((.+?)\) — ", re.MULTILINE)
+# The question-count rule the model is given, so the report stays in step.
+RULE = tuple(int(n) for n in re.search(r"Ask (\d+)-(\d+) questions", _rules()).groups())
+
+TOPICS = {
+    "transfers": "transfer* OR rumour* OR bid OR bids OR linked OR window OR fee"
+    " OR sign OR signing*",
+    "injuries": "injur* OR fitness OR fit OR scan OR hamstring* OR knee OR ankle",
+    "tactics": "tactic* OR formation* OR system OR pressing OR midfield OR defen*",
+    "job": "sack* OR job OR board OR future OR pressure OR ultimatum",
+    "form": "form OR results OR run OR streak OR table OR relegation OR points",
+    "fans": "fans OR supporters OR crowd OR booed OR atmosphere",
+}
+
+# Ways a journalist turn can break the format, as bit flags.
+NO_HEADER = 1  # no **Name (Outlet):** at all
+PREAMBLE = 2  # text before the header
+UNKNOWN = 4  # a journalist who isn't in the room
+WRONG_OUTLET = 8  # a journalist in the room, with another outlet
+EMPTY = 16  # a header with no question
+PROBLEMS = {
+    "no_header": NO_HEADER,
+    "preamble": PREAMBLE,
+    "unknown_journalist": UNKNOWN,
+    "wrong_outlet": WRONG_OUTLET,
+    "empty": EMPTY,
+}
+
+CACHE_FILE = "analytics.json"
+# The per-question and per-session arrays, by attribute, with their types.
+ARRAYS = {"session": "I", "turn": "H", "journalist": "I", "problems": "B", "asked": "H"}
+
+
+def _dump_array(a: array) -> str:
+    return base64.b64encode(a.tobytes()).decode("ascii")
+
+
+def _load_array(typecode: str, data: str) -> array:
+    a = array(typecode)
+    a.frombytes(base64.b64decode(data, validate=True))
+    return a
+
+
+def room(system_prompt: str) -> dict[str, str]:
+    """The journalists in a system prompt's room: name -> outlet."""
+    section = system_prompt.partition("# Journalists in the room")[2]
+    section = section.partition("\n\n#")[0]
+    return dict(ROOM.findall(section))
+
+
+def check(text: str, journalists: dict[str, str]) -> tuple[str, str, str, int]:
+    """(journalist, outlet, question, problems) of a journalist turn."""
+    name, outlet, question = parse_question(text)
+    question = question.replace(END_MARKER, "").strip()
+    m = QUESTION.search(text)
+    if m is None:
+        return name, outlet, question, NO_HEADER | (0 if question else EMPTY)
+    problems = PREAMBLE if text[: m.start()].strip() else 0
+    if journalists:
+        if name not in journalists:
+            problems |= UNKNOWN
+        elif journalists[name] != outlet:
+            problems |= WRONG_OUTLET
+    if not question:
+        problems |= EMPTY
+    return name, outlet, question, problems
+
+
+class Analytics:
+    """Parsed questions from a transcript store, with an inverted index."""
+
+    CACHE_VERSION = 2  # bump when the indexed fields change
+
+    def __init__(self, store: TranscriptStore):
+        self.store = store
+        self._reset(store.generation)
+
+    def _reset(self, generation: int) -> None:
+        self.generation = generation
+        self.offset = 0  # how far into the log has been indexed
+        # Per question, by id.
+        self.session: array = array("I")
+        self.turn: array = array("H")
+        self.journalist: array = array("I")
+        self.problems: array = array("B")
+        self._flags: Counter = Counter()  # questions per set of problems
+        self.text: list[str] = []
+        # Interned (name, outlet) pairs, and per-session state.
+        self.journalists: list[tuple[str, str]] = []
+        self._journalist_ids: dict[tuple[str, str], int] = {}
+        self._asked_by: list[array] = []  # question ids per journalist
+        self.sessions: list[str] = []
+        self._session_ids: dict[str, int] = {}
+        self.asked: array = array("H")  # questions per session
+        self.status: list[str] = []
+        self._prompt: list[str] = []  # its prompt's fingerprint
+        self._rooms: dict[str, dict[str, str]] = {}  # prompt fingerprint -> room
+        self.postings: dict[str, array] = {}
+        self._vocabulary: list[str] | None = []
+
+    # --- Indexing ---
+
+    @classmethod
+    def open(cls, store: TranscriptStore) -> "Analytics":
+        """The analytics cached beside `store`, brought up to date."""
+        try:
+            doc = json.loads((store.directory / CACHE_FILE).read_bytes())
+            analytics = cls._from_cache(store, doc)
+        except (OSError, ValueError, KeyError, TypeError):
+            analytics = cls(store)
+        if analytics.refresh():
+            analytics.save()
+        return analytics
+
+    @classmethod
+    def _from_cache(cls, store: TranscriptStore, doc: dict) -> "Analytics":
+        """Raises ValueError, KeyError or TypeError for a cache that is of
+        another version, or isn't one at all."""
+        if doc["version"] != cls.CACHE_VERSION or doc["byteorder"] != sys.byteorder:
+            raise ValueError("Cached by another version")
+        analytics = cls(store)
+        analytics.generation = doc["generation"]
+        analytics.offset = doc["offset"]
+        for name, typecode in ARRAYS.items():
+            setattr(analytics, name, _load_array(typecode, doc[name]))
+        analytics._flags = Counter({int(flags): n for flags, n in doc["flags"]})
+        analytics.text = doc["text"]
+        analytics.journalists = [(name, outlet) for name, outlet in doc["journalists"]]
+        analytics._journalist_ids = {j: i for i, j in enumerate(analytics.journalists)}
+        analytics._asked_by = [_load_array("I", asked) for asked in doc["asked_by"]]
+        analytics.sessions = doc["sessions"]
+        analytics._session_ids = {s: i for i, s in enumerate(analytics.sessions)}
+        analytics.status = doc["status"]
+        analytics._prompt = doc["prompts"]
+        analytics._rooms = doc["rooms"]
+        analytics.postings = {
+            term: _load_array("I", posting) for term, posting in doc["postings"].items()
+        }
+        analytics._vocabulary = None
+
+        per_question = (
+            analytics.session,
+            analytics.turn,
+            analytics.journalist,
+            analytics.problems,
+        )
+        per_session = (analytics.asked, analytics.status, analytics._prompt)
+        if (
+            any(len(a) != len(analytics.text) for a in per_question)
+            or any(len(a) != len(analytics.sessions) for a in per_session)
+            or len(analytics._asked_by) != len(analytics.journalists)
+        ):
+            raise ValueError("Inconsistent cache")
+        return analytics
+
+    def save(self) -> None:
+        doc = {
+            "version": self.CACHE_VERSION,
+            "byteorder": sys.byteorder,
+            "generation": self.generation,
+            "offset": self.offset,
+            **{name: _dump_array(getattr(self, name)) for name in ARRAYS},
+            "flags": list(self._flags.items()),
+            "text": self.text,
+            "journalists": self.journalists,
+            "asked_by": [_dump_array(asked) for asked in self._asked_by],
+            "sessions": self.sessions,
+            "status": self.status,
+            "prompts": self._prompt,
+            "rooms": self._rooms,
+            "postings": {t: _dump_array(p) for t, p in self.postings.items()},
+        }
+        path = self.store.directory / CACHE_FILE
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(json.dumps(doc, separators=(",", ":")).encode())
+        os.replace(tmp, path)
+
+    def refresh(self) -> int:
+        """Index what has been logged since the last refresh (everything, if
+        the log has been compacted meanwhile). Returns the records read."""
+        if self.store.generation != self.generation:
+            self._reset(self.store.generation)
+        try:
+            records = self.store.scan(self.offset, self.generation)
+        except TranscriptError:  # compacted just now
+            self._reset(self.store.generation)
+            records = self.store.scan(0, self.generation)
+        read = 0
+        for offset, size, kind, payload in records:
+            self._add(kind, payload)
+            self.offset = offset + size
+            read += 1
+        return read
+
+    def _add(self, kind: int, payload: dict) -> None:
+        if kind == PROMPT:
+            self._rooms[payload["fingerprint"]] = room(payload["text"])
+            return
+        session_id = payload["session"]
+        if kind == START:
+            self._session_ids[session_id] = len(self.sessions)
+            self.sessions.append(session_id)
+            self.asked.append(0)
+            self.status.append("live")
+            self._prompt.append(payload["fingerprint"])
+            return
+        s = self._session_ids.get(session_id)
+        if s is None:
+            return
+        if kind == END:
+            self.status[s] = "abandoned" if payload["abandoned"] else "finished"
+            return
+        self.status[s] = "live"
+        if kind != TURN or payload["role"] != "model":
+            return
+
+        journalists = self._rooms.get(self._prompt[s], {})
+        name, outlet, question, problems = check(payload["text"], journalists)
+        if not question and END_MARKER in payload["text"]:
+            return  # just the closing sentinel
+        key = (name, outlet)
+        j = self._journalist_ids.get(key)
+        if j is None:
+            j = self._journalist_ids[key] = len(self.journalists)
+            self.journalists.append(key)
+            self._asked_by.append(array("I"))
+        self.asked[s] += 1
+        q = len(self.text)
+        self.session.append(s)
+        self.turn.append(self.asked[s])
+        self.journalist.append(j)
+        self.problems.append(problems)
+        self._flags[problems] += 1
+        self.text.append(question)
+        self._asked_by[j].append(q)
+        for term in set(WORD.findall(question.lower())):
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = array("I")
+                self._vocabulary = None
+            posting.append(q)
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    # --- Queries ---
+
+    def _term(self, term: str) -> set[int]:
+        if not term.endswith("*"):
+            return set(self.postings.get(term, ()))
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        prefix = term[:-1]
+        found: set[int] = set()
+        i = bisect.bisect_left(self._vocabulary, prefix)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(prefix):
+            found.update(self.postings[self._vocabulary[i]])
+            i += 1
+        return found
+
+    def _match(self, query: str) -> set[int]:
+        matches: set[int] = set()
+        for alternative in query.lower().split(" or "):
+            terms = sorted(
+                alternative.split(), key=lambda t: len(self.postings.get(t, ()))
+            )
+            if not terms:
+                continue
+            found = self._term(terms[0])
+            for term in terms[1:]:
+                if not found:
+                    break
+                found &= self._term(term)
+            matches |= found
+        return matches
+
+    def search(self, query: str) -> list[int]:
+        """Ids of the questions matching `query` (see the module docstring)."""
+        return sorted(self._match(query))
+
+    def by_journalist(self, query: str | None = None) -> Counter:
+        """Questions per (journalist, outlet), of those matching `query` or
+        of all of them."""
+        if query is None:
+            counts = {j: len(asked) for j, asked in enumerate(self._asked_by)}
+        else:
+            # One membership test per question beats a lookup per match.
+            matched = self._match(query).__contains__
+            counts = {
+                j: sum(map(matched, asked)) for j, asked in enumerate(self._asked_by)
+            }
+        return Counter({self.journalists[j]: n for j, n in counts.items() if n})
+
+    def topic_share(self, query: str) -> list[tuple[tuple[str, str], int, float]]:
+        """Per journalist: questions matching `query`, and the share of all
+        their questions that is, most prolific first."""
+        hits = self.by_journalist(query)
+        totals = self.by_journalist()
+        return [(who, n, n / totals[who]) for who, n in hits.most_common()]
+
+    def format_problems(self) -> dict[str, int]:
+        """Journalist turns breaking the format, by kind of problem."""
+        return {
+            problem: sum(n for f, n in self._flags.items() if f & bit)
+            for problem, bit in PROBLEMS.items()
+        }
+
+    def question_counts(self) -> Counter:
+        """Finished conferences by number of questions asked."""
+        return Counter(
+            n for n, status in zip(self.asked, self.status) if status == "finished"
+        )
+
+
+def _print_table(rows: list[tuple], headers: tuple[str, ...]) -> None:
+    widths = [max(len(str(x)) for x in col) for col in zip(headers, *rows)]
+    for row in (headers, *rows):
+        print("  ".join(str(x).ljust(w) for x, w in zip(row, widths)).rstrip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--dir",
+        default=os.environ.get("FMPSC_TRANSCRIPTS"),
+        help="the transcript store (default: FMPSC_TRANSCRIPTS or a per-user data dir)",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    journalists = commands.add_parser("journalists", help="who asks most about a topic")
+    journalists.add_argument("--topic", choices=TOPICS, default="transfers")
+    journalists.add_argument("--query", help="a search query instead of a topic")
+    journalists.add_argument("--limit", type=int, default=10)
+    commands.add_parser("format", help="how often journalist turns break format")
+    commands.add_parser("counts", help="questions per conference vs the rules")
+    search = commands.add_parser("search", help="questions matching a query")
+    search.add_argument("query")
+    search.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    try:
+        store = TranscriptStore(args.dir or default_directory())
+    except StoreBusy as e:
+        sys.exit(f"{e}: try again once the conference is over")
+    with store:
+        start = time.perf_counter()
+        analytics = Analytics.open(store)
+        loaded = time.perf_counter()
+        total = len(analytics)
+        print(
+            f"{total:,} questions from {len(analytics.sessions):,} conferences "
+            f"(indexed in {(loaded - start) * 1000:.0f} ms)\n"
+        )
+        if not total:
+            sys.exit(0)
+
+        if args.command == "journalists":
+            rows = analytics.topic_share(args.query or TOPICS[args.topic])
+            _print_table(
+                [(n, o, hits, f"{share:.0%}") for (n, o), hits, share in rows][
+                    : args.limit
+                ],
+                ("journalist", "outlet", "questions", "of theirs"),
+            )
+        elif args.command == "format":
+            problems = analytics.format_problems()
+            broken = total - analytics._flags[0]
+            print(f"{broken:,} of {total:,} turns ({broken / total:.1%}) break format")
+            _print_table(
+                [(p, n, f"{n / total:.1%}") for p, n in problems.items()],
+                ("problem", "turns", "rate"),
+            )
+        elif args.command == "counts":
+            counts = analytics.question_counts()
+            finished = sum(counts.values())
+            lo, hi = RULE
+            within = sum(n for asked, n in counts.items() if lo <= asked <= hi)
+            if finished:
+                print(
+                    f"{within:,} of {finished:,} finished conferences "
+                    f"({within / finished:.1%}) asked {lo}-{hi} questions"
+                )
+            _print_table(
+                [(asked, n) for asked, n in sorted(counts.items())],
+                ("questions", "conferences"),
+            )
+        else:
+            ids = analytics.search(args.query)
+            print(f"{len(ids):,} matching questions")
+            for q in ids[: args.limit]:
+                name, outlet = analytics.journalists[analytics.journalist[q]]
+                print(f"- {name} ({outlet}), Q{analytics.turn[q]}: {analytics.text[q]}")
+        print(f"\n[{(time.perf_counter() - loaded) * 1000:.1f} ms]")
+
+
+if __name__ == "__main__":
+    main()
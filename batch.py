@@ -0,0 +1,371 @@
+"""Headless batch runner for regression-testing prompt changes.
+
+Plays every (scenario × answer script × repetition) combination against
+scripted manager answers, with a bounded number of conferences in flight,
+and appends one JSON line per finished conference to the output file.
+Re-running with the same output file skips jobs that already succeeded.
+
+    python batch.py scripts.json --out results.jsonl --reps 3 --concurrency 8
+
+`scripts.json` maps a script name to its list of manager answers. With
+`--record DIR` every turn is also saved to a cassette (see cassette.py),
+which `--replay DIR` later serves offline for deterministic re-runs.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass, field
+
+from cassette import recorded
+from engine import (
+    AnswerSource,
+    CachedContext,
+    Conference,
+    ScriptedAnswers,
+    run_conference,
+)
+from history import HistoryWindow
+from models import GameState
+from packs import ScenarioError, load_scenarios
+from prompts import build_system_prompt
+from scheduler import Priority, QuotaScheduler, scheduled, shared_scheduler
+from tracing import NULL_TRACER, Tracer, merged, write_chrome_trace
+from transport import GEMINI_BASE_URL, GEMINI_MODEL, AsyncGeminiTransport, gemini_url
+
+
+@dataclass
+class Job:
+    scenario: str
+    script: str
+    rep: int
+
+    @property
+    def id(self) -> str:
+        return f"{self.scenario}:{self.script}:{self.rep}"
+
+
+def job_matrix(
+    scenarios: Iterable[str], scripts: Iterable[str], reps: int
+) -> Iterator[Job]:
+    for scenario in scenarios:
+        for script in scripts:
+            for rep in range(reps):
+                yield Job(scenario, script, rep)
+
+
+def completed_jobs(path: str) -> set[str]:
+    """Ids of jobs already recorded as successful in `path`.
+
+    A line cut short by an interrupted run is dropped from the file so the
+    next append starts on a clean line.
+    """
+    if not os.path.exists(path):
+        return set()
+
+    done = set()
+    with open(path, "rb+") as f:
+        good_end = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            good_end += len(line)
+            if record.get("status") == "ok":
+                done.add(record["job"])
+        f.truncate(good_end)
+    return done
+
+
+class TurnTimer:
+    """Records time-to-first-token and duration of every journalist turn.
+
+    Pass `on_text` as the engine's text callback and wrap the answer source;
+    a turn ends when the engine asks for the manager's answer (or when the
+    conference finishes, see `finish`).
+    """
+
+    def __init__(self, answers: AnswerSource):
+        self.answers = answers
+        self.turns: list[dict] = []
+        self._start = time.perf_counter()
+        self._first: float | None = None
+        self._chunks = 0
+
+    def on_text(self, text: str) -> None:
+        if self._first is None:
+            self._first = time.perf_counter()
+        self._chunks += 1
+
+    def _end_turn(self, question: str) -> None:
+        end = time.perf_counter()
+        first = self._first if self._first is not None else end
+        self.turns.append(
+            {
+                "ttft": round(first - self._start, 4),
+                "duration": round(end - self._start, 4),
+                "chunks": self._chunks,
+                "chars": len(question),
+            }
+        )
+
+    async def next_answer(self, question: str) -> str | None:
+        self._end_turn(question)
+        answer = await self.answers.next_answer(question)
+        self._start = time.perf_counter()
+        self._first = None
+        self._chunks = 0
+        return answer
+
+    def finish(self, conference: Conference) -> None:
+        if len(self.turns) < len(conference.questions):
+            self._end_turn(conference.questions[-1])
+
+
+@dataclass
+class JobOptions:
+    """Per-conference features, applied to every job of a batch."""
+
+    cache_ttl: int | None = None  # Gemini context cache TTL in seconds
+    history_budget: int | None = None  # summarise history past this many tokens
+    trace: bool = False  # collect a Tracer per job into `tracers`
+    tracers: list[Tracer] = field(default_factory=list)
+
+    def conference(self, job: Job, system_prompt: str) -> Conference:
+        tracer = NULL_TRACER
+        if self.trace:
+            tracer = Tracer(tid=len(self.tracers) + 1, name=job.id)
+            self.tracers.append(tracer)
+        return Conference(
+            system_prompt,
+            cache=CachedContext(self.cache_ttl) if self.cache_ttl else None,
+            history=(
+                HistoryWindow(self.history_budget) if self.history_budget else None
+            ),
+            tracer=tracer,
+        )
+
+
+async def play_job(
+    transport: AsyncGeminiTransport,
+    job: Job,
+    system_prompt: str,
+    answers: list[str],
+    options: JobOptions | None = None,
+) -> dict:
+    conference = (options or JobOptions()).conference(job, system_prompt)
+    timer = TurnTimer(ScriptedAnswers(answers))
+    started = time.perf_counter()
+    record = {
+        "job": job.id,
+        "scenario": job.scenario,
+        "script": job.script,
+        "rep": job.rep,
+    }
+    try:
+        await run_conference(transport, conference, timer, timer.on_text)
+    except Exception as e:  # one job's failure, whatever it is, not the batch's
+        record.update(status="error", error_type=type(e).__name__, error=str(e))
+    else:
+        timer.finish(conference)
+        record.update(
+            status="ok",
+            finished=conference.finished and not conference.abandoned,
+            questions=len(conference.questions),
+        )
+    record.update(
+        elapsed=round(time.perf_counter() - started, 4),
+        turns=timer.turns,
+        contents=conference.contents,
+    )
+    if conference.tracer.enabled:
+        record["usage"] = dict(conference.tracer.usage)
+    return record
+
+
+async def run_batch(
+    transport: AsyncGeminiTransport,
+    jobs: Iterable[Job],
+    scripts: dict[str, list[str]],
+    out_path: str,
+    concurrency: int = 8,
+    options: JobOptions | None = None,
+    registry: dict[str, tuple[str, Callable[[], GameState]]] | None = None,
+) -> tuple[int, int]:
+    """Run `jobs` with at most `concurrency` in flight, appending each result
+    to `out_path` as soon as it completes. Returns (succeeded, failed).
+    Scenario keys are looked up in `registry` (default: load_scenarios()); a
+    scenario that fails to build fails its jobs, not the batch."""
+    registry = registry or load_scenarios()
+    queue: asyncio.Queue[Job] = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    prompts: dict[str, str] = {}
+    broken: dict[str, str] = {}  # scenario -> why it can't be built
+    succeeded = failed = 0
+
+    with open(out_path, "a", encoding="utf-8") as out:
+
+        async def worker():
+            nonlocal succeeded, failed
+            while not queue.empty():
+                job = queue.get_nowait()
+                if job.scenario not in prompts and job.scenario not in broken:
+                    _, factory = registry[job.scenario]
+                    try:
+                        prompts[job.scenario] = build_system_prompt(factory())
+                    except ScenarioError as e:
+                        broken[job.scenario] = str(e)
+                if job.scenario in broken:
+                    record = {
+                        "job": job.id,
+                        "scenario": job.scenario,
+                        "script": job.script,
+                        "rep": job.rep,
+                        "status": "error",
+                        "error_type": "ScenarioError",
+                        "error": broken[job.scenario],
+                    }
+                else:
+                    record = await play_job(
+                        transport,
+                        job,
+                        prompts[job.scenario],
+                        scripts[job.script],
+                        options,
+                    )
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                if record["status"] == "ok":
+                    succeeded += 1
+                else:
+                    failed += 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    return succeeded, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scripts", help="JSON file: {script name: [answers]}")
+    parser.add_argument("--out", default="results.jsonl")
+    parser.add_argument(
+        "--scenarios", help="comma-separated scenario keys (default: all)"
+    )
+    parser.add_argument("--reps", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--base-url", default=GEMINI_BASE_URL)
+    parser.add_argument("--model", default=GEMINI_MODEL)
+    parser.add_argument(
+        "--context-cache",
+        type=int,
+        metavar="TTL",
+        help="cache each system prompt server-side for TTL seconds",
+    )
+    parser.add_argument(
+        "--history-budget",
+        type=int,
+        metavar="TOKENS",
+        help="summarise older exchanges once the history passes TOKENS",
+    )
+    parser.add_argument(
+        "--trace", metavar="FILE", help="write a Chrome trace of every job to FILE"
+    )
+    parser.add_argument("--record", metavar="DIR", help="record every turn into DIR")
+    parser.add_argument(
+        "--replay", metavar="DIR", help="answer from a cassette in DIR, offline"
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=1.0,
+        metavar="FACTOR",
+        help="replay this many times faster than recorded (0: no delays)",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=int,
+        default=os.environ.get("GEMINI_RPM"),
+        help="requests per minute to stay within (default: GEMINI_RPM)",
+    )
+    parser.add_argument(
+        "--tpm",
+        type=int,
+        default=os.environ.get("GEMINI_TPM"),
+        help="tokens per minute to stay within (default: GEMINI_TPM)",
+    )
+    args = parser.parse_args()
+    if args.record and args.replay:
+        parser.error("--record and --replay are mutually exclusive")
+
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if args.replay:
+        api_key = api_key or "replay"  # never sent
+    if not api_key:
+        sys.exit("Set GEMINI_API_KEY environment variable first.")
+
+    with open(args.scripts, encoding="utf-8") as f:
+        scripts = json.load(f)
+    registry = load_scenarios()
+    scenarios = args.scenarios.split(",") if args.scenarios else list(registry)
+    unknown = [s for s in scenarios if s not in registry]
+    if unknown:
+        sys.exit(f"Unknown scenario(s): {', '.join(unknown)}")
+
+    done = completed_jobs(args.out)
+    jobs = [j for j in job_matrix(scenarios, scripts, args.reps) if j.id not in done]
+    print(f"{len(jobs)} job(s) to run, {len(done)} already done", file=sys.stderr)
+
+    options = JobOptions(
+        cache_ttl=args.context_cache,
+        history_budget=args.history_budget,
+        trace=bool(args.trace),
+    )
+
+    scheduler = None
+    if args.rpm or args.tpm:
+        scheduler = QuotaScheduler(args.rpm, args.tpm)
+
+    async def go():
+        transport = AsyncGeminiTransport(
+            api_key,
+            gemini_url(args.model, args.base_url),
+            max_connections=args.concurrency,
+        )
+        transport = scheduled(transport, Priority.BATCH, scheduler)
+        async with recorded(
+            transport, args.record, args.replay, args.replay_speed
+        ) as transport:
+            return await run_batch(
+                transport,
+                jobs,
+                scripts,
+                args.out,
+                args.concurrency,
+                options,
+                registry,
+            )
+
+    succeeded, failed = asyncio.run(go())
+    if options.trace:
+        combined = merged(options.tracers)
+        write_chrome_trace(combined, args.trace)
+        print(combined.summary_table(), file=sys.stderr)
+    scheduler = scheduler or shared_scheduler()
+    if scheduler:
+        print(f"Scheduler: {json.dumps(scheduler.stats())}", file=sys.stderr)
+    print(f"{succeeded} succeeded, {failed} failed", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,684 @@
+"""Latency and throughput benchmarks against the local mock Gemini server.
+
+    python bench.py                                  # 1, 10, 100, 1000 sessions
+    python bench.py --sessions 1,10 --json now.json -- --token-rate 200
+    python bench.py --compare baseline.json          # exit 1 on regression
+
+Also measured: `build_system_prompt`, GameState memory and snapshots,
+serialising request bodies turn by turn, cold start (import time, and time
+from spawning a process to its first request reaching the server, since
+batch jobs run in short-lived workers), time to the first whole question
+with and without an opener pool, first-token latency with hedging between
+two mocks (one fast but prone to stalls, one slower but steady), and how
+server.py's throughput grows with worker processes.
+
+Arguments after `--` are passed to mock_server.py. With `--base-url` the
+benchmark targets an already running endpoint instead of spawning a mock.
+"""
+
+import argparse
+import asyncio
+import copy
+import gc
+import json
+import os
+import pickle
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import httpx
+
+import codec
+from batch import TurnTimer
+from engine import (
+    APIError,
+    CachedContext,
+    Conference,
+    ScriptedAnswers,
+    run_conference,
+    stream_question,
+)
+from hedging import HedgedTransport, HedgePolicy
+from models import freeze
+from openers import OpenerPool
+from prompts import SectionCache, build_system_prompt
+from scenarios import SCENARIOS
+from transport import (
+    GEMINI_MODEL,
+    AsyncGeminiTransport,
+    GeminiTransport,
+    encode_json,
+    gemini_url,
+)
+
+# Metrics compared by --compare, and whether bigger is better.
+TRACKED = {
+    "ttft_p95": False,
+    "turn_p95": False,
+    "chunks_per_s": True,
+    "prompt_us": False,
+    "prompt_cached_us": False,
+    "snapshot_us": False,
+    "restore_us": False,
+    "request_builder_us": False,
+    "import_main_ms": False,
+    "import_batch_ms": False,
+    "import_server_ms": False,
+    "first_request_main_ms": False,
+    "first_request_batch_ms": False,
+    "first_question_ms": False,
+    "hedged_ttft_p95": False,
+    "turns_per_s": True,
+}
+
+# Entry points whose cold import time is tracked.
+STARTUP_MODULES = ("main", "batch", "server", "engine", "prompts")
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Linear-interpolated percentile, `p` in [0, 100]."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def bench_prompt(iterations: int = 2000) -> dict:
+    """Mean cost of `build_system_prompt` across the registered scenarios:
+    rendered from scratch, and from frozen states through the section cache."""
+    states = [factory() for _, factory in SCENARIOS.values()]
+    frozen = [freeze(state) for state in states]
+    cache = SectionCache()
+    start = time.perf_counter()
+    for i in range(iterations):
+        build_system_prompt(states[i % len(states)], cache=None)
+    elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(iterations):
+        build_system_prompt(frozen[i % len(frozen)], cache=cache)
+    cached = time.perf_counter() - start
+    return {
+        "prompt_us": elapsed / iterations * 1e6,
+        "prompt_cached_us": cached / iterations * 1e6,
+        "section_hit_rate": cache.hit_rate,
+    }
+
+
+def _per_call_us(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def _bytes_per_state(make, count: int) -> float:
+    tracemalloc.start()
+    states = [make() for _ in range(count)]
+    gc.collect()  # also empties the free lists, which tracemalloc would count
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del states
+    return size / count
+
+
+def bench_models(count: int = 1000, iterations: int = 2000) -> dict:
+    """Memory per live GameState and snapshot/restore cost: the binary codec
+    against pickle and deepcopy, mutable states against frozen, interned
+    ones."""
+    _, factory = next(iter(SCENARIOS.values()))
+    state = factory()
+    snapshot = codec.encode(state)
+    pickled = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+    return {
+        "state_bytes": _bytes_per_state(factory, count),
+        "frozen_state_bytes": _bytes_per_state(lambda: freeze(factory()), count),
+        "snapshot_bytes": len(snapshot),
+        "pickle_bytes": len(pickled),
+        "snapshot_us": _per_call_us(lambda: codec.encode(state), iterations),
+        "restore_us": _per_call_us(lambda: codec.decode(snapshot), iterations),
+        "pickle_us": _per_call_us(lambda: pickle.dumps(state, 5), iterations),
+        "unpickle_us": _per_call_us(lambda: pickle.loads(pickled), iterations),
+        "deepcopy_us": _per_call_us(lambda: copy.deepcopy(state), iterations),
+        "freeze_us": _per_call_us(lambda: freeze(state), iterations),
+    }
+
+
+def bench_requests(turns: int = 15, conferences: int = 100) -> dict:
+    """Cost of serialising each turn's request over whole conferences:
+    `encode_json` of the full body against a conference's `RequestEncoder`,
+    which only encodes what is new since the last turn."""
+    _, factory = next(iter(SCENARIOS.values()))
+    prompt = build_system_prompt(factory())
+    question = "**Jamie Ruiz (The Athletic):** " + "How do you respond to that? " * 8
+    answer = "We focus on ourselves — the lads gave everything today. " * 4
+
+    def per_turn_us(encode) -> float:
+        elapsed = 0.0
+        for _ in range(conferences):
+            conference = Conference(prompt)
+            for turn in range(turns):
+                start = time.perf_counter()
+                encode(conference)
+                elapsed += time.perf_counter() - start
+                conference.add_question(f"{question}{turn}")
+                conference.add_answer(f"{answer}{turn}")
+        return elapsed / (turns * conferences) * 1e6
+
+    conference = Conference(prompt)
+    for turn in range(turns):
+        conference.add_question(f"{question}{turn}")
+        conference.add_answer(f"{answer}{turn}")
+    return {
+        "request_bytes": len(conference.encode_request()),
+        "request_encode_us": per_turn_us(lambda c: encode_json(c.request_body())),
+        "request_builder_us": per_turn_us(lambda c: c.encode_request()),
+    }
+
+
+def _import_ms(module: str) -> float:
+    """Cumulative import time of `module` in a fresh interpreter."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).parent,
+    ).stderr
+    for line in out.splitlines():
+        _, cumulative, name = line.split("|")
+        if name.strip() == module and not name.startswith("  "):
+            return int(cumulative) / 1000
+    raise ValueError(f"no import time reported for {module}")
+
+
+def _first_request_ms(argv: list[str]) -> float:
+    """Time from spawning `argv` until its first request reaches a socket
+    standing in for the API (the request itself is never answered)."""
+    with socket.create_server(("127.0.0.1", 0)) as server:
+        server.settimeout(30)
+        port = server.getsockname()[1]
+        env = {
+            **os.environ,
+            "GEMINI_API_KEY": "bench",
+            "GEMINI_BASE_URL": f"http://127.0.0.1:{port}/v1beta",
+        }
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            argv,
+            env=env,
+            cwd=Path(__file__).parent,
+            stdin=subprocess.PIPE,  # left open: the menu waits for a choice
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            conn, _ = server.accept()
+            with conn:
+                conn.recv(1)
+                return (time.perf_counter() - start) * 1000
+        finally:
+            proc.kill()
+            proc.wait()
+
+
+def bench_startup(runs: int = 5) -> dict:
+    """Median cold import time of each entry point, and time to first
+    request for the interactive CLI (its connection warm-up) and for a
+    one-job batch run, next to the bare interpreter's start-up time."""
+    result = {
+        f"import_{m}_ms": statistics.median(_import_ms(m) for _ in range(runs))
+        for m in STARTUP_MODULES
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        scripts = Path(tmp, "scripts.json")
+        scripts.write_text(json.dumps({"bench": ["No comment."]}))
+        argvs = {
+            "main": [sys.executable, "main.py"],
+            "batch": [
+                sys.executable,
+                "batch.py",
+                str(scripts),
+                "--out",
+                str(Path(tmp, "out.jsonl")),
+                "--scenarios",
+                next(iter(SCENARIOS)),
+            ],
+        }
+        for name, argv in argvs.items():
+            times = [_first_request_ms(argv) for _ in range(runs)]
+            result[f"first_request_{name}_ms"] = statistics.median(times)
+    result["interpreter_ms"] = statistics.median(
+        _per_call_us(lambda: subprocess.run([sys.executable, "-c", "pass"]), 1) / 1000
+        for _ in range(runs)
+    )
+    return result
+
+
+async def bench_sessions(
+    url: str, sessions: int, turns: int, cache_ttl: int | None = None
+) -> dict:
+    """Run `sessions` concurrent conferences of `turns` questions each."""
+    _, factory = next(iter(SCENARIOS.values()))
+    system_prompt = build_system_prompt(factory())
+    timers: list[TurnTimer] = []
+    errors = 0
+
+    async def session(transport):
+        nonlocal errors
+        cache = CachedContext(cache_ttl) if cache_ttl else None
+        conference = Conference(system_prompt, cache=cache)
+        timer = TurnTimer(ScriptedAnswers(["No comment."] * (turns - 1)))
+        try:
+            await run_conference(transport, conference, timer, timer.on_text)
+        except (APIError, httpx.HTTPError):
+            errors += 1
+            return
+        timer.finish(conference)
+        timers.append(timer)
+
+    async with AsyncGeminiTransport(
+        "bench", url, max_connections=sessions, max_retries=0
+    ) as transport:
+        start = time.perf_counter()
+        await asyncio.gather(*(session(transport) for _ in range(sessions)))
+        wall = time.perf_counter() - start
+
+    turn_stats = [t for timer in timers for t in timer.turns]
+    ttft = [t["ttft"] for t in turn_stats]
+    latency = [t["duration"] for t in turn_stats]
+    result = {"sessions": sessions, "turns": len(turn_stats), "errors": errors}
+    for p in (50, 95, 99):
+        result[f"ttft_p{p}"] = percentile(ttft, p)
+    for p in (50, 95, 99):
+        result[f"turn_p{p}"] = percentile(latency, p)
+    result["chunks_per_s"] = sum(t["chunks"] for t in turn_stats) / wall
+    result["wall_s"] = wall
+    return result
+
+
+def bench_openers(url: str, runs: int = 5) -> dict:
+    """Median time to the first whole question of a conference: asked for
+    when the conference starts, and taken from a warmed-up OpenerPool."""
+    _, factory = next(iter(SCENARIOS.values()))
+    system_prompt = build_system_prompt(factory())
+    transport = GeminiTransport("bench", url, max_retries=0)
+    with OpenerPool(transport, size=runs, per_journalist=runs) as pool:
+        cold = [
+            _per_call_us(lambda: pool.generate(system_prompt), 1) / 1000
+            for _ in range(runs)
+        ]
+        for future in pool.prefetch(system_prompt):
+            future.result()
+        pooled = [
+            _per_call_us(lambda: pool.take(system_prompt), 1) / 1000
+            for _ in range(min(runs, pool.available(system_prompt)))
+        ]
+    return {
+        "first_question_ms": statistics.median(cold),
+        "first_question_pooled_ms": statistics.median(pooled or [float("nan")]),
+    }
+
+
+# Mock latency profiles for bench_hedging.
+STALLING_MOCK = [
+    "--first-byte-delay",
+    "0.02",
+    "--stall-rate",
+    "0.05",
+    "--stall-delay",
+    "1",
+]
+STEADY_MOCK = ["--first-byte-delay", "0.1"]
+
+
+async def _ttfts(transport, requests: int, concurrency: int) -> list[float]:
+    _, factory = next(iter(SCENARIOS.values()))
+    system_prompt = build_system_prompt(factory())
+    ttfts = []
+
+    async def ask():
+        start = time.perf_counter()
+        first = []
+
+        def on_text(text):
+            if not first:
+                first.append(time.perf_counter() - start)
+
+        await stream_question(transport, Conference(system_prompt), on_text)
+        ttfts.extend(first)
+
+    for _ in range(0, requests, concurrency):
+        await asyncio.gather(*(ask() for _ in range(concurrency)))
+    return ttfts
+
+
+def bench_hedging(requests: int = 200, concurrency: int = 10) -> dict:
+    """First-token latency from a mock that sometimes stalls, on its own and
+    hedged (with the default 5% budget) to a slower, steady one."""
+    stalling, stalling_url = spawn_mock([*STALLING_MOCK, "--seed", "1"])
+    steady, steady_url = spawn_mock([*STEADY_MOCK, "--seed", "2"])
+
+    def transport(base_url: str) -> AsyncGeminiTransport:
+        return AsyncGeminiTransport(
+            "bench", gemini_url(GEMINI_MODEL, base_url), max_connections=concurrency
+        )
+
+    async def run(hedge: bool) -> tuple[list[float], HedgePolicy | None]:
+        primary = transport(stalling_url)
+        if not hedge:
+            async with primary:
+                return await _ttfts(primary, requests, concurrency), None
+        policy = HedgePolicy()
+        async with HedgedTransport(primary, transport(steady_url), policy) as hedged:
+            return await _ttfts(hedged, requests, concurrency), policy
+
+    try:
+        alone, _ = asyncio.run(run(hedge=False))
+        hedged, policy = asyncio.run(run(hedge=True))
+    finally:
+        for proc in (stalling, steady):
+            proc.terminate()
+            proc.wait()
+    stats = policy.stats()
+    return {
+        "unhedged_ttft_p95": percentile(alone, 95),
+        "unhedged_ttft_p99": percentile(alone, 99),
+        "hedged_ttft_p95": percentile(hedged, 95),
+        "hedged_ttft_p99": percentile(hedged, 99),
+        "hedge_rate": stats["hedge_rate"],
+        "win_rate": stats["win_rate"],
+    }
+
+
+def spawn_mock(mock_args: list[str]) -> tuple[subprocess.Popen, str]:
+    """Run mock_server.py in its own process so it doesn't share our loop."""
+    script = Path(__file__).with_name("mock_server.py")
+    proc = subprocess.Popen(
+        [sys.executable, str(script), "--port", "0", *mock_args],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    line = proc.stdout.readline().strip()
+    if not line.startswith("GEMINI_BASE_URL="):
+        proc.kill()
+        sys.exit(f"mock server failed to start: {line!r}")
+    return proc, line.split("=", 1)[1]
+
+
+# Answers at once, so the server's own work is what a worker pool scales.
+INSTANT_MOCK = ["--first-byte-delay", "0", "--token-rate", "0"]
+
+
+def spawn_server(
+    base_url: str, workers: int, store: str
+) -> tuple[subprocess.Popen, str]:
+    """Run server.py with `workers` processes on `store`."""
+    script = Path(__file__).with_name("server.py")
+    proc = subprocess.Popen(
+        [
+            sys.executable,
+            str(script),
+            "--port",
+            "0",
+            "--base-url",
+            base_url,
+            "--workers",
+            str(workers),
+            "--store",
+            store,
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+        env={**os.environ, "GEMINI_API_KEY": "bench"},
+    )
+    line = proc.stdout.readline().strip()
+    if not line.startswith("Serving on "):
+        proc.kill()
+        sys.exit(f"server failed to start: {line!r}")
+    return proc, line.removeprefix("Serving on ")
+
+
+async def _play(url: str, sessions: int) -> int:
+    """Play `sessions` whole conferences at once through the server's API.
+    Returns how many questions were asked."""
+    scenario = next(iter(SCENARIOS))
+    limits = httpx.Limits(max_connections=sessions)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+
+        async def conference() -> int:
+            resp = await client.post("/sessions", json={"scenario": scenario})
+            path = f"/sessions/{resp.raise_for_status().json()['id']}"
+            asked = 0
+            while True:
+                resp = await client.get(f"{path}/question")
+                if "event: question" not in resp.text:
+                    raise RuntimeError(f"no question: {resp.text[:200]!r}")
+                asked += 1
+                if "event: end" in resp.text:
+                    return asked
+                answer = {"text": "We take it one game at a time."}
+                resp = await client.post(f"{path}/answer", json=answer)
+                resp.raise_for_status()
+
+        return sum(await asyncio.gather(*(conference() for _ in range(sessions))))
+
+
+def bench_workers(sessions: int = 64) -> list[dict]:
+    """Questions per second through server.py with 1, 2, 4... worker
+    processes (up to the core count, and at least 2) sharing an SQLite
+    session store, against a mock that answers instantly. The mock is a
+    single process too, so on many cores it may become the limit."""
+    counts = [1]
+    while counts[-1] * 2 <= max(2, os.cpu_count() or 1):
+        counts.append(counts[-1] * 2)
+    mock, base_url = spawn_mock(INSTANT_MOCK)
+    rows = []
+    try:
+        for workers in counts:
+            with tempfile.TemporaryDirectory() as tmp:
+                store = f"sqlite://{Path(tmp, 'sessions.sqlite')}"
+                server, url = spawn_server(base_url, workers, store)
+                try:
+                    asyncio.run(_play(url, 4))  # warm up every worker's caches
+                    start = time.perf_counter()
+                    asked = asyncio.run(_play(url, sessions))
+                    elapsed = time.perf_counter() - start
+                finally:
+                    server.terminate()
+                    server.wait()
+            rows.append({"workers": workers, "turns_per_s": asked / elapsed})
+    finally:
+        mock.terminate()
+        mock.wait()
+    for row in rows:
+        row["scaling"] = row["turns_per_s"] / (row["workers"] * rows[0]["turns_per_s"])
+    return rows
+
+
+def print_table(
+    levels: list[dict],
+    prompt: dict,
+    models: dict,
+    requests: dict,
+    startup: dict,
+    openers: dict,
+    hedging: dict,
+    workers: list[dict],
+) -> None:
+    cols = ["sessions", "turns", "errors"]
+    cols += [f"ttft_p{p}" for p in (50, 95, 99)]
+    cols += [f"turn_p{p}" for p in (50, 95, 99)]
+    cols += ["chunks_per_s"]
+    print("  ".join(f"{c:>12}" for c in cols))
+    for row in levels:
+        cells = []
+        for c in cols:
+            v = row[c]
+            if c.startswith(("ttft", "turn_p")):
+                cells.append(f"{v * 1000:>10.1f}ms")
+            elif isinstance(v, float):
+                cells.append(f"{v:>12.1f}")
+            else:
+                cells.append(f"{v:>12}")
+        print("  ".join(cells))
+    print(
+        f"\nbuild_system_prompt: {prompt['prompt_us']:.1f} µs/call, "
+        f"{prompt['prompt_cached_us']:.1f} µs from frozen states "
+        f"({prompt['section_hit_rate']:.0%} section cache hits)"
+    )
+    print(
+        f"GameState: {models['state_bytes']:,.0f} B live, "
+        f"{models['frozen_state_bytes']:,.0f} B frozen (interned); "
+        f"snapshot {models['snapshot_bytes']:,} B vs pickle "
+        f"{models['pickle_bytes']:,} B"
+    )
+    print(
+        f"  encode {models['snapshot_us']:.1f} µs, decode {models['restore_us']:.1f}"
+        f" µs | pickle {models['pickle_us']:.1f} µs, unpickle "
+        f"{models['unpickle_us']:.1f} µs | deepcopy {models['deepcopy_us']:.1f} µs"
+        f" | freeze {models['freeze_us']:.1f} µs"
+    )
+    print(
+        f"Request body ({requests['request_bytes']:,} B at the last turn): "
+        f"{requests['request_encode_us']:.1f} µs/turn re-encoded, "
+        f"{requests['request_builder_us']:.1f} µs incrementally"
+    )
+    imports = ", ".join(f"{m} {startup[f'import_{m}_ms']:.0f}" for m in STARTUP_MODULES)
+    print(f"Cold import (ms): {imports}")
+    print(
+        f"  first request after {startup['first_request_main_ms']:.0f} ms "
+        f"(CLI warm-up), {startup['first_request_batch_ms']:.0f} ms (batch); "
+        f"bare interpreter {startup['interpreter_ms']:.0f} ms"
+    )
+    print(
+        f"First question after {openers['first_question_ms']:.0f} ms, "
+        f"{openers['first_question_pooled_ms']:.2f} ms from an opener pool"
+    )
+    print(
+        f"Hedging: ttft p95/p99 {hedging['unhedged_ttft_p95'] * 1000:.0f}/"
+        f"{hedging['unhedged_ttft_p99'] * 1000:.0f} ms alone, "
+        f"{hedging['hedged_ttft_p95'] * 1000:.0f}/"
+        f"{hedging['hedged_ttft_p99'] * 1000:.0f} ms hedged "
+        f"({hedging['hedge_rate']:.1%} hedged, {hedging['win_rate']:.0%} of those won)"
+    )
+    scaling = ", ".join(
+        f"{row['workers']}: {row['turns_per_s']:.0f}/s ({row['scaling']:.0%})"
+        for row in workers
+    )
+    print(f"Server questions by worker processes (scaling): {scaling}")
+
+
+def regressions(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Tracked metrics that got worse than `baseline` by more than `tolerance`."""
+    found = []
+    pairs = [
+        (current["prompt"], baseline.get("prompt", {}), "prompt"),
+        (current["models"], baseline.get("models", {}), "models"),
+        (current["requests"], baseline.get("requests", {}), "requests"),
+        (current["startup"], baseline.get("startup", {}), "startup"),
+        (current["openers"], baseline.get("openers", {}), "openers"),
+        (current["hedging"], baseline.get("hedging", {}), "hedging"),
+    ]
+    base_levels = {row["sessions"]: row for row in baseline.get("levels", [])}
+    for row in current["levels"]:
+        if row["sessions"] in base_levels:
+            pairs.append(
+                (row, base_levels[row["sessions"]], f"{row['sessions']} sessions")
+            )
+    base_workers = {row["workers"]: row for row in baseline.get("workers", [])}
+    for row in current["workers"]:
+        if row["workers"] in base_workers:
+            pairs.append(
+                (row, base_workers[row["workers"]], f"{row['workers']} workers")
+            )
+
+    for now, then, label in pairs:
+        for metric, higher_is_better in TRACKED.items():
+            if metric not in now or metric not in then:
+                continue
+            if higher_is_better:
+                worse = now[metric] < then[metric] * (1 - tolerance)
+            else:
+                worse = now[metric] > then[metric] * (1 + tolerance)
+            if worse:
+                found.append(
+                    f"{label}: {metric} {then[metric]:.4g} -> {now[metric]:.4g}"
+                )
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", default="1,10,100,1000")
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--base-url", help="benchmark this endpoint, no mock")
+    parser.add_argument("--model", default=GEMINI_MODEL)
+    parser.add_argument("--context-cache", type=int, metavar="TTL")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier --json")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args, mock_args = parser.parse_known_args()
+    if mock_args[:1] == ["--"]:
+        mock_args = mock_args[1:]
+
+    proc = None
+    base_url = args.base_url
+    if not base_url:
+        proc, base_url = spawn_mock(mock_args)
+    url = gemini_url(args.model, base_url)
+
+    try:
+        levels = [
+            asyncio.run(bench_sessions(url, int(n), args.turns, args.context_cache))
+            for n in args.sessions.split(",")
+        ]
+        openers = bench_openers(url)
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+    results = {
+        "levels": levels,
+        "prompt": bench_prompt(),
+        "models": bench_models(),
+        "requests": bench_requests(),
+        "startup": bench_startup(),
+        "openers": openers,
+        "hedging": bench_hedging(),
+        "workers": bench_workers(),
+    }
+    print_table(
+        levels,
+        results["prompt"],
+        results["models"],
+        results["requests"],
+        results["startup"],
+        results["openers"],
+        results["hedging"],
+        results["workers"],
+    )
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        found = regressions(results, baseline, args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
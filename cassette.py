@@ -0,0 +1,304 @@
+"""Record and replay Gemini streams, keyed by the request they answer.
+
+`CassetteTransport` wraps an `AsyncGeminiTransport`. In record mode each
+new successful streamed turn passes through untouched while its raw SSE
+bytes and their arrival times are appended to a `Cassette`; requests it
+already holds are served from it, so a recording can be resumed or
+extended. In replay mode the same requests are answered from the cassette
+without touching the network, at the recorded pace, sped up, or as fast as
+possible.
+
+Requests are keyed by a hash of the system prompt and `contents` only, so a
+recording replays whatever the API key, model URL or context caching
+(cached prompts are resolved through the `cachedContents` calls seen while
+recording). A cassette is a directory holding an append-only `streams.bin`
+and a SQLite index on that key, so lookups stay O(1) however many turns it
+holds.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+import httpx
+
+from transport import AsyncGeminiTransport
+
+
+def request_key(body: dict, system_prompt: str | None = None) -> str:
+    """Hash of what determines the reply: the system prompt and `contents`."""
+    if system_prompt is None:
+        parts = body.get("system_instruction", {}).get("parts", [])
+        system_prompt = "".join(p.get("text", "") for p in parts)
+    canonical = json.dumps(
+        {"system": system_prompt, "contents": body["contents"]},
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Recording:
+    data: bytes
+    # (seconds after the request was sent, chunk length) per chunk received.
+    timings: list[tuple[float, int]]
+    content_type: str = "text/event-stream"
+
+
+class Cassette:
+    """Recorded streams on disk: `streams.bin` plus `index.sqlite`."""
+
+    def __init__(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        import sqlite3  # only needed once a cassette is opened
+
+        self._db = sqlite3.connect(os.path.join(path, "index.sqlite"))
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            "key TEXT PRIMARY KEY, offset INTEGER NOT NULL, "
+            "length INTEGER NOT NULL, content_type TEXT NOT NULL, "
+            "timings TEXT NOT NULL)"
+        )
+        self._data = open(os.path.join(path, "streams.bin"), "a+b")
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM turns").fetchone()[0]
+
+    def get(self, key: str) -> Recording | None:
+        row = self._db.execute(
+            "SELECT offset, length, content_type, timings FROM turns WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        offset, length, content_type, timings = row
+        self._data.seek(offset)
+        data = self._data.read(length)
+        return Recording(data, [tuple(t) for t in json.loads(timings)], content_type)
+
+    def __contains__(self, key: str) -> bool:
+        row = self._db.execute("SELECT 1 FROM turns WHERE key = ?", (key,))
+        return row.fetchone() is not None
+
+    def put(self, key: str, recording: Recording) -> None:
+        """Store `recording` unless `key` already has one: the first reply
+        to a request wins, so replays follow one consistent conversation."""
+        if key in self:
+            return
+        # Data first: a crash in between leaves unreferenced bytes, never a
+        # dangling index entry.
+        self._data.seek(0, os.SEEK_END)
+        offset = self._data.tell()
+        self._data.write(recording.data)
+        self._data.flush()
+        with self._db:
+            self._db.execute(
+                "INSERT INTO turns VALUES (?, ?, ?, ?, ?)",
+                (
+                    key,
+                    offset,
+                    len(recording.data),
+                    recording.content_type,
+                    json.dumps(recording.timings),
+                ),
+            )
+
+    def close(self) -> None:
+        self._db.close()
+        self._data.close()
+
+
+class _TeeStream(httpx.AsyncByteStream):
+    """Passes an upstream body through while keeping a copy and its timing."""
+
+    def __init__(self, upstream: httpx.Response, started: float):
+        self.upstream = upstream
+        self.started = started
+        self.chunks: list[bytes] = []
+        self.timings: list[tuple[float, int]] = []
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self.upstream.aiter_bytes():
+            self.timings.append((round(time.monotonic() - self.started, 4), len(chunk)))
+            self.chunks.append(chunk)
+            yield chunk
+
+    async def aclose(self) -> None:
+        await self.upstream.aclose()
+
+
+class _ReplayStream(httpx.AsyncByteStream):
+    """Yields a recording's chunks, `speed` times faster than recorded
+    (0 for no delays at all)."""
+
+    def __init__(self, recording: Recording, speed: float):
+        self.recording = recording
+        self.speed = speed
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        start = time.monotonic()
+        pos = 0
+        for at, size in self.recording.timings:
+            if self.speed:
+                delay = start + at / self.speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield self.recording.data[pos : pos + size]
+            pos += size
+
+
+def _not_recorded(request: httpx.Request, what: str) -> httpx.Response:
+    message = f"{what} is not in the cassette (replay mode)"
+    return httpx.Response(
+        404, json={"error": {"code": 404, "message": message}}, request=request
+    )
+
+
+class CassetteTransport:
+    """`AsyncGeminiTransport` stand-in that records to or replays from a
+    `Cassette`. A replay miss comes back as a 404, which the engine reports
+    as an `APIError`; other non-streaming calls (`cachedContents`, model
+    summaries) get a 404 too, so features relying on them fall back."""
+
+    def __init__(
+        self,
+        transport: AsyncGeminiTransport,
+        cassette: Cassette,
+        mode: str = "replay",
+        speed: float = 1.0,
+    ):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"mode must be 'record' or 'replay', not {mode!r}")
+        self.transport = transport
+        self.cassette = cassette
+        self.mode = mode
+        self.speed = speed
+        self._prompts: dict[str, str] = {}  # cachedContents name -> prompt
+        self._inflight: dict[str, asyncio.Event] = {}
+
+    @property
+    def url(self) -> str:
+        return self.transport.url
+
+    @property
+    def api_root(self) -> str:
+        return self.transport.api_root
+
+    @property
+    def model(self) -> str:
+        return self.transport.model
+
+    async def __aenter__(self) -> "CassetteTransport":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+        self.cassette.close()
+
+    async def warm(self) -> None:
+        if self.mode == "record":
+            await self.transport.warm()
+
+    async def call(
+        self, method: str, path: str, body: dict | None = None, **params: str
+    ) -> httpx.Response:
+        if self.mode == "replay":
+            request = httpx.Request(method, f"{self.api_root}/{path}")
+            return _not_recorded(request, f"{method} {path}")
+        resp = await self.transport.call(method, path, body, **params)
+        if method == "POST" and path == "cachedContents" and resp.status_code == 200:
+            parts = body["systemInstruction"]["parts"]
+            self._prompts[resp.json()["name"]] = "".join(p["text"] for p in parts)
+        return resp
+
+    def key(self, body: dict | bytes) -> str:
+        if isinstance(body, bytes):
+            body = json.loads(body)
+        cached = body.get("cachedContent")
+        return request_key(body, self._prompts.get(cached) if cached else None)
+
+    def _replay(self, key: str) -> httpx.Response | None:
+        recording = self.cassette.get(key)
+        if recording is None:
+            return None
+        return httpx.Response(
+            200,
+            headers={"content-type": recording.content_type},
+            stream=_ReplayStream(recording, self.speed),
+            request=httpx.Request("POST", self.url),
+        )
+
+    @asynccontextmanager
+    async def stream(
+        self, body: dict | bytes, trace=None
+    ) -> AsyncIterator[httpx.Response]:
+        """Replay: the recorded reply, or a 404. Record: the recorded reply if
+        there is one, else the live one (recorded on the way through)."""
+        key = self.key(body)
+        if self.mode == "record":
+            # Identical requests in flight (e.g. every job's opening turn)
+            # wait for the first, so the recording forms one conversation
+            # tree and replays take the same path as any recorded run.
+            while key in self._inflight:
+                await self._inflight[key].wait()
+        resp = self._replay(key)
+        if resp is not None or self.mode == "replay":
+            yield resp or _not_recorded(
+                httpx.Request("POST", self.url), f"Request {key[:12]}"
+            )
+            return
+
+        self._inflight[key] = asyncio.Event()
+        try:
+            started = time.monotonic()
+            async with self.transport.stream(body, trace) as upstream:
+                if upstream.status_code != 200:
+                    yield upstream
+                    return
+                content_type = upstream.headers.get("content-type", "text/event-stream")
+                tee = _TeeStream(upstream, started)
+                yield httpx.Response(
+                    200,
+                    headers={"content-type": content_type},
+                    stream=tee,
+                    request=upstream.request,
+                )
+                # Only reached if the turn was read without error. A turn the
+                # parser stopped early is recorded as far as it was read,
+                # which is all a replay of the same request will read too.
+                if tee.chunks:
+                    recording = Recording(
+                        b"".join(tee.chunks), tee.timings, content_type
+                    )
+                    self.cassette.put(key, recording)
+        finally:
+            self._inflight.pop(key).set()
+
+
+def recorded(
+    transport: AsyncGeminiTransport,
+    record: str | None = None,
+    replay: str | None = None,
+    speed: float = 1.0,
+) -> AsyncGeminiTransport | CassetteTransport:
+    """Wrap `transport` to record into or replay from a cassette directory;
+    returned as is when neither is given."""
+    if record and replay:
+        raise ValueError("Record or replay, not both")
+    if replay:
+        return CassetteTransport(transport, Cassette(replay), "replay", speed)
+    if record:
+        return CassetteTransport(transport, Cassette(record), "record")
+    return transport
@@ -0,0 +1,229 @@
+"""Versioned binary codec for `GameState` snapshots.
+
+The state is flattened, following the model type hints, into integer,
+float and string streams, each packed in a single call:
+
+    header  magic "FMGS", format version, schema hash, stream sizes
+    tags    list lengths, None flags, bools and enum ordinals (usually 1 byte)
+    ints    the integer fields, at the narrowest width that fits all of them
+    lens    string lengths, in characters
+    floats  float fields, as doubles
+    text    every string, concatenated as one UTF-8 blob
+
+Enums are stored by their position in the class, so reordering members (or
+adding, removing or renaming fields) changes the schema hash and old
+snapshots are refused instead of decoded wrongly. Both mutable and frozen
+states encode; `decode(..., frozen=True)` returns an interned frozen one.
+"""
+
+import struct
+import sys
+import zlib
+from array import array
+from dataclasses import fields, is_dataclass
+from enum import Enum
+from itertools import accumulate, pairwise
+from types import NoneType, UnionType
+from typing import Union, get_args, get_origin, get_type_hints
+
+from models import GameState, freeze
+
+MAGIC = b"FMGS"
+VERSION = 1
+HEADER = struct.Struct("<4sBI" + "cI" * 3 + "II")
+_WIDTHS = {"b": 1 << 7, "h": 1 << 15, "i": 1 << 31, "q": 1 << 63}
+
+
+class CodecError(ValueError):
+    """Data that isn't a snapshot this version of the models can read."""
+
+
+class SchemaMismatch(CodecError):
+    """A sound snapshot, from a build with another format or other models."""
+
+
+def _compile(tp, seen: list[str]):
+    """(encode(value, out), decode(src)) for type `tp`, where `out` holds the
+    streams' append methods and `src` their iterators' __next__ methods."""
+    origin = get_origin(tp)
+    if origin in (Union, UnionType):
+        (inner,) = [t for t in get_args(tp) if t is not NoneType]
+        enc, dec = _compile(inner, seen)
+
+        def encode(v, out):
+            if v is None:
+                out[0](0)
+            else:
+                out[0](1)
+                enc(v, out)
+
+        def decode(src):
+            return dec(src) if src[0]() else None
+
+    elif origin in (list, tuple):
+        enc, dec = _compile(get_args(tp)[0], seen)
+
+        def encode(v, out):
+            out[0](len(v))
+            for item in v:
+                enc(item, out)
+
+        def decode(src):
+            return [dec(src) for _ in range(src[0]())]
+
+    elif is_dataclass(tp):
+        hints = get_type_hints(tp)
+        names = [f.name for f in fields(tp)]
+        seen.append(f"{tp.__name__}({','.join(names)})")
+        parts = [(name, *_compile(hints[name], seen)) for name in names]
+        encoders = [(name, enc) for name, enc, _ in parts]
+        decoders = [dec for _, _, dec in parts]
+
+        def encode(v, out):
+            for name, enc in encoders:
+                enc(getattr(v, name), out)
+
+        def decode(src):
+            return tp(*[dec(src) for dec in decoders])
+
+    elif issubclass(tp, Enum):
+        members = list(tp)
+        index = {m: i for i, m in enumerate(members)}
+        seen.append(f"{tp.__name__}{[m.value for m in members]}")
+
+        def encode(v, out):
+            out[0](index[v])
+
+        def decode(src):
+            return members[src[0]()]
+
+    elif tp is bool:
+
+        def encode(v, out):
+            out[0](v)
+
+        def decode(src):
+            return bool(src[0]())
+
+    elif tp is int:
+
+        def encode(v, out):
+            out[1](v)
+
+        def decode(src):
+            return src[1]()
+
+    elif tp is float:
+
+        def encode(v, out):
+            out[3](v)
+
+        def decode(src):
+            return src[3]()
+
+    elif tp is str:
+
+        def encode(v, out):
+            out[2](v)
+
+        def decode(src):
+            return src[2]()
+
+    else:
+        raise TypeError(f"Can't encode {tp!r}")
+    return encode, decode
+
+
+_schema: list[str] = []
+_encode, _decode = _compile(GameState, _schema)
+SCHEMA = zlib.crc32("\n".join(_schema).encode())
+
+
+def _pack(values: list[int]) -> tuple[bytes, bytes]:
+    lo, hi = min(values, default=0), max(values, default=0)
+    for code, limit in _WIDTHS.items():
+        if -limit <= lo and hi < limit:
+            packed = array(code, values)
+            if sys.byteorder == "big":
+                packed.byteswap()
+            return code.encode(), packed.tobytes()
+    raise CodecError(f"Integers out of 64-bit range ({lo}..{hi})")
+
+
+def _unpack(code: bytes, count: int, data: memoryview, offset: int) -> array:
+    values = array(code.decode())
+    end = offset + count * values.itemsize
+    values.frombytes(data[offset:end])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def encode(state: GameState) -> bytes:
+    tags: list[int] = []
+    ints: list[int] = []
+    strings: list[str] = []
+    floats: list[float] = []
+    _encode(state, (tags.append, ints.append, strings.append, floats.append))
+
+    text = "".join(strings).encode("utf-8")
+    streams = [_pack(tags), _pack(ints), _pack([len(s) for s in strings])]
+    counts = (len(tags), len(ints), len(strings))
+    header = HEADER.pack(
+        MAGIC,
+        VERSION,
+        SCHEMA,
+        *(x for (code, _), n in zip(streams, counts) for x in (code, n)),
+        len(floats),
+        len(text),
+    )
+    doubles = array("d", floats)
+    if sys.byteorder == "big":
+        doubles.byteswap()
+    return b"".join([header, *(data for _, data in streams), doubles.tobytes(), text])
+
+
+def decode(data: bytes, frozen: bool = False) -> GameState:
+    if len(data) < HEADER.size:
+        raise CodecError("Truncated snapshot")
+    magic, version, schema, *sizes = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise CodecError("Not a GameState snapshot")
+    if version != VERSION or schema != SCHEMA:
+        raise SchemaMismatch(
+            f"Snapshot format {version}/{schema:08x} doesn't match "
+            f"this build ({VERSION}/{SCHEMA:08x})"
+        )
+    tag_code, n_tags, int_code, n_ints, len_code, n_lens, n_floats, n_text = sizes
+
+    view = memoryview(data)
+    offset = HEADER.size
+    streams = []
+    try:
+        for code, count in (
+            (tag_code, n_tags),
+            (int_code, n_ints),
+            (len_code, n_lens),
+            (b"d", n_floats),
+        ):
+            streams.append(_unpack(code, count, view, offset))
+            offset += count * streams[-1].itemsize
+        if offset + n_text != len(data):
+            raise CodecError("Corrupt snapshot: stream sizes don't add up")
+        text = bytes(view[offset:]).decode("utf-8")
+
+        tags, ints, lens, floats = streams
+        strings = [text[a:b] for a, b in pairwise(accumulate(lens, initial=0))]
+        state = _decode(
+            (
+                iter(tags).__next__,
+                iter(ints).__next__,
+                iter(strings).__next__,
+                iter(floats).__next__,
+            )
+        )
+    except (StopIteration, IndexError, ValueError) as e:
+        if isinstance(e, CodecError):
+            raise
+        raise CodecError(f"Corrupt snapshot: {str(e) or 'streams end early'}") from None
+    return freeze(state) if frozen else state
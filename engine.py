@@ -0,0 +1,412 @@
+"""Async press-conference engine.
+
+Everything here is frontend-agnostic: the conversation state lives in
+`Conference`, manager answers come from any `AnswerSource`, and streamed
+journalist text is handed to an optional `on_text` callback.
+"""
+
+import asyncio
+import time
+from collections.abc import Callable, Iterable
+from typing import Protocol
+
+import httpx
+
+from history import HistoryWindow
+from sse import END_MARKER, QuestionStream
+from tracing import NULL_TRACER, Tracer
+from transport import AsyncGeminiTransport, encode_json
+
+OPENING_MESSAGE = "Begin the press conference."
+# Times a turn whose connection drops mid-stream is continued from where it
+# stopped before giving up.
+MAX_RESUMES = 3
+
+
+class APIError(Exception):
+    """Gemini answered with a non-200 status."""
+
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"API error {status_code}: {body}")
+        self.status_code = status_code
+        self.body = body
+
+
+class CachedContext:
+    """Server-side copy of a conference's system prompt (Gemini `cachedContents`).
+
+    Created on first use, its TTL is extended whenever less than half of it is
+    left. If the cache can't be created (e.g. the prompt is below the API's
+    minimum size) it disables itself and requests carry the prompt inline;
+    if the cache API can't be reached, that turn's request does.
+    """
+
+    def __init__(self, ttl: int = 600):
+        self.ttl = ttl
+        self.name: str | None = None
+        self.disabled = False
+        self._expires = 0.0
+
+    async def ensure(
+        self, transport: AsyncGeminiTransport, system_prompt: str
+    ) -> str | None:
+        """Name of a live cache holding `system_prompt`, or None to go inline."""
+        if self.disabled:
+            return None
+        now = time.monotonic()
+        if self.name and now < self._expires - self.ttl / 2:
+            return self.name
+
+        # A network error goes inline for this turn and tries again on the
+        # next; only the API saying no disables the cache.
+        if self.name:
+            try:
+                resp = await transport.call(
+                    "PATCH", self.name, {"ttl": f"{self.ttl}s"}, updateMask="ttl"
+                )
+            except httpx.HTTPError:
+                return None
+            if resp.status_code == 200:
+                self._expires = now + self.ttl
+                return self.name
+            self.name = None  # expired or evicted — make a new one
+
+        try:
+            resp = await transport.call(
+                "POST",
+                "cachedContents",
+                {
+                    "model": transport.model,
+                    "systemInstruction": {"parts": [{"text": system_prompt}]},
+                    "ttl": f"{self.ttl}s",
+                },
+            )
+        except httpx.HTTPError:
+            return None
+        if resp.status_code != 200:
+            self.disabled = True
+            return None
+        self.name = resp.json()["name"]
+        self._expires = now + self.ttl
+        return self.name
+
+    def invalidate(self) -> None:
+        self.name = None
+
+    async def release(self, transport: AsyncGeminiTransport) -> None:
+        """Delete the cache now rather than paying for it until the TTL runs out."""
+        if self.name:
+            name, self.name = self.name, None
+            try:
+                await transport.call("DELETE", name)
+            except httpx.HTTPError:
+                pass
+
+
+class RequestEncoder:
+    """Encodes a conference's requests, keeping the bytes of the system
+    instruction and of each history entry between turns.
+
+    Each turn only the new entries (and a partial turn, or a history
+    summary) are serialised; the rest is joined from earlier bytes. Entries
+    are recognised by identity, so history may be appended to but never
+    edited in place. The result is exactly `encode_json` of the same body.
+    """
+
+    def __init__(self):
+        self._prompt: str | None = None
+        self._instruction = b""
+        self._entries: dict[int, tuple[dict, bytes]] = {}  # id -> (entry, bytes)
+
+    def encode(
+        self,
+        contents: list[dict],
+        system_prompt: str,
+        cached_content: str | None = None,
+    ) -> bytes:
+        if cached_content:
+            head = b'{"cachedContent":' + encode_json(cached_content)
+        else:
+            if system_prompt != self._prompt:
+                instruction = {"parts": [{"text": system_prompt}]}
+                self._prompt, self._instruction = (
+                    system_prompt,
+                    encode_json(instruction),
+                )
+            head = b'{"system_instruction":' + self._instruction
+
+        # Entries held here can't be freed, so their ids can't be reused.
+        # Only those sent this time are kept: older ones left the window.
+        cached = self._entries
+        entries = {}
+        encoded = []
+        for entry in contents:
+            key = id(entry)
+            hit = entries[key] = cached.get(key) or (entry, encode_json(entry))
+            encoded.append(hit[1])
+        self._entries = entries
+        return b"".join((head, b',"contents":[', b",".join(encoded), b"]}"))
+
+
+class TurnLog(Protocol):
+    """Where a conference's turns are recorded as they happen (transcripts.py)."""
+
+    def append(self, role: str, text: str) -> None: ...
+
+    def end(self, abandoned: bool = False) -> None: ...
+
+
+class Conference:
+    """Conversation state for one press conference, free of any I/O.
+
+    A `log`, if given, is told about each turn added and about the end; the
+    `contents` passed in are taken as already logged.
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        contents: list[dict] | None = None,
+        cache: CachedContext | None = None,
+        history: HistoryWindow | None = None,
+        tracer: Tracer = NULL_TRACER,
+        log: TurnLog | None = None,
+        encoder: RequestEncoder | None = None,
+    ):
+        self.system_prompt = system_prompt
+        self.contents = contents or [
+            {"role": "user", "parts": [{"text": OPENING_MESSAGE}]}
+        ]
+        self.cache = cache
+        self.history = history
+        self.tracer = tracer
+        self.log = log
+        self.encoder = encoder or RequestEncoder()
+        self.finished = False
+        self.abandoned = False
+
+    def request_body(
+        self, cached_content: str | None = None, partial: str = ""
+    ) -> dict:
+        """The next request; `partial` is a question cut off mid-stream, sent
+        as an unfinished model turn for the model to continue."""
+        contents = self._outgoing(partial)
+        if cached_content:
+            return {"cachedContent": cached_content, "contents": contents}
+        return {
+            "system_instruction": {"parts": [{"text": self.system_prompt}]},
+            "contents": contents,
+        }
+
+    def encode_request(
+        self, cached_content: str | None = None, partial: str = ""
+    ) -> bytes:
+        """`request_body`, serialised (through `encoder`)."""
+        return self.encoder.encode(
+            self._outgoing(partial), self.system_prompt, cached_content
+        )
+
+    def _outgoing(self, partial: str) -> list[dict]:
+        contents = self.contents
+        if self.history:
+            contents = self.history.contents(contents)
+        if partial:
+            contents = [*contents, {"role": "model", "parts": [{"text": partial}]}]
+        return contents
+
+    def add_question(self, text: str) -> None:
+        self.contents.append({"role": "model", "parts": [{"text": text}]})
+        if self.log:
+            self.log.append("model", text)
+        if END_MARKER in text:
+            self.finished = True
+            if self.log:
+                self.log.end()
+
+    def add_answer(self, text: str) -> None:
+        self.contents.append({"role": "user", "parts": [{"text": text}]})
+        if self.log:
+            self.log.append("user", text)
+
+    def abandon(self) -> None:
+        self.abandoned = True
+        self.finished = True
+        if self.log:
+            self.log.end(abandoned=True)
+
+    @property
+    def questions(self) -> list[str]:
+        return [c["parts"][0]["text"] for c in self.contents if c["role"] == "model"]
+
+
+class AnswerSource(Protocol):
+    """Where manager answers come from: a terminal, a websocket, a script..."""
+
+    async def next_answer(self, question: str) -> str | None:
+        """Return the manager's reply to `question`, or None to leave early."""
+        ...
+
+
+class ScriptedAnswers:
+    """Replays a fixed list of answers, then walks out."""
+
+    def __init__(self, answers: Iterable[str]):
+        self._answers = iter(answers)
+
+    async def next_answer(self, question: str) -> str | None:
+        return next(self._answers, None)
+
+
+class QueueAnswers:
+    """Answers pushed in from elsewhere (e.g. a network handler) via `put`."""
+
+    def __init__(self):
+        self._queue: asyncio.Queue[str | None] = asyncio.Queue()
+
+    def put(self, answer: str | None) -> None:
+        self._queue.put_nowait(answer)
+
+    async def next_answer(self, question: str) -> str | None:
+        return await self._queue.get()
+
+
+async def stream_question(
+    transport: AsyncGeminiTransport,
+    conference: Conference,
+    on_text: Callable[[str], None] | None = None,
+) -> str:
+    """Stream the next journalist question. Returns the full text.
+
+    If the connection drops mid-question, the text so far is sent back as a
+    partial model turn and the model continues it, rather than the question
+    being paid for and generated twice.
+    """
+    tracer = conference.tracer
+    started = tracer.now() if tracer.enabled else 0
+    with tracer.span("turn", turn=len(conference.questions) + 1) as turn:
+        parser = QuestionStream()
+        attempt = resumes = 0
+        while True:
+            cached = None
+            if conference.cache:
+                cached = await conference.cache.ensure(
+                    transport, conference.system_prompt
+                )
+
+            with tracer.span("serialise") as args:
+                body = conference.encode_request(cached, parser.received)
+                args["bytes"] = len(body)
+
+            hook = tracer.http_hook if tracer.enabled else None
+            streaming = False
+            try:
+                async with transport.stream(body, trace=hook) as resp:
+                    tracer.instant("first_byte", status=resp.status_code)
+                    if resp.status_code != 200:
+                        await resp.aread()
+                        if cached and resp.status_code in (400, 403, 404):
+                            # The cache expired or was evicted under us:
+                            # rebuild it once, then carry the prompt inline
+                            # for the rest of the conference.
+                            if attempt == 0:
+                                conference.cache.invalidate()
+                            else:
+                                conference.cache.disabled = True
+                            attempt += 1
+                            continue
+                        raise APIError(resp.status_code, resp.text)
+
+                    # Stops at the end of the question, cancelling the rest
+                    # upstream.
+                    streaming = True
+                    deltas = parser.aiter_deltas(resp.aiter_lines())
+                    await _relay(deltas, on_text, tracer, started, resumed=resumes > 0)
+            except httpx.TransportError as e:
+                if not streaming or resumes == MAX_RESUMES:
+                    raise
+                resumes += 1
+                tracer.instant(
+                    "resume", error=type(e).__name__, chars=len(parser.received)
+                )
+                parser.resume()
+                continue
+            break
+
+        tracer.instant("end_of_stream", early_stop=parser.stopped)
+        tracer.record_usage(parser.usage)
+        if tracer.enabled:
+            turn.update(chars=len(parser.text), usage=parser.usage, resumes=resumes)
+        return parser.text
+
+
+async def _relay(
+    deltas, on_text, tracer: Tracer, started: int, resumed: bool = False
+) -> None:
+    """Hand streamed text to `on_text`, timing each stage when tracing.
+
+    A `resumed` stream continues a dropped one, so its first token is not the
+    turn's.
+    """
+    if not tracer.enabled:
+        async for text in deltas:
+            if on_text:
+                on_text(text)
+        return
+
+    waiting = tracer.now()
+    first = None
+    async for text in deltas:
+        now = tracer.now()
+        if first is None:
+            first = now
+            tracer.complete("wait_first_token", waiting, now)
+            if not resumed:
+                tracer.complete("ttft", started, now)
+                tracer.instant("first_token")
+        tracer.instant("chunk", chars=len(text))
+        if on_text:
+            with tracer.span("render"):
+                on_text(text)
+    if first is not None:
+        tracer.complete("stream", first, tracer.now())
+
+
+async def run_conference(
+    transport: AsyncGeminiTransport,
+    conference: Conference,
+    answers: AnswerSource,
+    on_text: Callable[[str], None] | None = None,
+) -> Conference:
+    """Alternate journalist questions and manager answers until the
+    conference ends or the manager walks out.
+
+    A conference resumed while a question was awaiting its answer carries on
+    from that answer.
+    """
+    question = None
+    if conference.contents[-1]["role"] == "model":
+        question = conference.questions[-1]
+    try:
+        while not conference.finished:
+            if question is None:
+                question = await stream_question(transport, conference, on_text)
+                conference.add_question(question)
+                if conference.finished:
+                    break
+
+            if conference.history:
+                # Summarise older exchanges while the manager is answering.
+                conference.history.prefetch(conference.contents)
+            answer = await answers.next_answer(question)
+            if answer is None:
+                conference.abandon()
+                break
+            conference.add_answer(answer)
+            question = None
+    finally:
+        if conference.history:
+            conference.history.cancel()
+        if conference.cache:
+            await conference.cache.release(transport)
+
+    return conference
@@ -0,0 +1,274 @@
+"""Hedged requests: race a slow first token against an alternate endpoint.
+
+When the first token of a question is late, the player just stares at the
+panel. `HedgedTransport` sends each request to its primary transport and,
+if no body has arrived within the hedge delay, the same request to an
+alternate one (another model, region or provider endpoint). The first
+stream to produce a byte is used and the other is closed, which cancels its
+generation upstream.
+
+The delay is the `percentile` of recent first-byte times from the primary,
+so only its tail is hedged. A budget caps the extra requests: each request
+earns `budget` of a hedge, up to `burst`, and each hedge spends one, so
+hedges stay near `budget` of traffic even when the primary is slow across
+the board. Opt in with GEMINI_HEDGE_MODEL and/or GEMINI_HEDGE_BASE_URL
+(GEMINI_HEDGE_API_KEY, GEMINI_HEDGE_BUDGET; see `from_env`).
+
+Requests that use a context cache are never hedged: the cache belongs to
+the primary's model. Only the primary request is traced, since the tracer
+times one HTTP exchange at a time.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator
+
+import httpx
+
+from transport import GEMINI_BASE_URL, GEMINI_MODEL, AsyncGeminiTransport, gemini_url
+
+
+class HedgePolicy:
+    """When to hedge, how often we may, and how it has gone."""
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        budget: float = 0.05,
+        burst: float = 2.0,
+        initial_delay: float = 1.0,
+        min_delay: float = 0.05,
+        window: int = 200,
+        min_samples: int = 20,
+    ):
+        self.percentile = percentile
+        self.budget = budget
+        self.burst = burst
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self._samples: deque[float] = deque(maxlen=window)
+        self._credit = 1.0
+        self.requests = self.hedged = self.hedge_wins = self.over_budget = 0
+
+    @classmethod
+    def from_env(cls) -> "HedgePolicy":
+        """With GEMINI_HEDGE_BUDGET=<fraction of requests> (default 0.05)."""
+        return cls(budget=float(os.environ.get("GEMINI_HEDGE_BUDGET", 0.05)))
+
+    def delay(self) -> float:
+        """Seconds to wait for the primary's first byte before hedging."""
+        if len(self._samples) < self.min_samples:
+            return self.initial_delay
+        ordered = sorted(self._samples)
+        k = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(self.min_delay, ordered[k])
+
+    def observe(self, first_byte: float) -> None:
+        """Record how long the primary took to its first byte (or, when it
+        lost the race, how long it had taken by then)."""
+        self._samples.append(first_byte)
+
+    def start(self) -> None:
+        self.requests += 1
+        self._credit = min(self.burst, self._credit + self.budget)
+
+    def allow(self) -> bool:
+        """Spend a hedge from the budget, if there is one."""
+        if self._credit < 1:
+            self.over_budget += 1
+            return False
+        self._credit -= 1
+        self.hedged += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "over_budget": self.over_budget,
+            "hedge_rate": self.hedged / self.requests if self.requests else 0.0,
+            "win_rate": self.hedge_wins / self.hedged if self.hedged else 0.0,
+            "delay_ms": round(self.delay() * 1000, 1),
+        }
+
+
+class _Prefixed(httpx.AsyncByteStream):
+    """An upstream body whose first chunk has already been read."""
+
+    def __init__(self, first: bytes, rest: AsyncIterator[bytes], upstream):
+        self.first = first
+        self.rest = rest
+        self.upstream = upstream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        if self.first:
+            yield self.first
+        async for chunk in self.rest:
+            yield chunk
+
+    async def aclose(self) -> None:
+        await self.upstream.aclose()
+
+
+async def _first_byte(transport, body, trace, stack: AsyncExitStack):
+    """Open a stream on `transport` and read up to its first body chunk.
+    Returns the response, ready to be read from the start, and whether it
+    is a usable (200) one."""
+    upstream = await stack.enter_async_context(transport.stream(body, trace))
+    if upstream.status_code != 200:
+        return upstream, False
+    chunks = upstream.aiter_raw()
+    first = await anext(chunks, b"")
+    stream = _Prefixed(first, chunks, upstream)
+    response = httpx.Response(
+        200, headers=upstream.headers, stream=stream, request=upstream.request
+    )
+    return response, True
+
+
+def _uses_cache(body: dict | bytes) -> bool:
+    if isinstance(body, bytes):
+        return body.startswith(b'{"cachedContent":')
+    return "cachedContent" in body
+
+
+class HedgedTransport:
+    """`AsyncGeminiTransport` stand-in whose streams are hedged to an
+    alternate transport; everything else goes to the primary."""
+
+    def __init__(
+        self,
+        primary: AsyncGeminiTransport,
+        alternate: AsyncGeminiTransport,
+        policy: HedgePolicy | None = None,
+    ):
+        self.primary = primary
+        self.alternate = alternate
+        self.policy = policy or HedgePolicy()
+
+    @property
+    def url(self) -> str:
+        return self.primary.url
+
+    @property
+    def api_root(self) -> str:
+        return self.primary.api_root
+
+    @property
+    def model(self) -> str:
+        return self.primary.model
+
+    async def __aenter__(self) -> "HedgedTransport":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self.primary.aclose()
+        await self.alternate.aclose()
+
+    async def warm(self) -> None:
+        await asyncio.gather(self.primary.warm(), self.alternate.warm())
+
+    async def call(
+        self, method: str, path: str, body: dict | None = None, **params: str
+    ) -> httpx.Response:
+        return await self.primary.call(method, path, body, **params)
+
+    @asynccontextmanager
+    async def stream(
+        self, body: dict | bytes, trace=None
+    ) -> AsyncIterator[httpx.Response]:
+        policy = self.policy
+        if _uses_cache(body):
+            async with self.primary.stream(body, trace) as resp:
+                yield resp
+            return
+
+        policy.start()
+        async with AsyncExitStack() as primary_stack, AsyncExitStack() as hedge_stack:
+            started = time.monotonic()
+            primary = asyncio.create_task(
+                _first_byte(self.primary, body, trace, primary_stack)
+            )
+            hedge = None
+            pending = {primary}
+            results = {}
+            failures = {}
+            try:
+                while pending and not any(ok for _, ok in results.values()):
+                    timeout = None
+                    if hedge is None:
+                        timeout = max(0.0, started + policy.delay() - time.monotonic())
+                    done, pending = await asyncio.wait(
+                        pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    if not done:  # the primary is late
+                        if policy.allow():
+                            hedge = asyncio.create_task(
+                                _first_byte(self.alternate, body, None, hedge_stack)
+                            )
+                            pending.add(hedge)
+                        else:
+                            hedge = False  # over budget: just wait
+                        continue
+                    for task in done:
+                        if task is primary:
+                            policy.observe(time.monotonic() - started)
+                        if task.exception() is None:
+                            results[task] = task.result()
+                        else:
+                            failures[task] = task.exception()
+                    if not pending and not results:  # every side failed
+                        raise failures.get(primary) or failures[hedge]
+            finally:
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    await asyncio.wait(pending)
+                for task in pending:
+                    if not task.cancelled():
+                        task.exception()  # lost the race by failing: fine
+                if primary in pending:
+                    policy.observe(time.monotonic() - started)
+
+            winner = next((t for t, (_, ok) in results.items() if ok), None)
+            if winner is None:  # nothing usable: report the primary's answer
+                winner = primary if primary in results else hedge
+            if winner is hedge:
+                policy.hedge_wins += results[hedge][1]
+                await primary_stack.aclose()
+            else:
+                await hedge_stack.aclose()
+            yield results[winner][0]
+
+
+def hedged(
+    transport: AsyncGeminiTransport,
+    alternate: AsyncGeminiTransport | None,
+    policy: HedgePolicy | None = None,
+) -> AsyncGeminiTransport | HedgedTransport:
+    """Hedge `transport` to `alternate`; returned as is without one."""
+    if alternate is None:
+        return transport
+    return HedgedTransport(transport, alternate, policy or HedgePolicy.from_env())
+
+
+def alternate_from_env(api_key: str) -> AsyncGeminiTransport | None:
+    """The hedge target: GEMINI_HEDGE_MODEL at GEMINI_HEDGE_BASE_URL (each
+    defaulting to the primary's), with GEMINI_HEDGE_API_KEY if it needs
+    another key. None if neither is set."""
+    model = os.environ.get("GEMINI_HEDGE_MODEL")
+    base_url = os.environ.get("GEMINI_HEDGE_BASE_URL")
+    if not model and not base_url:
+        return None
+    return AsyncGeminiTransport(
+        os.environ.get("GEMINI_HEDGE_API_KEY", api_key),
+        gemini_url(model or GEMINI_MODEL, base_url or GEMINI_BASE_URL),
+    )
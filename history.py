@@ -0,0 +1,211 @@
+"""Token-bounded request history with rolling summarisation.
+
+`Conference.contents` keeps the full transcript; `HistoryWindow` decides
+what is actually sent. Once the estimated size passes the budget, every
+exchange before the last `keep_turns` questions is replaced by a summary
+folded into the opening user message. Summaries are computed in a
+background task while the manager is typing, and a request never waits for
+one: if it isn't ready yet the older exchanges simply go verbatim.
+"""
+
+import asyncio
+import re
+from collections import Counter
+from typing import Protocol
+
+from transport import AsyncGeminiTransport
+
+# "**Name (Outlet):** question"
+QUESTION = re.compile(r"\*\*([^*\n]+?) \(([^)\n]*)\):\*\*\s*(.*)", re.DOTALL)
+
+# Phrases (and very short replies) that count as not answering the question.
+DODGE_PHRASES = (
+    "no comment",
+    "not going to",
+    "won't go into",
+    "not getting into",
+    "next question",
+    "can't comment",
+    "won't comment",
+    "not talk about",
+    "not discuss",
+)
+
+# Start summarising in the background once history reaches this share of
+# the budget, so the summary is ready by the time it's needed.
+PREFETCH_AT = 0.75
+
+
+def estimate_tokens(contents: list[dict]) -> int:
+    """Rough token count (~4 characters per token) of a contents list."""
+    return sum(len(p.get("text", "")) for c in contents for p in c["parts"]) // 4
+
+
+def parse_question(text: str) -> tuple[str, str, str]:
+    """Split a journalist turn into (name, outlet, question)."""
+    m = QUESTION.search(text)
+    if not m:
+        return "Unknown", "", text.strip()
+    return m.group(1).strip(), m.group(2).strip(), m.group(3).strip()
+
+
+def dodged(answer: str) -> bool:
+    lowered = answer.lower()
+    return len(answer.split()) < 6 or any(p in lowered for p in DODGE_PHRASES)
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[: limit - 1].rstrip() + "…"
+
+
+class Summariser(Protocol):
+    async def fold(self, exchanges: list[tuple[str, str]]) -> str:
+        """Add (question, answer) pairs to the running summary and return it."""
+        ...
+
+
+class ExtractiveSummariser:
+    """Cheap, deterministic summary: one clipped entry per exchange.
+
+    Keeps what the rules need: how many questions have been asked, who asked
+    them (for rotation) and which ones the manager dodged (to follow up).
+    Entries older than the latest `detailed` are clipped harder so the
+    summary stays small however long the conference runs.
+    """
+
+    def __init__(self, clip: int = 160, detailed: int = 6):
+        self.clip = clip
+        self.detailed = detailed
+        self._entries: list[tuple[str, str, str, bool]] = []
+        self._askers: Counter[str] = Counter()
+
+    async def fold(self, exchanges: list[tuple[str, str]]) -> str:
+        for question, answer in exchanges:
+            name, outlet, text = parse_question(question)
+            who = f"{name} ({outlet})" if outlet else name
+            self._askers[who] += 1
+            self._entries.append((who, text, answer, dodged(answer)))
+
+        lines = [
+            f"[Summary of the first {len(self._entries)} questions of this "
+            "conference. The exchanges after it follow in full.]"
+        ]
+        oldest_detailed = len(self._entries) - self.detailed
+        for i, (who, text, answer, was_dodged) in enumerate(self._entries):
+            clip = self.clip if i >= oldest_detailed else self.clip // 3
+            lines.append(f"{i + 1}. {who} asked: {_clip(text, clip)}")
+            lines.append(f"   Manager: {_clip(answer, clip)}")
+            if was_dodged:
+                lines.append("   [dodged — worth following up]")
+        askers = ", ".join(f"{who} ×{n}" for who, n in self._askers.items())
+        lines.append(f"Asked so far: {askers}")
+        return "\n".join(lines)
+
+
+class ModelSummariser:
+    """Has the model itself condense the history, rolling the previous
+    summary into each new one. Falls back to keeping the old summary (and
+    retrying on the next turn) if the call fails."""
+
+    INSTRUCTIONS = (
+        "You keep notes for a panel of football journalists during a press "
+        "conference. Update the notes with the new exchanges below. Keep, "
+        "tersely: how many questions have been asked in total, who asked each "
+        "one (name and outlet), what the manager actually said, every question "
+        "the manager dodged (so it can be followed up) and anything provocative. "
+        "Reply with the updated notes only."
+    )
+
+    def __init__(self, transport: AsyncGeminiTransport):
+        self.transport = transport
+        self.summary = ""
+        self._asked = 0
+
+    async def fold(self, exchanges: list[tuple[str, str]]) -> str:
+        new = "\n\n".join(f"{q}\nManager: {a}" for q, a in exchanges)
+        prompt = (
+            f"{self.INSTRUCTIONS}\n\nCurrent notes:\n{self.summary or '(none)'}"
+            f"\n\nNew exchanges:\n{new}"
+        )
+        resp = await self.transport.call(
+            "POST",
+            f"{self.transport.model}:generateContent",
+            {"contents": [{"role": "user", "parts": [{"text": prompt}]}]},
+        )
+        resp.raise_for_status()
+        parts = resp.json()["candidates"][0]["content"]["parts"]
+        self.summary = "".join(p.get("text", "") for p in parts).strip()
+        self._asked += len(exchanges)
+        return (
+            f"[Notes on the first {self._asked} questions of this conference. "
+            f"The exchanges after them follow in full.]\n{self.summary}"
+        )
+
+
+class HistoryWindow:
+    """Chooses the `contents` actually sent for a conference."""
+
+    def __init__(
+        self,
+        token_budget: int = 3000,
+        keep_turns: int = 3,
+        summariser: Summariser | None = None,
+    ):
+        self.token_budget = token_budget
+        self.keep_turns = max(1, keep_turns)
+        self.summariser = summariser or ExtractiveSummariser()
+        self.summary: str | None = None
+        # contents[1:covered] are folded into `summary`; always odd, so
+        # contents[covered] is a model turn and roles keep alternating.
+        self.covered = 1
+        # The summary message, kept while `summary` is (see RequestEncoder).
+        self._first: tuple[str, dict] | None = None
+        self._task: asyncio.Task | None = None
+
+    def _fold_end(self, contents: list[dict]) -> int:
+        questions = range(1, len(contents), 2)
+        if len(questions) <= self.keep_turns:
+            return 1
+        return questions[-self.keep_turns]
+
+    def prefetch(self, contents: list[dict]) -> None:
+        """Start folding older exchanges in the background, if worthwhile.
+
+        Call while waiting on the manager; `contents` must only grow.
+        """
+        if self._task and not self._task.done():
+            return
+        if estimate_tokens(contents) < self.token_budget * PREFETCH_AT:
+            return
+        end = self._fold_end(contents)
+        if end <= self.covered:
+            return
+
+        entries = contents[self.covered : end]
+        exchanges = [
+            (entries[i]["parts"][0]["text"], entries[i + 1]["parts"][0]["text"])
+            for i in range(0, len(entries) - 1, 2)
+        ]
+        self._task = asyncio.create_task(self._fold(exchanges, end))
+
+    async def _fold(self, exchanges: list[tuple[str, str]], end: int) -> None:
+        try:
+            self.summary = await self.summariser.fold(exchanges)
+        except Exception:
+            return  # keep the previous summary; prefetch retries next turn
+        self.covered = end
+
+    def contents(self, contents: list[dict]) -> list[dict]:
+        """The history to send: verbatim if it fits, else summary + recent."""
+        if self.summary is None or estimate_tokens(contents) <= self.token_budget:
+            return contents
+        if self._first is None or self._first[0] is not self.summary:
+            opening = contents[0]["parts"][0]["text"]
+            text = f"{opening}\n\n{self.summary}"
+            self._first = (self.summary, {"role": "user", "parts": [{"text": text}]})
+        return [self._first[1], *contents[self.covered :]]
+
+    def cancel(self) -> None:
+        if self._task:
+            self._task.cancel()
@@ -0,0 +1,153 @@
+"""Minimal asyncio HTTP/1.1 server, just enough for local SSE endpoints.
+
+Supports keep-alive, Content-Length request bodies and chunked streaming
+responses. Not meant to face the internet.
+"""
+
+import asyncio
+import json
+import socket
+from collections.abc import Awaitable, Callable
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+
+MAX_HEADER_BYTES = 64 * 1024
+
+
+class Request:
+    def __init__(self, method: str, target: str, headers: dict[str, str], body: bytes):
+        url = urlsplit(target)
+        self.method = method
+        self.path = url.path
+        self.query = dict(parse_qsl(url.query))
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body) if self.body else None
+
+
+class Response:
+    """Writes one response; either `send` a whole body or `start` a stream."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self._writer = writer
+        self._chunked = False
+        self.started = False
+        self.aborted = False
+
+    def _head(self, status: int, headers: dict[str, str]) -> bytes:
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def send(
+        self,
+        status: int,
+        body: bytes = b"",
+        content_type: str = "application/json",
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        head = {"Content-Type": content_type, "Content-Length": str(len(body))}
+        head.update(headers or {})
+        self.started = True
+        self._writer.write(self._head(status, head) + body)
+        await self._writer.drain()
+
+    async def send_json(
+        self, status: int, obj, headers: dict[str, str] | None = None
+    ) -> None:
+        await self.send(status, json.dumps(obj).encode(), headers=headers)
+
+    async def start(
+        self,
+        status: int = 200,
+        content_type: str = "text/event-stream",
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        head = {"Content-Type": content_type, "Transfer-Encoding": "chunked"}
+        head.update(headers or {})
+        self.started = True
+        self._chunked = True
+        self._writer.write(self._head(status, head))
+        await self._writer.drain()
+
+    async def write(self, data: bytes) -> None:
+        if data:
+            self._writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+            await self._writer.drain()
+
+    async def end(self) -> None:
+        if self._chunked:
+            self._writer.write(b"0\r\n\r\n")
+            await self._writer.drain()
+
+    def abort(self) -> None:
+        """Drop the connection mid-response, as a flaky network would."""
+        self.aborted = True
+        self._writer.transport.abort()
+
+
+Handler = Callable[[Request, Response], Awaitable[None]]
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Request | None:
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        return None
+
+    request_line, *header_lines = head.decode("latin-1").split("\r\n")
+    method, target, _ = request_line.split(" ", 2)
+    headers = {}
+    for line in header_lines:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length", 0))
+    body = await reader.readexactly(length) if length else b""
+    return Request(method, target, headers, body)
+
+
+async def serve(
+    handler: Handler,
+    host: str = "127.0.0.1",
+    port: int = 0,
+    sock: socket.socket | None = None,
+):
+    """Start serving `handler`, on `sock` if given (e.g. one listening
+    socket shared by forked workers). Returns the `asyncio.Server`."""
+
+    async def on_connection(reader, writer):
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                response = Response(writer)
+                try:
+                    await handler(request, response)
+                except ConnectionError:
+                    break
+                except Exception as e:
+                    if response.started:
+                        break
+                    await response.send_json(
+                        500, {"error": {"code": 500, "message": str(e)}}
+                    )
+                if response.aborted or request.headers.get("connection") == "close":
+                    break
+        finally:
+            writer.close()
+
+    if sock is not None:
+        host = port = None
+    return await asyncio.start_server(
+        on_connection, host, port, sock=sock, limit=MAX_HEADER_BYTES, backlog=4096
+    )
+
+
+def server_url(server: asyncio.AbstractServer) -> str:
+    host, port = server.sockets[0].getsockname()[:2]
+    return f"http://{host}:{port}"
@@ -1,126 +1,373 @@
-import json
+import argparse
+import asyncio
+import functools
 import os
 import sys
+import threading
+from typing import TYPE_CHECKING
 
-import httpx
-from rich.console import Console
-from rich.panel import Panel
+# Everything past the standard library is imported where it is first used,
+# so that `--help` or a missing key never waits on httpx, and a conference
+# only loads the features it has opted in to.
+if TYPE_CHECKING:
+    from rich.console import Console
 
-from prompts import build_system_prompt
-from scenarios import SCENARIOS
+    from engine import CachedContext
+    from history import HistoryWindow
+    from openers import OpenerPool
+    from render import Renderer
+    from transcripts import Resumed, TranscriptStore
+    from transport import AsyncGeminiTransport
 
-GEMINI_MODEL = "gemini-2.0-flash"
-GEMINI_URL = (
-    "https://generativelanguage.googleapis.com/v1beta/models/"
-    f"{GEMINI_MODEL}:streamGenerateContent"
-)
+# How long to wait for an opening question already being generated for the
+# picked scenario, rather than asking for a new one.
+OPENER_WAIT = 1.5
 
-console = Console()
 
+@functools.cache
+def console() -> "Console":
+    """The terminal console; rich is only imported once something is shown."""
+    from rich.console import Console
 
-def pick_scenario():
-    console.print("\n[bold]Choose a scenario:[/bold]\n")
-    for key, (description, _) in SCENARIOS.items():
-        console.print(f"  [cyan]{key}[/cyan] — {description}")
-    console.print()
+    return Console()
 
-    while True:
-        choice = console.input("[bold]Pick a number:[/bold] ").strip()
-        if choice in SCENARIOS:
-            _, factory = SCENARIOS[choice]
-            return factory()
-        console.print("[red]Invalid choice, try again.[/red]")
-
-
-def stream_response(api_key: str, system_prompt: str, contents: list[dict]) -> str:
-    """Send a request to Gemini and stream the response. Returns full text."""
-    body = {
-        "system_instruction": {"parts": [{"text": system_prompt}]},
-        "contents": contents,
-    }
-
-    full_text = ""
-
-    with httpx.Client(timeout=60) as client:
-        with client.stream(
-            "POST",
-            GEMINI_URL,
-            params={"alt": "sse", "key": api_key},
-            json=body,
-        ) as resp:
-            if resp.status_code != 200:
-                resp.read()
-                console.print(f"[red]API error {resp.status_code}:[/red] {resp.text}")
-                sys.exit(1)
-
-            for line in resp.iter_lines():
-                if not line.startswith("data: "):
-                    continue
-                chunk = json.loads(line[6:])
-                candidates = chunk.get("candidates", [])
-                if not candidates:
-                    continue
-                parts = candidates[0].get("content", {}).get("parts", [])
-                for part in parts:
-                    text = part.get("text", "")
-                    if text:
-                        console.print(text, end="", highlight=False)
-                        full_text += text
-
-    console.print()  # newline after streamed response
-    return full_text
-
-
-def run_conference(api_key: str, system_prompt: str):
-    contents = [{"role": "user", "parts": [{"text": "Begin the press conference."}]}]
 
-    while True:
-        # Get journalist question
-        console.print()
-        response = stream_response(api_key, system_prompt, contents)
-        contents.append({"role": "model", "parts": [{"text": response}]})
+async def ainput(prompt: str) -> str | None:
+    """`console().input` without blocking the event loop. None on EOF/Ctrl-D.
 
-        if "[END OF PRESS CONFERENCE]" in response:
-            break
+    Reads on a daemon thread so an abandoned prompt never holds up exit.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
 
-        # Get manager's answer
-        console.print()
+    def read():
+        try:
+            result = console().input(prompt)
+        except (EOFError, KeyboardInterrupt):
+            result = None
         try:
-            answer = console.input("[bold green]Your response:[/bold green] ")
-        except (KeyboardInterrupt, EOFError):
-            break
+            loop.call_soon_threadsafe(future.set_result, result)
+        except RuntimeError:
+            pass  # loop already closed
+
+    threading.Thread(target=read, name="console-input", daemon=True).start()
+    return await future
+
+
+def _menu(openers: "OpenerPool | None" = None) -> dict:
+    from packs import load_scenarios
+    from prompts import build_system_prompt
+
+    console()
+    scenarios = load_scenarios()
+    if openers:
+        # Generate opening questions while the player reads the menu, for the
+        # scenarios they played last: the picked one is topped up once played.
+        for key in openers.recent:
+            if key in scenarios:
+                _, factory = scenarios[key]
+                openers.prefetch(lambda factory=factory: build_system_prompt(factory()))
+    return scenarios
+
+
+async def pick_scenario(openers: "OpenerPool | None" = None):
+    from packs import ScenarioError
+
+    # Importing rich and discovering scenario packs is the slow part of
+    # startup: do it off the loop, so the warm-up connection goes out first.
+    scenarios = await asyncio.to_thread(_menu, openers)
+    console().print("\n[bold]Choose a scenario:[/bold]\n")
+    for key, (description, _) in scenarios.items():
+        console().print(f"  [cyan]{key}[/cyan] — {description}")
+    console().print()
+
+    while True:
+        choice = await ainput("[bold]Pick a number:[/bold] ")
+        if choice is None:
+            sys.exit(0)
+        choice = choice.strip()
+        if choice in scenarios:
+            _, factory = scenarios[choice]
+            try:
+                return choice, factory()
+            except ScenarioError as e:
+                console().print(f"[red]{e}[/red]")
+                continue
+        console().print("[red]Invalid choice, try again.[/red]")
+
+
+class ConsoleAnswers:
+    """Reads the manager's answers from the terminal."""
+
+    def __init__(self, renderer: "Renderer"):
+        self.renderer = renderer
+
+    async def next_answer(self, question: str) -> str | None:
+        self.renderer.finish()
+        console().print()
+        answer = await ainput("[bold green]Your response:[/bold green] ")
+        if answer is None:
+            return None
 
         if answer.strip().lower() == "/quit":
-            console.print("\n[dim]Press conference abandoned.[/dim]")
-            break
+            console().print("\n[dim]Press conference abandoned.[/dim]")
+            return None
 
-        contents.append({"role": "user", "parts": [{"text": answer}]})
+        console().print()
+        return answer
 
 
-def main():
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
-        console.print(
-            "[red]Set GEMINI_API_KEY environment variable first.[/red]\n"
-            "  export GEMINI_API_KEY=your-key-here"
-        )
-        sys.exit(1)
+def context_cache() -> "CachedContext | None":
+    """Opt in to server-side prompt caching with GEMINI_CONTEXT_CACHE=<ttl>."""
+    ttl = os.environ.get("GEMINI_CONTEXT_CACHE")
+    if not ttl:
+        return None
+    from engine import CachedContext
+
+    return CachedContext(int(ttl))
+
+
+def history_window() -> "HistoryWindow | None":
+    """Opt in to a bounded, summarised history with FMPSC_HISTORY_BUDGET=<tokens>."""
+    budget = os.environ.get("FMPSC_HISTORY_BUDGET")
+    if not budget:
+        return None
+    from history import HistoryWindow
+
+    return HistoryWindow(int(budget))
+
+
+def cassette(transport: "AsyncGeminiTransport"):
+    """Record every turn into a cassette directory with FMPSC_RECORD=<dir>, or
+    replay one offline with FMPSC_REPLAY=<dir> (FMPSC_REPLAY_SPEED=<factor>,
+    0 for no delays)."""
+    from cassette import recorded
+
+    return recorded(
+        transport,
+        record=os.environ.get("FMPSC_RECORD"),
+        replay=os.environ.get("FMPSC_REPLAY"),
+        speed=float(os.environ.get("FMPSC_REPLAY_SPEED", 1)),
+    )
+
+
+def transcript_store(optional: bool = False) -> "TranscriptStore | None":
+    """Every conference is logged, resumable with --resume, to
+    FMPSC_TRANSCRIPTS=<dir> (default: a per-user data dir; empty to opt out).
+    While another conference has the store open, an `optional` one is left
+    out with a warning; otherwise that's a StoreBusy error."""
+    from transcripts import StoreBusy, TranscriptStore, default_directory
 
-    state = pick_scenario()
-    system_prompt = build_system_prompt(state)
+    directory = os.environ.get("FMPSC_TRANSCRIPTS", default_directory())
+    if not directory:
+        return None
+    try:
+        return TranscriptStore(directory)
+    except StoreBusy as e:
+        if not optional:
+            raise
+        console().print(f"[yellow]{e}: this conference won't be logged.[/yellow]")
+        return None
 
-    console.print(
+
+def opener_pool(api_key: str, loop: asyncio.AbstractEventLoop) -> "OpenerPool | None":
+    """Opt in to opening questions generated ahead of time with
+    FMPSC_OPENERS=<per scenario> (FMPSC_OPENER_TTL=<seconds>, default 6
+    hours). Off while recording or replaying a cassette. Its requests are
+    scheduled on `loop`, behind the conference's."""
+    size = os.environ.get("FMPSC_OPENERS")
+    if not size or os.environ.get("FMPSC_RECORD") or os.environ.get("FMPSC_REPLAY"):
+        return None
+    from openers import OpenerPool
+    from packs import cache_dir
+    from scheduler import shared_scheduler
+    from transport import GeminiTransport
+
+    scheduler = shared_scheduler()
+    # A scheduled attempt that fails is rejected, and a later one admitted anew.
+    transport = GeminiTransport(api_key, max_retries=0 if scheduler else 3)
+    return OpenerPool(
+        transport,
+        cache_dir(),
+        size=int(size),
+        ttl=float(os.environ.get("FMPSC_OPENER_TTL", 6 * 3600)),
+        scheduler=scheduler,
+        loop=loop,
+    )
+
+
+def hedging(transport, api_key: str):
+    """Opt in to hedging late first tokens to another model or endpoint with
+    GEMINI_HEDGE_MODEL and/or GEMINI_HEDGE_BASE_URL (see hedging.py)."""
+    from hedging import alternate_from_env, hedged
+    from scheduler import scheduled
+
+    alternate = alternate_from_env(api_key)
+    return hedged(transport, alternate and scheduled(alternate))
+
+
+def trace_path() -> str | None:
+    """Opt in to tracing with FMPSC_TRACE=<file> (Chrome trace-event JSON)."""
+    return os.environ.get("FMPSC_TRACE")
+
+
+def _banner(title: str, subtitle: str) -> None:
+    from rich.panel import Panel
+
+    console().print(
         Panel(
-            f"[bold]{state.conference_type.value} Press Conference[/bold]\n"
-            f"{state.club.name} — Manager: {state.manager.name}\n"
-            f"[dim]Type /quit to leave early[/dim]",
+            f"[bold]{title}[/bold]\n{subtitle}\n[dim]Type /quit to leave early[/dim]",
             title="FM Press Conference Simulator",
             border_style="blue",
         )
     )
 
-    run_conference(api_key, system_prompt)
-    console.print("\n[bold]Thanks for playing![/bold]\n")
+
+def _replay(contents: list[dict], renderer: "Renderer") -> None:
+    """Show the turns of a resumed conference (after the opening message)."""
+    for content in contents[1:]:
+        text = content["parts"][0]["text"]
+        if content["role"] == "model":
+            renderer(text)
+            renderer.finish()
+        else:
+            console().print(f"\n[bold green]Your response:[/bold green] {text}\n")
+
+
+async def play(api_key: str, resume: str | None = None):
+    from engine import APIError, Conference, run_conference
+    from hedging import HedgedTransport
+    from prompts import build_system_prompt
+    from render import make_renderer
+    from scheduler import scheduled
+    from tracing import NULL_TRACER, Tracer, write_chrome_trace
+    from transcripts import TranscriptError
+    from transport import AsyncGeminiTransport
+
+    transport = hedging(scheduled(AsyncGeminiTransport(api_key)), api_key)
+    hedge = transport.policy if isinstance(transport, HedgedTransport) else None
+    async with cassette(transport) as transport:
+        # Connect while the player is still reading the scenario menu.
+        warmup = asyncio.create_task(transport.warm())
+
+        tracer = Tracer(name="conference") if trace_path() else NULL_TRACER
+        store = renderer = openers = None
+        try:
+            if resume is None:
+                openers = await asyncio.to_thread(
+                    opener_pool, api_key, asyncio.get_running_loop()
+                )
+                scenario, state = await pick_scenario(openers)
+                if openers:
+                    openers.played(scenario)
+                with tracer.span("build_system_prompt"):
+                    system_prompt = build_system_prompt(state)
+                title = (
+                    f"{state.conference_type.value} Press Conference — "
+                    f"{state.club.name}"
+                )
+                _banner(title, f"Manager: {state.manager.name}")
+                renderer = make_renderer(console())
+                store = await asyncio.to_thread(transcript_store, True)
+                conference = Conference(system_prompt)
+                if store is not None:
+                    conference.log = store.start(
+                        system_prompt, conference.contents, scenario, title
+                    )
+                if openers:
+                    opener = await asyncio.to_thread(
+                        openers.take, system_prompt, OPENER_WAIT
+                    )
+                    tracer.instant("opener", pooled=opener is not None)
+                    if opener:
+                        renderer(opener)
+                        conference.add_question(opener)
+            else:
+                store = await asyncio.to_thread(transcript_store)
+                resumed = _resumable(store, resume)
+                _banner(resumed.info.title, f"Resuming {resumed.info.id}")
+                renderer = make_renderer(console())
+                _replay(resumed.contents, renderer)
+                conference = Conference(resumed.system_prompt, resumed.contents)
+                conference.log = store.transcript(resumed.info.id)
+
+            conference.cache = context_cache()
+            conference.history = history_window()
+            conference.tracer = tracer
+            await warmup
+            console().print()
+            await run_conference(
+                transport, conference, ConsoleAnswers(renderer), renderer
+            )
+        except APIError as e:
+            renderer.finish()
+            console().print(f"\n[red]API error {e.status_code}:[/red] {e.body}")
+            sys.exit(1)
+        except TranscriptError as e:
+            console().print(f"[red]{e}[/red]")
+            sys.exit(1)
+        finally:
+            if renderer:
+                renderer.finish()
+            if store is not None:
+                store.close()
+            if openers:
+                openers.close()
+            if tracer.enabled:
+                write_chrome_trace(tracer, trace_path())
+                console().print(f"\n[dim]{tracer.summary_table()}[/dim]")
+                if hedge:
+                    console().print(f"[dim]hedging: {hedge.stats()}[/dim]")
+
+
+def _resumable(store: "TranscriptStore | None", session_id: str) -> "Resumed":
+    """The logged session to resume: `session_id`, or if empty the most
+    recent one that didn't finish (interrupted, or left with /quit)."""
+    from transcripts import TranscriptError
+
+    if store is None:
+        raise TranscriptError("Transcripts are off (FMPSC_TRANSCRIPTS is empty)")
+    if not session_id:
+        unfinished = [
+            *store.sessions(limit=1, status="live"),
+            *store.sessions(limit=1, status="abandoned"),
+        ]
+        if not unfinished:
+            raise TranscriptError("No unfinished conference to resume")
+        session_id = max(unfinished, key=lambda s: s.updated).id
+    resumed = store.load(session_id)
+    if resumed.info.status == "finished":
+        raise TranscriptError(f"Conference {session_id} is already over")
+    return resumed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FM press conference simulator")
+    parser.add_argument(
+        "--resume",
+        nargs="?",
+        const="",
+        metavar="SESSION",
+        help="continue a logged conference (default: the latest unfinished one; "
+        "see `python transcripts.py list`)",
+    )
+    args = parser.parse_args()
+
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if os.environ.get("FMPSC_REPLAY"):
+        api_key = api_key or "replay"  # never sent
+    if not api_key:
+        console().print(
+            "[red]Set GEMINI_API_KEY environment variable first.[/red]\n"
+            "  export GEMINI_API_KEY=your-key-here"
+        )
+        sys.exit(1)
+
+    try:
+        asyncio.run(play(api_key, args.resume))
+    except KeyboardInterrupt:
+        pass
+    console().print("\n[bold]Thanks for playing![/bold]\n")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,328 @@
+"""Local stand-in for the Gemini `streamGenerateContent?alt=sse` endpoint.
+
+Streams plausible journalist questions with tunable pacing and failure
+injection, so the simulator can be run and benchmarked offline:
+
+    python mock_server.py --port 8765 --token-rate 80 --first-byte-delay 0.3
+    GEMINI_BASE_URL=http://127.0.0.1:8765/v1beta python main.py
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+import zlib
+from collections import OrderedDict, deque
+from dataclasses import dataclass, fields
+
+from httpserver import Request, Response, serve, server_url
+from sse import END_MARKER
+
+JOURNALIST_LINE = re.compile(r"^- (.+?) \((.+?)\) — ", re.MULTILINE)
+SUMMARISED = re.compile(r"^\[(?:Summary of|Notes on) the first (\d+) questions", re.M)
+TOKEN = re.compile(r"\s*\S+|\s+")
+
+WORDS = (
+    "manager results pressure board fans derby performance season squad "
+    "injury dressing room confidence tactics captain window signing form "
+    "table relegation goals defence midfield striker future plan week"
+).split()
+
+
+@dataclass
+class MockConfig:
+    first_byte_delay: float = 0.2  # seconds before the first frame
+    stall_rate: float = 0.0  # probability the first frame is `stall_delay` late
+    stall_delay: float = 2.0
+    token_rate: float = 100.0  # tokens per second once streaming (0 = no pacing)
+    chunk_tokens: int = 5  # tokens per SSE frame
+    question_tokens: int = 40  # length of each generated question
+    questions: int = 6  # model turns before [END OF PRESS CONFERENCE]
+    error_rate: float = 0.0  # probability of answering with `error_status`
+    error_status: int = 503
+    disconnect_rate: float = 0.0  # probability of dropping mid-stream
+    resume_overlap: int = 0  # chars of a partial turn repeated when continuing it
+    cache_min_tokens: int = 0  # refuse to cache smaller system prompts
+    cache_evict_rate: float = 0.0  # probability a cache vanishes before a request
+    rpm_limit: int = 0  # requests per `quota_window` before 429s (0 = no limit)
+    tpm_limit: int = 0  # tokens per `quota_window` before 429s (0 = no limit)
+    quota_window: float = 60.0
+    gzip_level: int = 0  # gzip the stream at this level, as a proxy may (0 = off)
+    seed: int | None = None
+
+
+def sse_frame(payload: dict) -> bytes:
+    return b"data: " + json.dumps(payload).encode() + b"\r\n\r\n"
+
+
+async def error(
+    response: Response,
+    status: int,
+    message: str,
+    headers: dict[str, str] | None = None,
+) -> None:
+    body = {"error": {"code": status, "message": message}}
+    await response.send_json(status, body, headers=headers)
+
+
+class MockGemini:
+    """Request handler emulating the subset of the Gemini API we use."""
+
+    def __init__(self, config: MockConfig | None = None):
+        self.config = config or MockConfig()
+        self.random = random.Random(self.config.seed)
+        self.requests = 0
+        self.throttled = 0
+        self.continued = 0
+        # Request -> the question last generated for it, so a dropped question
+        # continues the way it started when sent back as a partial turn.
+        self.generated: OrderedDict[str, list[str]] = OrderedDict()
+        # (time, tokens) of requests inside the quota window
+        self.quota_log: deque[tuple[float, int]] = deque()
+        self.quota_tokens = 0
+        # cachedContents/<id> -> (system instruction, token count, expiry)
+        self.caches: dict[str, tuple[dict, int, float]] = {}
+
+    async def __call__(self, request: Request, response: Response) -> None:
+        path = request.path
+        if request.method == "HEAD":
+            await response.send(200)
+        elif request.method == "POST" and path.endswith(":streamGenerateContent"):
+            await self.stream_generate(request, response)
+        elif "/cachedContents" in path:
+            await self.cached_contents(request, response)
+        else:
+            await error(response, 404, "Not found")
+
+    def _live_cache(self, name: str) -> tuple[dict, int, float] | None:
+        entry = self.caches.get(name)
+        if entry and self.random.random() < self.config.cache_evict_rate:
+            entry = None
+        if entry is None or entry[2] < time.monotonic():
+            self.caches.pop(name, None)
+            return None
+        return entry
+
+    async def cached_contents(self, request: Request, response: Response) -> None:
+        """Create, extend, fetch or delete cached contexts."""
+        name = request.path.split("/v1beta/", 1)[-1]
+        body = request.json() or {}
+
+        if request.method == "POST" and name == "cachedContents":
+            system = body.get("systemInstruction", {})
+            tokens = len(json.dumps(system)) // 4
+            if tokens < self.config.cache_min_tokens:
+                await error(
+                    response,
+                    400,
+                    f"Cached content is too small. total_token_count={tokens}, "
+                    f"min_total_token_count={self.config.cache_min_tokens}",
+                )
+                return
+            name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+            ttl = float(body.get("ttl", "3600s").rstrip("s"))
+            self.caches[name] = (system, tokens, time.monotonic() + ttl)
+        elif request.method in ("PATCH", "GET", "DELETE"):
+            entry = self._live_cache(name)
+            if entry is None:
+                await error(response, 404, "CachedContent not found")
+                return
+            if request.method == "DELETE":
+                del self.caches[name]
+                await response.send_json(200, {})
+                return
+            if request.method == "PATCH":
+                ttl = float(body.get("ttl", "3600s").rstrip("s"))
+                self.caches[name] = (*entry[:2], time.monotonic() + ttl)
+        else:
+            await error(response, 405, "Method not allowed")
+            return
+
+        await response.send_json(
+            200,
+            {
+                "name": name,
+                "model": body.get("model", ""),
+                "usageMetadata": {"totalTokenCount": self.caches[name][1]},
+            },
+        )
+
+    def _over_quota(self, tokens: int) -> float | None:
+        """Seconds until a request of `tokens` would fit, if it doesn't now;
+        else count it against the quota."""
+        cfg = self.config
+        now = time.monotonic()
+        while self.quota_log and self.quota_log[0][0] <= now - cfg.quota_window:
+            self.quota_tokens -= self.quota_log.popleft()[1]
+        if (cfg.rpm_limit and len(self.quota_log) >= cfg.rpm_limit) or (
+            cfg.tpm_limit and self.quota_tokens + tokens > cfg.tpm_limit
+        ):
+            self.throttled += 1
+            oldest = self.quota_log[0][0] if self.quota_log else now
+            return oldest + cfg.quota_window - now
+        self.quota_log.append((now, tokens))
+        self.quota_tokens += tokens
+        return None
+
+    def _question(self, body: dict, system: dict) -> list[str]:
+        """Tokens of the next question, journalist header first."""
+        system = system.get("parts", [{}])[0]
+        journalists = JOURNALIST_LINE.findall(system.get("text", ""))
+        name, outlet = (
+            self.random.choice(journalists) if journalists else ("Reporter", "Wire")
+        )
+        words = self.random.choices(WORDS, k=max(1, self.config.question_tokens))
+        tokens = [f"**{name} ({outlet}):** ", words[0].capitalize()]
+        tokens += [f" {w}" for w in words[1:]]
+        tokens[-1] += "?"
+
+        contents = body.get("contents", [])
+        asked = sum(1 for c in contents if c.get("role") == "model")
+        if contents:
+            # Questions folded into a history summary (see history.py) count too.
+            m = SUMMARISED.search(contents[0]["parts"][0].get("text", ""))
+            asked += int(m.group(1)) if m else 0
+        if asked + 1 >= self.config.questions:
+            tokens.append(f"\n\n{END_MARKER}")
+        return tokens
+
+    def _generate(self, body: dict, system: dict) -> list[str]:
+        """The question for `body`, continuing a trailing partial model turn."""
+        contents = body.get("contents", [])
+        partial = ""
+        if contents and contents[-1].get("role") == "model":
+            partial = contents[-1]["parts"][0].get("text", "")
+            contents = contents[:-1]
+            body = {**body, "contents": contents}
+
+        key = json.dumps([system, contents], sort_keys=True)
+        if not partial:
+            tokens = self.generated[key] = self._question(body, system)
+            self.generated.move_to_end(key)
+            if len(self.generated) > 1024:
+                self.generated.popitem(last=False)
+            return tokens
+
+        self.continued += 1
+        text = "".join(self.generated.get(key, ()))
+        if text.startswith(partial):
+            text = text[max(0, len(partial) - self.config.resume_overlap) :]
+        else:  # started elsewhere: finish it somehow
+            text = " " + " ".join(self.random.choices(WORDS, k=5)) + "?"
+        return TOKEN.findall(text)
+
+    async def stream_generate(self, request: Request, response: Response) -> None:
+        cfg = self.config
+        self.requests += 1
+        body = request.json() or {}
+
+        if self.random.random() < cfg.error_rate:
+            await error(response, cfg.error_status, "Injected error")
+            return
+
+        system = body.get("system_instruction", {})
+        cached_tokens = 0
+        if "cachedContent" in body:
+            entry = self._live_cache(body["cachedContent"])
+            if entry is None:
+                await error(response, 404, "CachedContent not found")
+                return
+            system, cached_tokens, _ = entry
+
+        tokens = self._generate(body, system)
+        prompt_tokens = len(json.dumps(body)) // 4 + cached_tokens
+        wait = self._over_quota(prompt_tokens + len(tokens))
+        if wait is not None:
+            await error(
+                response,
+                429,
+                "Resource has been exhausted (e.g. check quota).",
+                {"Retry-After": str(max(1, round(wait)))},
+            )
+            return
+        step = max(1, cfg.chunk_tokens)
+        frames = [tokens[i : i + step] for i in range(0, len(tokens), step)]
+        drop_at = (
+            self.random.randrange(1, len(frames))
+            if len(frames) > 1 and self.random.random() < cfg.disconnect_rate
+            else None
+        )
+
+        stalled = self.random.random() < cfg.stall_rate
+        await asyncio.sleep(cfg.first_byte_delay + stalled * cfg.stall_delay)
+        gzipped = None
+        if cfg.gzip_level:
+            gzipped = zlib.compressobj(cfg.gzip_level, wbits=31)
+            await response.start(headers={"Content-Encoding": "gzip"})
+        else:
+            await response.start()
+        for i, frame in enumerate(frames):
+            if i == drop_at:
+                response.abort()
+                return
+            if i and cfg.token_rate > 0:
+                await asyncio.sleep(len(frame) / cfg.token_rate)
+            payload = {
+                "candidates": [
+                    {"content": {"parts": [{"text": "".join(frame)}], "role": "model"}}
+                ]
+            }
+            if i == len(frames) - 1:
+                payload["candidates"][0]["finishReason"] = "STOP"
+                payload["usageMetadata"] = {
+                    "promptTokenCount": prompt_tokens,
+                    "candidatesTokenCount": len(tokens),
+                    "totalTokenCount": prompt_tokens + len(tokens),
+                }
+                if cached_tokens:
+                    payload["usageMetadata"]["cachedContentTokenCount"] = cached_tokens
+            data = sse_frame(payload)
+            if gzipped:
+                data = gzipped.compress(data) + gzipped.flush(zlib.Z_SYNC_FLUSH)
+            await response.write(data)
+        if gzipped:
+            await response.write(gzipped.flush())
+        await response.end()
+
+
+async def start_mock(
+    config: MockConfig | None = None, host: str = "127.0.0.1", port: int = 0
+) -> tuple[asyncio.AbstractServer, str]:
+    """Start an in-process mock. Returns the server and its API base URL."""
+    server = await serve(MockGemini(config), host, port)
+    return server, server_url(server) + "/v1beta"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    defaults = MockConfig()
+    for f in fields(MockConfig):
+        default = getattr(defaults, f.name)
+        parser.add_argument(
+            "--" + f.name.replace("_", "-"),
+            type=int if f.name == "seed" else type(default),
+            default=default,
+        )
+    args = parser.parse_args()
+    config = MockConfig(**{f.name: getattr(args, f.name) for f in fields(MockConfig)})
+
+    async def run():
+        server, base_url = await start_mock(config, args.host, args.port)
+        # Parsed by bench.py when it spawns the mock, keep the format stable.
+        print(f"GEMINI_BASE_URL={base_url}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
-from dataclasses import dataclass, field
+from dataclasses import MISSING, dataclass, field, fields, make_dataclass
 from enum import Enum
+from typing import get_args, get_origin
+from weakref import WeakValueDictionary
 
 # --- Enums ---
 
@@ -46,7 +48,7 @@ class PlayerMorale(Enum):
 # --- Core Dataclasses ---
 
 
-@dataclass
+@dataclass(slots=True)
 class MatchRecord:
     opponent: str
     home: bool
@@ -55,7 +57,7 @@ class MatchRecord:
     competition: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Injury:
     player_name: str
     injury_type: str
@@ -63,7 +65,7 @@ class Injury:
     is_key_player: bool
 
 
-@dataclass
+@dataclass(slots=True)
 class Player:
     name: str
     position: str
@@ -76,14 +78,14 @@ class Player:
     assists: int = 0
 
 
-@dataclass
+@dataclass(slots=True)
 class Rivalry:
     opponent: str
     rivalry_type: str  # e.g. "local derby", "historical grudge", "title race"
     description: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Club:
     name: str
     nickname: str
@@ -97,7 +99,7 @@ class Club:
     rivalries: list[Rivalry] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(slots=True)
 class Manager:
     name: str
     age: int
@@ -109,7 +111,7 @@ class Manager:
     win_percentage: float = 0.0
 
 
-@dataclass
+@dataclass(slots=True)
 class Journalist:
     name: str
     outlet: str
@@ -119,7 +121,7 @@ class Journalist:
     )
 
 
-@dataclass
+@dataclass(slots=True)
 class LeagueStanding:
     position: int
     played: int
@@ -131,7 +133,7 @@ class LeagueStanding:
     points: int
 
 
-@dataclass
+@dataclass(slots=True)
 class UpcomingMatch:
     opponent: str
     competition: str
@@ -139,7 +141,7 @@ class UpcomingMatch:
     significance: str  # e.g. "local derby", "must-win relegation battle"
 
 
-@dataclass
+@dataclass(slots=True)
 class PostMatchContext:
     opponent: str
     score: str
@@ -149,7 +151,7 @@ class PostMatchContext:
     )  # e.g. ["Red card for Onana 65'"]
 
 
-@dataclass
+@dataclass(slots=True)
 class TransferContext:
     window: str  # "summer" or "january"
     incoming: list[str] = field(default_factory=list)
@@ -159,7 +161,7 @@ class TransferContext:
     new_signing: str | None = None  # for BIG_SIGNING type
 
 
-@dataclass
+@dataclass(slots=True)
 class GameState:
     """Root container for all game-world data needed by the press conference."""
 
@@ -176,3 +178,97 @@ class GameState:
     upcoming_match: UpcomingMatch | None = None
     post_match: PostMatchContext | None = None
     transfer: TransferContext | None = None
+
+
+# --- Frozen variants ---
+#
+# `freeze` turns any model (usually a whole GameState) into an immutable,
+# hashable copy built from the generated `Frozen*` classes below, with lists
+# as tuples. Equal sub-objects are interned, so every session started from
+# the same scenario shares one Club, its Rivalries, each unchanged Player and
+# so on, and a snapshot is just a reference. Derive new states with
+# `dataclasses.replace`, which keeps sharing whatever it doesn't touch.
+
+
+def _frozen_variant(cls: type) -> type:
+    spec = []
+    for f in fields(cls):
+        tp = f.type
+        if get_origin(tp) is list:
+            tp = tuple[(*get_args(tp), ...)]
+        if f.default_factory is not MISSING:
+            spec.append((f.name, tp, field(default=tuple(f.default_factory()))))
+        elif f.default is not MISSING:
+            spec.append((f.name, tp, field(default=f.default)))
+        else:
+            spec.append((f.name, tp))
+    frozen = make_dataclass(
+        f"Frozen{cls.__name__}",
+        spec,
+        frozen=True,
+        slots=True,
+        weakref_slot=True,
+        module=__name__,
+    )
+    frozen.__doc__ = f"Immutable, hashable {cls.__name__} (see `freeze`)."
+    return frozen
+
+
+FROZEN: dict[type, type] = {
+    cls: _frozen_variant(cls)
+    for cls in (
+        MatchRecord,
+        Injury,
+        Player,
+        Rivalry,
+        Club,
+        Manager,
+        Journalist,
+        LeagueStanding,
+        UpcomingMatch,
+        PostMatchContext,
+        TransferContext,
+        GameState,
+    )
+}
+MUTABLE: dict[type, type] = {frozen: cls for cls, frozen in FROZEN.items()}
+globals().update({frozen.__name__: frozen for frozen in MUTABLE})  # for pickle
+
+_FIELD_NAMES = {cls: tuple(f.name for f in fields(cls)) for cls in FROZEN | MUTABLE}
+_interned: WeakValueDictionary = WeakValueDictionary()
+
+
+def freeze(obj):
+    """Immutable, interned copy of a model; frozen models come back as is."""
+    if isinstance(obj, list | tuple):
+        return tuple(freeze(item) for item in obj)
+    cls = FROZEN.get(type(obj))
+    if cls is None:
+        return obj  # already frozen, an enum or a plain value
+    values = tuple(freeze(getattr(obj, name)) for name in _FIELD_NAMES[cls])
+    key = (cls, *map(_identity, values))
+    shared = _interned.get(key)
+    if shared is None:
+        shared = _interned[key] = cls(*values)
+    return shared
+
+
+def _identity(value):
+    """Interning key for a field value. Frozen models are keyed by id: an
+    entry only lives as long as its object, which keeps the children (and
+    so their ids) alive, and equal children are already the same object."""
+    if type(value) in MUTABLE:
+        return id(value)
+    if type(value) is tuple:
+        return tuple(map(_identity, value))
+    return value
+
+
+def thaw(obj):
+    """Mutable (deep) copy of a frozen model; anything else comes back as is."""
+    if isinstance(obj, tuple):
+        return [thaw(item) for item in obj]
+    cls = MUTABLE.get(type(obj))
+    if cls is None:
+        return obj
+    return cls(*(thaw(getattr(obj, name)) for name in _FIELD_NAMES[cls]))
@@ -0,0 +1,299 @@
+"""Opening questions generated ahead of time, so the first one is instant.
+
+The first request of a conference is always the same for a given system
+prompt: the prompt plus "Begin the press conference.". An `OpenerPool`
+keeps up to `size` answers to it per prompt fingerprint, generated on the
+blocking `GeminiTransport` by a small thread pool while the player is still
+choosing a scenario. `take` hands one out to become the conference's first
+question and tops the pool up again in the background. Every scenario
+means building its pack and paying for `size` requests, so only the ones
+played last (`recent`) are worth topping up before the player picks.
+
+The pool is kept in the cache directory (see packs.cache_dir), so it
+carries over between runs. To keep openers varied for repeat players:
+
+- pooled openers expire after `ttl` seconds;
+- an opener is never handed out twice, and the last MAX_SERVED ones handed
+  out are never pooled again;
+- at most `per_journalist` pooled openers for a prompt have the same
+  journalist asking.
+
+Given the process's `QuotaScheduler` (see scheduler.py) and the event loop
+it runs on, each pool request waits for it at batch priority, behind any
+conference's; with or without one, never more than `workers` go at a time.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+from engine import OPENING_MESSAGE
+from scheduler import Grant, Priority, QuotaScheduler, _retry_after
+from sse import END_MARKER, HEADER, QuestionStream
+from transcripts import fingerprint
+from transport import GeminiTransport, encode_json
+
+OPENERS_FILE = "openers.json"
+MAX_SERVED = 1000
+RECENT = 2  # scenarios remembered as played last
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()[:16]
+
+
+def _asker(text: str) -> str:
+    return HEADER.match(text).group(0)
+
+
+class OpenerPool:
+    """Pre-generated first questions, per system prompt."""
+
+    def __init__(
+        self,
+        transport: GeminiTransport,
+        directory: str | os.PathLike | None = None,
+        size: int = 3,
+        ttl: float = 6 * 3600,
+        per_journalist: int = 1,
+        workers: int = 2,
+        scheduler: QuotaScheduler | None = None,
+        loop: asyncio.AbstractEventLoop | None = None,
+    ):
+        self.transport = transport
+        self.scheduler = scheduler
+        self.loop = loop
+        self.path = Path(directory, OPENERS_FILE) if directory else None
+        self.size = size
+        self.ttl = ttl
+        self.per_journalist = per_journalist
+        self._lock = threading.Condition()
+        self._pools: dict[str, list[tuple[float, str]]] = {}  # fp -> (created, text)
+        self._served: dict[str, float] = {}  # digest -> when, oldest first
+        self._filling: Counter[str] = Counter()
+        self._recent: list[str] = []  # scenario keys, newest first
+        self._admitting: set[Future] = set()  # waits on the scheduler
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="opener")
+        self._closed = False
+        self.generated = self.rejected = self.hits = self.misses = 0
+        self._load()
+
+    def _load(self) -> None:
+        if self.path is None:
+            return
+        try:
+            doc = json.loads(self.path.read_bytes())
+            self._pools = {fp: [tuple(o) for o in p] for fp, p in doc["pools"].items()}
+            self._served = dict(doc["served"])
+            self._recent = list(doc.get("recent", ()))[:RECENT]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # no pool yet: start empty
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            self._expire(time.time())
+            doc = {
+                "pools": self._pools,
+                "served": self._served,
+                "recent": self._recent,
+            }
+            data = json.dumps(doc, ensure_ascii=False).encode("utf-8")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}")
+        tmp.write_bytes(data)
+        os.replace(tmp, self.path)
+
+    def close(self) -> None:
+        """Stop filling, abandoning requests in flight, close the transport
+        and save the pool."""
+        self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            for future in self._admitting:
+                future.cancel()
+        self.transport.close()
+        self.save()
+
+    def __enter__(self) -> "OpenerPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _expire(self, now: float) -> None:
+        for fp, pool in list(self._pools.items()):
+            pool[:] = [(t, text) for t, text in pool if now - t < self.ttl]
+            if not pool:
+                del self._pools[fp]
+        while len(self._served) > MAX_SERVED:
+            del self._served[next(iter(self._served))]
+
+    @property
+    def recent(self) -> list[str]:
+        """The scenarios `played` last, newest first."""
+        with self._lock:
+            return list(self._recent)
+
+    def played(self, scenario: str) -> None:
+        with self._lock:
+            others = [s for s in self._recent if s != scenario]
+            self._recent = [scenario, *others][:RECENT]
+
+    def available(self, system_prompt: str) -> int:
+        with self._lock:
+            self._expire(time.time())
+            return len(self._pools.get(fingerprint(system_prompt), ()))
+
+    def prefetch(self, system_prompt: str | Callable[[], str]) -> list[Future]:
+        """Top up the pool for `system_prompt` in the background. Given a
+        callable, it is called on a worker thread for the prompt first (for
+        scenarios that have yet to be built); one that raises is skipped."""
+        if self._closed:
+            return []
+        if callable(system_prompt):
+            build = system_prompt
+
+            def prefetch_built():
+                try:
+                    prompt = build()
+                except Exception:
+                    return  # e.g. a broken scenario pack: it fails when picked
+                self.prefetch(prompt)
+
+            return [self._executor.submit(prefetch_built)]
+
+        fp = fingerprint(system_prompt)
+        with self._lock:
+            self._expire(time.time())
+            missing = self.size - len(self._pools.get(fp, ())) - self._filling[fp]
+            self._filling[fp] += max(0, missing)
+        return [
+            self._executor.submit(self._fill, fp, system_prompt) for _ in range(missing)
+        ]
+
+    def _fill(self, fp: str, system_prompt: str) -> None:
+        # Whatever happens, the request is no longer in flight: `take` must
+        # not wait for it, and a later `prefetch` must be free to replace it.
+        text = None
+        try:
+            text = self.generate(system_prompt)
+        except Exception:
+            pass  # e.g. a network error, or the client closed under us
+        finally:
+            with self._lock:
+                self._filling[fp] -= 1
+                if text is not None and self._acceptable(fp, text):
+                    self._pools.setdefault(fp, []).append((time.time(), text))
+                else:
+                    self.rejected += 1  # refused, failed or unusable
+                self._lock.notify_all()
+
+    def _acceptable(self, fp: str, text: str) -> bool:
+        if not HEADER.match(text) or END_MARKER in text:
+            return False
+        if _digest(text) in self._served:
+            return False
+        pooled = self._pools.get(fp, ())
+        if any(_digest(t) == _digest(text) for _, t in pooled):
+            return False
+        same = sum(_asker(t) == _asker(text) for _, t in pooled)
+        return same < self.per_journalist
+
+    def generate(self, system_prompt: str) -> str | None:
+        """One opening question, or None if the API refused."""
+        body = encode_json(
+            {
+                "system_instruction": {"parts": [{"text": system_prompt}]},
+                "contents": [{"role": "user", "parts": [{"text": OPENING_MESSAGE}]}],
+            }
+        )
+        parser = QuestionStream()
+        grant = self._admit(len(body))
+        retry_after = None
+        try:
+            with self.transport.stream(body) as resp:
+                if resp.status_code != 200:
+                    retry_after = _retry_after(resp)
+                    return None
+                for _ in parser.iter_deltas(resp.iter_lines()):
+                    pass
+        finally:
+            if grant is not None:
+                self._settle(grant, parser.usage, retry_after)
+        with self._lock:
+            self.generated += 1
+        return parser.text.strip()
+
+    def _admit(self, size: int) -> Grant | None:
+        """Wait on the event loop for the scheduler to admit a request of
+        `size` bytes; None without a scheduler. Raises Overloaded if shed, or
+        CancelledError if the pool is closed first."""
+        if self.scheduler is None:
+            return None
+        estimate = self.scheduler.estimate(size)
+        future = asyncio.run_coroutine_threadsafe(
+            self.scheduler.acquire(Priority.BATCH, estimate), self.loop
+        )
+        with self._lock:
+            if self._closed:
+                future.cancel()
+            self._admitting.add(future)
+        try:
+            return future.result()
+        finally:
+            with self._lock:
+                self._admitting.discard(future)
+
+    def _settle(
+        self, grant: Grant, usage: dict | None, retry_after: float | None
+    ) -> None:
+        try:
+            self.loop.call_soon_threadsafe(
+                self.scheduler.settle, grant, usage, retry_after
+            )
+        except RuntimeError:
+            pass  # the loop is closed: nothing left to schedule
+
+    def take(self, system_prompt: str, wait: float = 0.0) -> str | None:
+        """A pooled opening question for `system_prompt` (then refilled), or
+        None. With none pooled but one being generated, waits up to `wait`
+        seconds for it: it was asked for earlier than a new request would be."""
+        fp = fingerprint(system_prompt)
+        deadline = time.monotonic() + wait
+        with self._lock:
+            while True:
+                self._expire(time.time())
+                pool = self._pools.get(fp)
+                remaining = deadline - time.monotonic()
+                if pool or not self._filling[fp] or remaining <= 0:
+                    break
+                self._lock.wait(remaining)
+            if not pool:
+                self.misses += 1
+                text = None
+            else:
+                self.hits += 1
+                _, text = pool.pop(0)  # oldest first, before it expires
+                self._served[_digest(text)] = time.time()
+        self.prefetch(system_prompt)
+        return text
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pooled": sum(len(p) for p in self._pools.values()),
+                "filling": sum(self._filling.values()),
+                "generated": self.generated,
+                "rejected": self.rejected,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,285 @@
+"""Data-driven scenario packs: GameStates described in JSON or TOML files.
+
+Every `*.json` / `*.toml` file in the pack directories (FMPSC_SCENARIO_PATH,
+separated like PATH, else the bundled `scenario_packs/`) is one scenario:
+an optional `key` (defaults to the file name) and `description` for the
+menu, plus the `GameState` fields, with enums given by value or name:
+
+    key = "spurs-derby"
+    description = "Spurs before the North London derby"
+    conference_type = "Rivalry Preview"
+    [club]
+    name = "Tottenham Hotspur"
+    ...
+
+Startup only reads a manifest of key, description and file fingerprint,
+kept in the cache directory (FMPSC_CACHE_DIR, else ~/.cache/fmpsc-sim) and
+refreshed for files whose size or mtime changed. A scenario is validated
+into the `models` dataclasses when it is picked, and the result stored as a
+codec.py snapshot by content hash, so later runs load it without parsing at
+all. Unlike a pickle, a snapshot can only ever decode into a GameState, so
+whoever else can write to the cache directory can't run code through it.
+"""
+
+import dataclasses
+import hashlib
+import json
+import os
+import types
+import warnings
+from collections.abc import Callable
+from enum import Enum
+from pathlib import Path
+from typing import Union, get_args, get_origin, get_type_hints
+
+import models
+from models import GameState
+from scenarios import SCENARIOS
+
+BUNDLED_PACKS = Path(__file__).with_name("scenario_packs")
+
+
+def _toml(text: str) -> dict:
+    import tomllib  # only needed when a pack file is (re)parsed
+
+    return tomllib.loads(text)
+
+
+PARSERS = {".json": json.loads, ".toml": _toml}
+
+
+class ScenarioError(ValueError):
+    """A scenario file that doesn't describe a valid GameState."""
+
+
+def _field_shape(f: dataclasses.Field) -> tuple:
+    if f.default is not dataclasses.MISSING:
+        default = repr(f.default)
+    elif f.default_factory is not dataclasses.MISSING:
+        default = getattr(f.default_factory, "__qualname__", repr(f.default_factory))
+    else:
+        default = None
+    return f.name, repr(f.type), default
+
+
+def _schema_version() -> str:
+    """Changes whenever a model's layout does: its fields, their types and
+    defaults, its slots, or an enum's members. So nothing cached by a build
+    with other models is trusted."""
+    shape = []
+    for name, cls in sorted(vars(models).items()):
+        if dataclasses.is_dataclass(cls):
+            fields = [_field_shape(f) for f in dataclasses.fields(cls)]
+            shape.append((name, fields, getattr(cls, "__slots__", None)))
+        elif isinstance(cls, type) and issubclass(cls, Enum) and cls is not Enum:
+            shape.append((name, [(m.name, m.value) for m in cls]))
+    return hashlib.sha256(repr(shape).encode()).hexdigest()[:12]
+
+
+SCHEMA = _schema_version()
+
+
+def pack_dirs() -> list[Path]:
+    path = os.environ.get("FMPSC_SCENARIO_PATH")
+    if path:
+        return [Path(p) for p in path.split(os.pathsep) if p]
+    return [BUNDLED_PACKS]
+
+
+def cache_dir() -> Path:
+    if "FMPSC_CACHE_DIR" in os.environ:
+        return Path(os.environ["FMPSC_CACHE_DIR"])
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "fmpsc-sim" / "scenarios"
+
+
+# --- Validation ---
+
+
+def _build(tp, value, where: str):
+    """Convert parsed JSON/TOML `value` into type `tp`, or raise ScenarioError."""
+    origin = get_origin(tp)
+    if origin in (Union, types.UnionType):
+        options = get_args(tp)
+        if value is None and type(None) in options:
+            return None
+        (inner,) = [t for t in options if t is not type(None)]
+        return _build(inner, value, where)
+    if origin is list:
+        if not isinstance(value, list):
+            raise ScenarioError(f"{where}: expected a list")
+        (item,) = get_args(tp)
+        return [_build(item, v, f"{where}[{i}]") for i, v in enumerate(value)]
+    if dataclasses.is_dataclass(tp):
+        return _build_dataclass(tp, value, where)
+    if isinstance(tp, type) and issubclass(tp, Enum):
+        for member in tp:
+            if value in (member.value, member.name):
+                return member
+        choices = ", ".join(repr(m.value) for m in tp)
+        raise ScenarioError(f"{where}: {value!r} is not one of {choices}")
+    if tp is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if not isinstance(value, tp) or (tp is int and isinstance(value, bool)):
+        raise ScenarioError(f"{where}: expected {tp.__name__}, got {value!r}")
+    return value
+
+
+def _build_dataclass(cls, data, where: str):
+    if not isinstance(data, dict):
+        raise ScenarioError(f"{where or cls.__name__}: expected a table/object")
+    hints = get_type_hints(cls)
+    names = {f.name for f in dataclasses.fields(cls)}
+    unknown = sorted(set(data) - names)
+    if unknown:
+        raise ScenarioError(f"{where or cls.__name__}: unknown field(s) {unknown}")
+    kwargs = {}
+    for f in dataclasses.fields(cls):
+        path = f"{where}.{f.name}" if where else f.name
+        if f.name in data:
+            kwargs[f.name] = _build(hints[f.name], data[f.name], path)
+        elif (
+            f.default is dataclasses.MISSING
+            and f.default_factory is dataclasses.MISSING
+        ):
+            raise ScenarioError(f"{path}: missing")
+    return cls(**kwargs)
+
+
+def build_state(doc: dict) -> GameState:
+    """Validate parsed JSON/TOML fields into a GameState, or raise ScenarioError."""
+    return _build_dataclass(GameState, doc, "")
+
+
+def parse_scenario(path: Path, raw: bytes | None = None) -> tuple[dict, GameState]:
+    """Menu metadata (`key`, `description`) and the validated GameState."""
+    try:
+        doc = _parse(path, raw)
+        meta = {k: doc.pop(k) for k in ("key", "description") if k in doc}
+        return meta, build_state(doc)
+    except ScenarioError as e:
+        raise ScenarioError(f"{path}: {e}") from None
+
+
+def _parse(path: Path, raw: bytes | None = None) -> dict:
+    raw = path.read_bytes() if raw is None else raw
+    try:
+        return PARSERS[path.suffix](raw.decode("utf-8"))
+    except (ValueError, UnicodeDecodeError) as e:  # JSON and TOML errors alike
+        raise ScenarioError(str(e)) from None
+
+
+# --- Discovery and caching ---
+
+
+@dataclasses.dataclass
+class PackScenario:
+    """A manifest entry; `load()` is the scenario factory."""
+
+    key: str
+    description: str
+    path: Path
+    digest: str
+    cache: Path | None
+
+    def load(self) -> GameState:
+        import codec  # only needed once a pack scenario is picked
+
+        compiled = self.cache / f"{self.digest}-{SCHEMA}.fmgs" if self.cache else None
+        if compiled:
+            try:
+                return codec.decode(compiled.read_bytes())
+            except (OSError, codec.CodecError):
+                pass  # not compiled yet, or by another build: parse again
+        raw = self.path.read_bytes()
+        if hashlib.sha256(raw).hexdigest() != self.digest:
+            raise ScenarioError(f"{self.path}: changed since the menu was built")
+        _, state = parse_scenario(self.path, raw)
+        if compiled:
+            _write_atomic(compiled, codec.encode(state))
+        return state
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    except OSError:
+        pass  # read-only cache: just parse again next time
+
+
+def _load_manifest(path: Path) -> dict[str, dict]:
+    try:
+        manifest = json.loads(path.read_bytes())
+    except (OSError, ValueError):
+        return {}
+    return manifest["files"] if manifest.get("schema") == SCHEMA else {}
+
+
+def discover(
+    dirs: list[Path] | None = None, cache: Path | None = None
+) -> dict[str, PackScenario]:
+    """Manifest entries for every pack file, keyed by menu key. Files that
+    fail to parse, or reuse a key, are skipped with a warning."""
+    dirs = pack_dirs() if dirs is None else dirs
+    cache = cache_dir() if cache is None else cache
+    manifest_path = cache / "manifest.json"
+    old = _load_manifest(manifest_path)
+    files: dict[str, dict] = {}
+    found: dict[str, PackScenario] = {}
+
+    for directory in dirs:
+        if not directory.is_dir():
+            continue
+        for path in sorted(directory.iterdir()):
+            if path.suffix not in PARSERS:
+                continue
+            name = str(path.resolve())
+            try:
+                entry = _manifest_entry(path, old.get(name))
+            except (OSError, ScenarioError) as e:
+                warnings.warn(f"Skipping scenario {path}: {e}", stacklevel=2)
+                continue
+            files[name] = entry
+            if entry["key"] in found or entry["key"] in SCENARIOS:
+                warnings.warn(
+                    f"Skipping scenario {path}: key {entry['key']!r} already used",
+                    stacklevel=2,
+                )
+                continue
+            found[entry["key"]] = PackScenario(
+                entry["key"], entry["description"], path, entry["sha256"], cache
+            )
+
+    if files != old:
+        manifest = {"schema": SCHEMA, "files": files}
+        _write_atomic(manifest_path, json.dumps(manifest, indent=1).encode())
+    return found
+
+
+def _manifest_entry(path: Path, entry: dict | None) -> dict:
+    stat = path.stat()
+    fingerprint = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    if entry and all(entry[k] == v for k, v in fingerprint.items()):
+        return entry
+    raw = path.read_bytes()
+    digest = hashlib.sha256(raw).hexdigest()
+    if entry and entry["sha256"] == digest:
+        return {**entry, **fingerprint}  # touched, not changed
+    doc = _parse(path, raw)
+    return {
+        **fingerprint,
+        "sha256": digest,
+        "key": str(doc.get("key", path.stem)),
+        "description": str(doc.get("description", path.stem)),
+    }
+
+
+def load_scenarios() -> dict[str, tuple[str, Callable[[], GameState]]]:
+    """The built-in SCENARIOS followed by every discovered pack scenario."""
+    registry = dict(SCENARIOS)
+    for key, scenario in discover().items():
+        registry[key] = (scenario.description, scenario.load)
+    return registry
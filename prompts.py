@@ -1,16 +1,102 @@
-from models import GameState
-
-
-def build_system_prompt(state: GameState) -> str:
-    sections = [
-        _role(state),
-        _club(state),
-        _manager(state),
-        _squad(state),
-        _journalists(state),
-        _conference(state),
-        _rules(),
-    ]
+import threading
+from collections import OrderedDict
+
+import squad
+from models import FROZEN, MUTABLE, GameState, Player
+
+# Squads whose listing would pass this many tokens (~4 characters each), or
+# this many players, are cut down to the most newsworthy (see squad.py).
+SQUAD_TOKEN_BUDGET = 800
+SQUAD_LIMIT = 30
+
+
+class SectionCache:
+    """LRU of rendered sections, keyed on the section and the parts of the
+    state it reads.
+
+    Only frozen models (see `models.freeze`), tuples of them and plain
+    values are cached. Frozen models are interned by content, so their
+    identity is their content fingerprint: a lookup costs a few dict
+    operations, whereas any fingerprint of a mutable model costs more than
+    rendering it. Sections of mutable states are just rendered (and counted
+    as `uncached`). A section whose inputs are unchanged comes back as the
+    very same string, keeping the prompt prefix byte-identical for
+    provider-side prefix caching.
+    """
+
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self.hits = self.misses = self.uncached = 0
+        # key -> (inputs, text); holding the inputs keeps their ids unique.
+        self._sections: OrderedDict[tuple, tuple[tuple, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, name: str, render, state: GameState, inputs: tuple) -> str:
+        key = [name]
+        for value in inputs:
+            tp = type(value)
+            if tp in MUTABLE:  # frozen
+                key.append(id(value))
+            elif tp is tuple:  # rebuilt by every freeze, unlike its items
+                key.append(tuple(map(id, value)))
+            elif tp is list or tp in FROZEN:  # mutable
+                self.uncached += 1
+                return render(state)
+            else:
+                key.append(value)
+        key = tuple(key)
+
+        with self._lock:
+            entry = self._sections.get(key)
+            if entry is not None:
+                self._sections.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        text = render(state)
+        with self._lock:
+            self.misses += 1
+            self._sections[key] = (inputs, text)
+            if len(self._sections) > self.maxsize:
+                self._sections.popitem(last=False)
+        return text
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "uncached": self.uncached,
+            "size": len(self._sections),
+            "hit_rate": self.hit_rate,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sections.clear()
+            self.hits = self.misses = self.uncached = 0
+
+
+SECTION_CACHE = SectionCache()
+
+
+def build_system_prompt(
+    state: GameState, cache: SectionCache | None = SECTION_CACHE
+) -> str:
+    """The system prompt for `state`. Its sections come from `cache` only
+    when `state` is frozen (see `models.freeze`): a mutable one, like a
+    scenario factory's, is rendered in full every time."""
+    if cache is None:
+        sections = [render(state) for _, render, _ in SECTIONS]
+    else:
+        sections = [
+            cache.render(name, render, state, inputs(state))
+            for name, render, inputs in SECTIONS
+        ]
     return "\n\n".join(sections)
 
 
@@ -75,30 +161,49 @@ def _manager(state: GameState) -> str:
     return "\n".join(lines)
 
 
+def _player_line(p: Player) -> str:
+    parts = [f"{p.name} ({p.position}, {p.age})"]
+    if p.is_captain:
+        parts.append("CAPTAIN")
+    if p.is_star_player:
+        parts.append("star player")
+    if p.morale.value not in ("content", "happy"):
+        parts.append(f"morale: {p.morale.value}")
+    if p.goals or p.assists:
+        parts.append(f"{p.goals}G {p.assists}A")
+    if p.transfer_rumour:
+        parts.append(f"RUMOUR: {p.transfer_rumour}")
+    return "- " + " | ".join(parts)
+
+
 def _squad(state: GameState) -> str:
     lines = ["# Squad"]
 
-    for p in state.squad:
-        parts = [f"{p.name} ({p.position}, {p.age})"]
-        if p.is_captain:
-            parts.append("CAPTAIN")
-        if p.is_star_player:
-            parts.append("star player")
-        if p.morale.value not in ("content", "happy"):
-            parts.append(f"morale: {p.morale.value}")
-        if p.goals or p.assists:
-            parts.append(f"{p.goals}G {p.assists}A")
-        if p.transfer_rumour:
-            parts.append(f"RUMOUR: {p.transfer_rumour}")
-        lines.append("- " + " | ".join(parts))
-
-    if state.injuries:
+    player_lines = [_player_line(p) for p in state.squad]
+    costs = [len(line) // 4 + 1 for line in player_lines]
+    chosen = squad.select(state, costs, SQUAD_TOKEN_BUDGET, SQUAD_LIMIT)
+    lines += [player_lines[i] for i in chosen]
+    if len(chosen) < len(state.squad):
+        listed = set(chosen)
+        others = [p for i, p in enumerate(state.squad) if i not in listed]
+        lines.append(squad.summarise(others))
+        names = {state.squad[i].name for i in chosen}
+        injuries = [
+            i for i in state.injuries if i.player_name in names or i.is_key_player
+        ]
+    else:
+        injuries = state.injuries
+
+    if injuries:
         lines.append("\nInjuries:")
-        for inj in state.injuries:
+        for inj in injuries:
             key = " (KEY PLAYER)" if inj.is_key_player else ""
             lines.append(
                 f"- {inj.player_name}: {inj.injury_type}, {inj.weeks_out} weeks out{key}"
             )
+        hidden = len(state.injuries) - len(injuries)
+        if hidden:
+            lines.append(f"- plus {hidden} squad player(s) not listed above")
 
     return "\n".join(lines)
 
@@ -161,3 +266,24 @@ def _rules() -> str:
         "- After the final question, write [END OF PRESS CONFERENCE].\n"
         "- Never break character. You are journalists, not an AI assistant."
     )
+
+
+# Each section with the parts of the state it reads, which key its cache
+# entries: keep the two in step when changing a section.
+SECTIONS = (
+    ("role", _role, lambda s: (s.club.name,)),
+    ("club", _club, lambda s: (s.club, s.league_standing, s.recent_form)),
+    ("manager", _manager, lambda s: (s.manager,)),
+    (
+        "squad",
+        _squad,
+        lambda s: (s.squad, s.injuries, s.conference_type, s.post_match, s.transfer),
+    ),
+    ("journalists", _journalists, lambda s: (s.journalists,)),
+    (
+        "conference",
+        _conference,
+        lambda s: (s.conference_type, s.upcoming_match, s.post_match, s.transfer),
+    ),
+    ("rules", lambda s: _rules(), lambda s: ()),
+)
@@ -0,0 +1,147 @@
+"""Renderers for streamed journalist questions.
+
+Each renderer is an `on_text` callback for the engine plus a `finish()`
+that the frontend calls once the question is complete (before prompting
+for an answer). They coalesce deltas so the terminal is redrawn at most
+`fps` times a second instead of once per SSE part.
+"""
+
+import os
+import re
+import sys
+import time
+from typing import TYPE_CHECKING, Protocol, TextIO
+
+# rich is imported by the renderers that draw with it, so headless runs
+# never load it.
+if TYPE_CHECKING:
+    from rich.console import Console, ConsoleOptions, RenderResult
+    from rich.live import Live
+
+# "**Name (Outlet):**" at the start of the question.
+HEADER = re.compile(r"\s*\*\*([^*\n]+?):\*\*[ \t]*")
+
+
+class Renderer(Protocol):
+    def __call__(self, text: str) -> None: ...
+
+    def finish(self) -> None: ...
+
+
+class NullRenderer:
+    """Discards everything; for headless runs."""
+
+    def __call__(self, text: str) -> None:
+        pass
+
+    def finish(self) -> None:
+        pass
+
+
+class PlainRenderer:
+    """Writes raw text to a stream in batches; for pipes and log files."""
+
+    def __init__(self, stream: TextIO | None = None, fps: float = 20):
+        self.stream = stream or sys.stdout
+        self.interval = 1 / fps
+        self._buffer: list[str] = []
+        self._last = 0.0
+        self._wrote = False
+
+    def __call__(self, text: str) -> None:
+        self._buffer.append(text)
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self._flush()
+            self._last = now
+
+    def _flush(self) -> None:
+        if self._buffer:
+            self.stream.write("".join(self._buffer))
+            self.stream.flush()
+            self._buffer.clear()
+            self._wrote = True
+
+    def finish(self) -> None:
+        self._flush()
+        if self._wrote:
+            self.stream.write("\n")
+            self.stream.flush()
+        self._wrote = False
+        self._last = 0.0
+
+
+class _Question:
+    """The question so far, with its header styled once it has arrived."""
+
+    def __init__(self):
+        self.parts: list[str] = []
+        self._header: str | None = None
+        self._body_from = 0
+
+    def __rich_console__(
+        self, console: "Console", options: "ConsoleOptions"
+    ) -> "RenderResult":
+        from rich.text import Text
+
+        text = "".join(self.parts)
+        if self._header is None:
+            m = HEADER.match(text)
+            if m:
+                self._header = f"{m.group(1)}: "
+                self._body_from = m.end()
+        if self._header is None:
+            yield Text(text)
+        else:
+            yield Text.assemble((self._header, "bold"), text[self._body_from :])
+
+
+class LiveRenderer:
+    """Redraws the question in place via `rich.live`, at most `fps` times a
+    second, with the journalist header rendered as bold text."""
+
+    def __init__(self, console: "Console", fps: float = 12):
+        self.console = console
+        self.fps = fps
+        self._live: "Live | None" = None
+        self._question: _Question | None = None
+
+    def __call__(self, text: str) -> None:
+        if self._live is None:
+            from rich.live import Live
+
+            self._question = _Question()
+            self._live = Live(
+                self._question,
+                console=self.console,
+                refresh_per_second=self.fps,
+                vertical_overflow="visible",
+            )
+            self._live.start()
+        # The refresh thread reads `parts`; list.append is atomic.
+        self._question.parts.append(text)
+
+    def finish(self) -> None:
+        if self._live is not None:
+            self._live.stop()  # draws the final frame
+            self._live = None
+            self._question = None
+
+
+def make_renderer(
+    console: "Console", kind: str | None = None, fps: float | None = None
+) -> Renderer:
+    """`kind` is "live", "plain" or "null"; by default FMPSC_RENDER, else
+    live on a terminal and plain otherwise. `fps` (or FMPSC_RENDER_FPS)
+    caps the redraw rate."""
+    kind = kind or os.environ.get("FMPSC_RENDER")
+    if kind is None:
+        kind = "live" if console.is_terminal else "plain"
+    fps = fps or float(os.environ.get("FMPSC_RENDER_FPS", 0)) or None
+    if kind == "live":
+        return LiveRenderer(console, fps or 12)
+    if kind == "plain":
+        return PlainRenderer(console.file, fps or 20)
+    if kind == "null":
+        return NullRenderer()
+    raise ValueError(f"Unknown renderer {kind!r}; use live, plain or null")
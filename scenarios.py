@@ -206,6 +206,8 @@ def losing_streak_crisis() -> GameState:
 
 
 # --- ADD YOUR SCENARIOS BELOW ---
+# Or, without any code, as a JSON/TOML file in scenario_packs/ (see packs.py
+# and scenario_packs/spurs-derby.toml).
 # Use the losing_streak_crisis() above as a template.
 # Some ideas:
 #
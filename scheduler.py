@@ -0,0 +1,441 @@
+"""Process-wide admission control in front of the Gemini quota.
+
+Gemini limits each key to so many requests and tokens per minute; past
+either, every caller gets 429s and the retries make it worse. A
+`QuotaScheduler` keeps a log of the requests admitted in the last minute
+with their token counts (estimated up front from the body size and the
+average answer, corrected from each reply's `usageMetadata`) and holds new
+requests back until they fit, so the 429s never happen.
+
+Waiting requests are served by priority, interactive before batch, and in
+arrival order within one. A request is shed, coming back as a local 429 the
+engine reports like any other, when the queue is already `max_queue` deep
+or, if interactive, it has waited `max_wait` seconds: a player would rather
+hear so than stare at a spinner, whereas a batch run just takes longer.
+
+`ScheduledTransport` wraps an `AsyncGeminiTransport` for one priority; with
+GEMINI_RPM and/or GEMINI_TPM set, `scheduled()` wraps every transport in
+the process around one shared scheduler.
+
+This is a sliding-window log rather than a token bucket: a bucket big
+enough to allow bursts lets up to twice the limit through in some minute,
+whereas the log admits exactly what the API's own per-minute window does.
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import Counter, deque
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import AsyncIterator
+
+import httpx
+
+from sse import chunk_text
+from transport import RETRY_STATUSES, AsyncGeminiTransport, encode_json
+
+# Requests reach the API a little after they are admitted, so its window
+# for one ends a little later than ours: count them for this much longer.
+SLACK = 0.01
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+class Overloaded(Exception):
+    """A request shed by the scheduler."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+@dataclass(slots=True)
+class Grant:
+    """One admitted request, as counted against the window."""
+
+    at: float
+    tokens: int
+
+
+class QuotaScheduler:
+    """Admits requests within `rpm` requests and `tpm` tokens per `window`
+    seconds (either limit may be None)."""
+
+    def __init__(
+        self,
+        rpm: int | None = None,
+        tpm: int | None = None,
+        max_queue: int = 1000,
+        max_wait: float = 30.0,
+        window: float = 60.0,
+    ):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.window = window
+        self._span = window * (1 + SLACK)
+        self.output_tokens = 256.0  # running average of candidatesTokenCount
+        self._log: deque[Grant] = deque()
+        self._tokens = 0  # sum over _log
+        self._paused_until = 0.0
+        # [priority, seq, estimate, queued at, future]
+        self._queue: list[list] = []
+        self._seq = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+        # Metrics
+        self.waiting: Counter[Priority] = Counter()
+        self.admitted: Counter[Priority] = Counter()
+        self.shed: Counter[Priority] = Counter()
+        self.throttled = 0  # 429s that came back from upstream anyway
+        self._waits: dict[Priority, deque[float]] = {
+            p: deque(maxlen=1000) for p in Priority
+        }
+
+    @classmethod
+    def from_env(cls) -> "QuotaScheduler | None":
+        """From GEMINI_RPM / GEMINI_TPM; None if neither is set."""
+        rpm = os.environ.get("GEMINI_RPM")
+        tpm = os.environ.get("GEMINI_TPM")
+        if not rpm and not tpm:
+            return None
+        return cls(int(rpm) if rpm else None, int(tpm) if tpm else None)
+
+    def estimate(self, body_bytes: int) -> int:
+        """Tokens a request is likely to cost: prompt plus an average answer."""
+        return body_bytes // 4 + round(self.output_tokens)
+
+    async def acquire(self, priority: Priority, estimate: int) -> Grant:
+        """Wait for room in the window. Raises Overloaded if shed."""
+        if self.tpm:
+            estimate = min(estimate, self.tpm)
+        now = time.monotonic()
+        self._expire(now)
+        queued = sum(self.waiting.values())
+        if not queued and self._fits(estimate, now):
+            return self._admit(priority, estimate, now, now)
+        if queued >= self.max_queue:
+            self.shed[priority] += 1
+            raise Overloaded("Scheduler queue is full", self.max_wait)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, [priority, next(self._seq), estimate, now, future])
+        self.waiting[priority] += 1
+        self._dispatch()
+        try:
+            timeout = self.max_wait if priority is Priority.INTERACTIVE else None
+            return await asyncio.wait_for(future, timeout)
+        except TimeoutError:
+            self.shed[priority] += 1
+            raise Overloaded(
+                f"Waited {self.max_wait:g}s for quota", self._retry_after()
+            ) from None
+        finally:
+            if future.cancelled():  # timed out, or the caller went away
+                self.waiting[priority] -= 1
+
+    def settle(
+        self, grant: Grant, usage: dict | None, retry_after: float | None = None
+    ) -> None:
+        """Correct a grant from the reply's `usageMetadata`. `retry_after` is
+        set when upstream answered 429 regardless: everyone waits that long."""
+        now = time.monotonic()
+        self._expire(now)
+        if retry_after is not None:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, now + retry_after)
+        if usage:
+            actual = usage.get("totalTokenCount", grant.tokens)
+            if grant.at > now - self._span:  # still in the log
+                self._tokens += actual - grant.tokens
+            grant.tokens = actual
+            if "candidatesTokenCount" in usage:
+                self.output_tokens += (
+                    usage["candidatesTokenCount"] - self.output_tokens
+                ) / 8
+        self._dispatch()
+
+    def stats(self) -> dict:
+        def wait(p: Priority) -> dict:
+            waits = sorted(self._waits[p])
+            if not waits:
+                return {}
+            return {
+                "p50_ms": round(waits[len(waits) // 2] * 1000, 1),
+                "p95_ms": round(waits[int(len(waits) * 0.95)] * 1000, 1),
+                "max_ms": round(waits[-1] * 1000, 1),
+            }
+
+        self._expire(time.monotonic())
+        return {
+            "requests_in_window": len(self._log),
+            "tokens_in_window": self._tokens,
+            "throttled": self.throttled,
+            **{
+                p.name.lower(): {
+                    "queued": self.waiting[p],
+                    "admitted": self.admitted[p],
+                    "shed": self.shed[p],
+                    "wait": wait(p),
+                }
+                for p in Priority
+            },
+        }
+
+    def _expire(self, now: float) -> None:
+        cutoff = now - self._span
+        while self._log and self._log[0].at <= cutoff:
+            self._tokens -= self._log.popleft().tokens
+
+    def _fits(self, estimate: int, now: float) -> bool:
+        return (
+            now >= self._paused_until
+            and (self.rpm is None or len(self._log) < self.rpm)
+            and (self.tpm is None or self._tokens + estimate <= self.tpm)
+        )
+
+    def _admit(
+        self, priority: Priority, estimate: int, queued: float, now: float
+    ) -> Grant:
+        grant = Grant(now, estimate)
+        self._log.append(grant)
+        self._tokens += estimate
+        self.admitted[priority] += 1
+        self._waits[priority].append(now - queued)
+        return grant
+
+    def _dispatch(self) -> None:
+        """Admit waiting requests in order while they fit, then sleep until
+        enough of the window has expired for the next one."""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        self._expire(now)
+        while self._queue:
+            priority, _, estimate, queued, future = self._queue[0]
+            if future.done():  # shed or abandoned
+                heapq.heappop(self._queue)
+                continue
+            if not self._fits(estimate, now):
+                delay = self._opening(estimate) - now
+                loop = asyncio.get_running_loop()
+                self._timer = loop.call_later(max(delay, 0.001), self._dispatch)
+                return
+            heapq.heappop(self._queue)
+            self.waiting[priority] -= 1
+            future.set_result(self._admit(priority, estimate, queued, now))
+
+    def _opening(self, estimate: int) -> float:
+        """When a request of `estimate` tokens fits, if nothing else changes."""
+        at = self._paused_until
+        if self.rpm is not None and len(self._log) >= self.rpm:
+            at = max(at, self._log[len(self._log) - self.rpm].at + self._span)
+        if self.tpm is not None:
+            excess = self._tokens + estimate - self.tpm
+            for grant in self._log:
+                if excess <= 0:
+                    break
+                excess -= grant.tokens
+                at = max(at, grant.at + self._span)
+        return at
+
+    def _retry_after(self) -> float:
+        if not self._queue:
+            return 1.0
+        return max(1.0, self._opening(self._queue[0][2]) - time.monotonic())
+
+
+class _MeteredStream(httpx.AsyncByteStream):
+    """Passes an upstream body through, picking out its `usageMetadata`."""
+
+    def __init__(self, upstream: httpx.Response):
+        self.upstream = upstream
+        self.usage: dict | None = None
+        self._tail = b""
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self.upstream.aiter_bytes():
+            lines = (self._tail + chunk).split(b"\n")
+            self._tail = lines.pop()
+            for line in lines:
+                if b'"usageMetadata"' in line:
+                    _, usage = chunk_text(line.decode().rstrip("\r"))
+                    self.usage = usage or self.usage
+            yield chunk
+
+    async def aclose(self) -> None:
+        await self.upstream.aclose()
+
+
+def _decoded_headers(upstream: httpx.Response) -> list[tuple[str, str]]:
+    """`upstream`'s headers for a copy of its already decoded body: no
+    Content-Encoding to decode a second time, no Content-Length to check."""
+    return [
+        (name, value)
+        for name, value in upstream.headers.multi_items()
+        if name not in ("content-encoding", "content-length")
+    ]
+
+
+def _shed(request: httpx.Request, e: Overloaded) -> httpx.Response:
+    message = f"{e} (shed locally to stay within quota)"
+    return httpx.Response(
+        429,
+        headers={"Retry-After": str(round(e.retry_after))},
+        json={"error": {"code": 429, "message": message}},
+        request=request,
+    )
+
+
+def _retry_after(resp: httpx.Response) -> float | None:
+    if resp.status_code != 429:
+        return None
+    try:
+        return float(resp.headers.get("retry-after", 1))
+    except ValueError:
+        return 1.0
+
+
+class ScheduledTransport:
+    """`AsyncGeminiTransport` stand-in whose generation requests go through a
+    `QuotaScheduler` at one priority.
+
+    It takes over `transport`'s retries, so that each attempt of a stream is
+    admitted (and counted against the window) on its own.
+    """
+
+    def __init__(
+        self,
+        transport: AsyncGeminiTransport,
+        scheduler: QuotaScheduler,
+        priority: Priority = Priority.INTERACTIVE,
+    ):
+        self.transport = transport
+        self.scheduler = scheduler
+        self.priority = priority
+        self.max_retries, transport.max_retries = transport.max_retries, 0
+
+    @property
+    def url(self) -> str:
+        return self.transport.url
+
+    @property
+    def api_root(self) -> str:
+        return self.transport.api_root
+
+    @property
+    def model(self) -> str:
+        return self.transport.model
+
+    async def __aenter__(self) -> "ScheduledTransport":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+    async def warm(self) -> None:
+        await self.transport.warm()
+
+    async def call(
+        self, method: str, path: str, body: dict | None = None, **params: str
+    ) -> httpx.Response:
+        """Generation calls (e.g. history summaries) are scheduled; the rest,
+        such as `cachedContents`, don't count against the quota."""
+        if not path.endswith(":generateContent"):
+            return await self.transport.call(method, path, body, **params)
+        estimate = self.scheduler.estimate(len(encode_json(body or {})))
+        try:
+            grant = await self.scheduler.acquire(self.priority, estimate)
+        except Overloaded as e:
+            return _shed(httpx.Request(method, f"{self.api_root}/{path}"), e)
+        resp = await self.transport.call(method, path, body, **params)
+        usage = resp.json().get("usageMetadata") if resp.status_code == 200 else None
+        self.scheduler.settle(grant, usage, _retry_after(resp))
+        return resp
+
+    @asynccontextmanager
+    async def stream(
+        self, body: dict | bytes, trace=None
+    ) -> AsyncIterator[httpx.Response]:
+        """`AsyncGeminiTransport.stream`, retrying the same way, but with
+        every attempt waiting for the scheduler."""
+        size = len(body) if isinstance(body, bytes) else len(encode_json(body))
+        attempt = 0
+        while True:
+            try:
+                grant = await self.scheduler.acquire(
+                    self.priority, self.scheduler.estimate(size)
+                )
+            except Overloaded as e:
+                yield _shed(httpx.Request("POST", self.url), e)
+                return
+
+            metered = retry_after = None
+            async with AsyncExitStack() as attempts:
+                try:
+                    try:
+                        upstream = await attempts.enter_async_context(
+                            self.transport.stream(body, trace)
+                        )
+                    except httpx.TransportError:
+                        if attempt >= self.max_retries:
+                            raise
+                        delay = self.transport.retry_delay(attempt)
+                    else:
+                        retry_after = _retry_after(upstream)
+                        if upstream.status_code == 200:
+                            metered = _MeteredStream(upstream)
+                            yield httpx.Response(
+                                200,
+                                headers=_decoded_headers(upstream),
+                                stream=metered,
+                                request=upstream.request,
+                            )
+                            return
+                        if (
+                            upstream.status_code not in RETRY_STATUSES
+                            or attempt >= self.max_retries
+                        ):
+                            yield upstream
+                            return
+                        delay = self.transport.retry_delay(attempt, upstream)
+                finally:
+                    usage = metered.usage if metered else None
+                    self.scheduler.settle(grant, usage, retry_after)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+_shared: QuotaScheduler | None = None
+
+
+def shared_scheduler() -> QuotaScheduler | None:
+    """The process-wide scheduler configured by GEMINI_RPM / GEMINI_TPM."""
+    global _shared
+    if _shared is None:
+        _shared = QuotaScheduler.from_env()
+    return _shared
+
+
+def scheduled(
+    transport: AsyncGeminiTransport,
+    priority: Priority = Priority.INTERACTIVE,
+    scheduler: QuotaScheduler | None = None,
+) -> AsyncGeminiTransport | ScheduledTransport:
+    """Wrap `transport` in `scheduler` (default: the shared one) at
+    `priority`; returned as is when there is no scheduler."""
+    scheduler = scheduler or shared_scheduler()
+    if scheduler is None:
+        return transport
+    return ScheduledTransport(transport, scheduler, priority)
@@ -0,0 +1,696 @@
+"""Press conferences as a service: many sessions over one upstream transport.
+
+    GEMINI_BASE_URL=http://127.0.0.1:8765/v1beta python server.py --port 8080
+
+With `--hedge-base-url` and/or `--hedge-model`, questions whose first token
+is late are also asked of that endpoint, and the faster answer is used (see
+hedging.py).
+
+A session is created from a scenario key or an uploaded GameState, then
+driven with plain HTTP (built on httpserver.py):
+
+    POST   /sessions                 {"scenario": "1"} or {"state": {...}}
+    GET    /sessions/<id>/question   SSE: `delta` events, then `question`
+                                     (and `end` once the conference is over)
+    POST   /sessions/<id>/answer     {"text": "..."}
+    GET    /sessions/<id>            transcript and whose turn it is
+    DELETE /sessions/<id>
+    GET    /scenarios, GET /stats
+
+A question runs to completion even if its client disconnects; asking again
+while an answer is awaited replays it, so a client that loses the stream
+just reconnects. Other requests for the session meanwhile get a 409.
+
+Sessions hold a frozen (interned) GameState, so every session started from
+the same scenario shares one copy, plus the `contents` history; the system
+prompt is rebuilt from the section cache for each turn. Every change is
+saved to a session store (`--store`, see sessions.py), by default an SQLite
+file, so the server keeps no state of its own beyond a cache: at most
+`max_live` sessions stay decoded in memory, none idle for more than
+`idle_timeout` seconds. Stored sessions not saved for `--session-ttl`
+seconds (a day, by default) are deleted at startup and every so often.
+
+That lets `--workers N` fork N processes that share the listening socket
+and the store, any of which serves any session's next turn (several hosts
+would need a store they can all reach). A turn saved over one another
+worker has just saved loses: a question is replaced by the one already
+asked, an answer gets a 409. A question being streamed only blocks other
+requests for its session (the 409 above) on the same worker. A session
+saved by a worker whose models differ (mid-deploy) gets a 503 and is left
+as it is for a worker that can read it.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import secrets
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import time
+import traceback
+import warnings
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import httpx
+
+import codec
+from engine import (
+    OPENING_MESSAGE,
+    APIError,
+    Conference,
+    RequestEncoder,
+    stream_question,
+)
+from hedging import HedgePolicy, hedged
+from httpserver import Request, Response, serve, server_url
+from models import GameState, freeze
+from packs import ScenarioError, build_state, load_scenarios
+from prompts import build_system_prompt
+from scheduler import QuotaScheduler, scheduled, shared_scheduler
+from sessions import SessionBackend, SessionRecord, VersionConflict, open_backend
+from transcripts import fingerprint
+from transport import GEMINI_BASE_URL, GEMINI_MODEL, AsyncGeminiTransport, gemini_url
+
+SESSION_PATH = re.compile(r"^/sessions/([A-Za-z0-9_-]{16})(/question|/answer)?$")
+
+# Never mutated (history is only appended to), so shared by every session.
+_OPENING = {"role": "user", "parts": [{"text": OPENING_MESSAGE}]}
+
+
+@dataclass(slots=True)
+class Session:
+    id: str
+    state: GameState  # frozen
+    contents: list[dict] = field(default_factory=lambda: [_OPENING])
+    finished: bool = False
+    touched: float = 0.0
+    fingerprint: str = ""  # of the system prompt it started with
+    snapshot: bytes = field(default=b"", repr=False)  # codec.encode(state)
+    version: int = 0  # in the store, as last read or saved
+    encoder: RequestEncoder = field(default_factory=RequestEncoder, repr=False)
+
+    @property
+    def awaiting(self) -> str:
+        """Whose turn it is: "question", "answer" or "nothing" (finished)."""
+        if self.finished:
+            return "nothing"
+        return "answer" if self.contents[-1]["role"] == "model" else "question"
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "club": self.state.club.name,
+            "conference_type": self.state.conference_type.value,
+            "awaiting": self.awaiting,
+            "finished": self.finished,
+            "contents": self.contents,
+        }
+
+
+class SessionUnavailable(Exception):
+    """A stored session this build can't read (see `SessionStore._load`)."""
+
+
+class SessionStore:
+    """Sessions in a `SessionBackend` (see sessions.py), the most recently
+    used of them kept decoded in memory.
+
+    The backend holds every session and is written to on every change, so
+    a worker's copy is only ever a cache: it is used while its version is
+    still the backend's, and read again otherwise. At most `max_live` are
+    kept, none idle for longer than `idle_timeout` seconds. Sessions not
+    saved for `ttl` seconds are deleted from the backend by `expire`.
+    """
+
+    def __init__(
+        self,
+        backend: SessionBackend,
+        max_live: int = 1000,
+        idle_timeout: float = 300.0,
+        ttl: float | None = 86400.0,
+    ):
+        self.backend = backend
+        self.max_live = max_live
+        self.idle_timeout = idle_timeout
+        self.ttl = ttl
+        self.busy: set[str] = set()  # mid-turn here: never dropped
+        self.loads = self.saves = self.conflicts = self.dropped = self.expired = 0
+        self.prompt_changes = self.unreadable = 0
+        self._live: OrderedDict[str, Session] = OrderedDict()
+
+    async def create(self, state: GameState) -> Session:
+        state = freeze(state)
+        session = Session(
+            secrets.token_urlsafe(12),
+            state,
+            fingerprint=fingerprint(build_system_prompt(state)),
+            snapshot=codec.encode(state),
+        )
+        data = self._record(session, session.contents, session.finished)
+        session.version = await asyncio.to_thread(self.backend.insert, session.id, data)
+        self._add(session)
+        return session
+
+    async def get(self, session_id: str) -> Session | None:
+        version = await asyncio.to_thread(self.backend.version, session_id)
+        session = self._live.get(session_id)
+        if version is None:
+            self._live.pop(session_id, None)  # deleted by another worker
+            return None
+        if session is not None and session.version == version:
+            self._live.move_to_end(session_id)
+        else:
+            session = await self._load(session_id)
+            if session is None:
+                return None
+            self._add(session)
+        session.touched = time.monotonic()
+        return session
+
+    async def save(
+        self, session: Session, contents: list[dict], finished: bool
+    ) -> None:
+        """Store `contents` and `finished` as the next version of `session`,
+        then update it to match. If that fails (VersionConflict if it was
+        saved elsewhere since it was read), `session` is left as it was and
+        dropped, since this copy may no longer be the stored one."""
+        data = self._record(session, contents, finished)
+        try:
+            version = await asyncio.to_thread(
+                self.backend.save, session.id, data, session.version
+            )
+        except Exception as e:
+            self.conflicts += isinstance(e, VersionConflict)
+            if self._live.get(session.id) is session:
+                del self._live[session.id]
+            raise
+        session.contents, session.finished = contents, finished
+        session.version = version
+        self.saves += 1
+
+    async def delete(self, session_id: str) -> bool:
+        self._live.pop(session_id, None)
+        return await asyncio.to_thread(self.backend.delete, session_id)
+
+    def sweep(self) -> int:
+        """Drop sessions idle for longer than `idle_timeout` from memory.
+        Returns how many."""
+        cutoff = time.monotonic() - self.idle_timeout
+        dropped = 0
+        for session in list(self._live.values()):
+            if session.touched >= cutoff:
+                break  # the rest were used more recently
+            if session.id not in self.busy:
+                self._drop(session)
+                dropped += 1
+        return dropped
+
+    async def sweep_forever(self) -> None:
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_timeout / 4))
+            self.sweep()
+
+    async def expire(self) -> int:
+        """Delete stored sessions not saved for `ttl` seconds, wherever they
+        were played. Returns how many."""
+        if not self.ttl:
+            return 0
+        before = time.time() - self.ttl
+        expired = await asyncio.to_thread(self.backend.expire, before)
+        self.expired += expired
+        return expired
+
+    async def expire_forever(self) -> None:
+        """`expire` now, then every tenth of `ttl` (and at least hourly)."""
+        while self.ttl:
+            try:
+                await self.expire()
+            except Exception as e:  # e.g. the database stayed locked: next time
+                warnings.warn(f"Couldn't expire sessions: {e}", stacklevel=2)
+            await asyncio.sleep(min(max(1.0, self.ttl / 10), 3600.0))
+
+    def close(self) -> None:
+        self.backend.close()
+
+    async def stats(self) -> dict:
+        return {
+            "live": len(self._live),
+            "stored": await asyncio.to_thread(len, self.backend),
+            "busy": len(self.busy),
+            "loads": self.loads,
+            "saves": self.saves,
+            "conflicts": self.conflicts,
+            "dropped": self.dropped,
+            "expired": self.expired,
+            "prompt_changes": self.prompt_changes,
+            "unreadable": self.unreadable,
+        }
+
+    def _add(self, session: Session) -> None:
+        session.touched = time.monotonic()
+        self._live[session.id] = session
+        if len(self._live) > self.max_live:
+            for oldest in list(self._live.values()):
+                if len(self._live) <= self.max_live:
+                    break
+                if oldest.id not in self.busy and oldest is not session:
+                    self._drop(oldest)
+
+    def _drop(self, session: Session) -> None:
+        del self._live[session.id]
+        self.dropped += 1
+
+    @staticmethod
+    def _record(session: Session, contents: list[dict], finished: bool) -> bytes:
+        return SessionRecord(
+            session.snapshot, session.fingerprint, contents, finished
+        ).encode()
+
+    async def _load(self, session_id: str) -> Session | None:
+        found = await asyncio.to_thread(self.backend.load, session_id)
+        if found is None:
+            return None
+        version, data = found
+        try:
+            record = SessionRecord.decode(data)
+            state = codec.decode(record.snapshot, frozen=True)
+        except codec.SchemaMismatch as e:
+            # Saved by a worker on other models (mid-deploy, say), which may
+            # still be serving it: not ours to read, nor to throw away.
+            self.unreadable += 1
+            raise SessionUnavailable(session_id) from e
+        except (struct.error, ValueError, KeyError) as e:  # CodecError included
+            warnings.warn(f"Dropping session {session_id}: {e}", stacklevel=2)
+            await asyncio.to_thread(self.backend.delete, session_id)
+            return None
+        self.loads += 1
+        if fingerprint(build_system_prompt(state)) != record.fingerprint:
+            # Started by a worker running other prompt code (mid-deploy,
+            # say): carried on with ours, but worth knowing about.
+            self.prompt_changes += 1
+        return Session(
+            session_id,
+            state,
+            record.contents,
+            record.finished,
+            fingerprint=record.fingerprint,
+            snapshot=record.snapshot,
+            version=version,
+        )
+
+
+def sse_event(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+async def error(response: Response, status: int, message: str) -> None:
+    await response.send_json(status, {"error": {"code": status, "message": message}})
+
+
+async def unavailable(response: Response) -> None:
+    """For a session saved by another build of the server: one of those
+    workers (or, after the deploy, any) can serve it."""
+    message = "Session saved by another server version; retry shortly"
+    await response.send_json(
+        503,
+        {"error": {"code": 503, "message": message}},
+        headers={"Retry-After": "5"},
+    )
+
+
+class PressServer:
+    """Request handler for the session API (see the module docstring)."""
+
+    def __init__(
+        self,
+        transport: AsyncGeminiTransport,
+        store: SessionStore,
+        scheduler: QuotaScheduler | None = None,
+        alternate: AsyncGeminiTransport | None = None,
+    ):
+        self.scheduler = scheduler or shared_scheduler()
+        self.hedging = HedgePolicy.from_env() if alternate else None
+        self.transport = hedged(
+            scheduled(transport, scheduler=self.scheduler),
+            alternate and scheduled(alternate, scheduler=self.scheduler),
+            self.hedging,
+        )
+        self.store = store
+        self.scenarios = load_scenarios()
+        self._frozen: dict[str, GameState] = {}  # scenario key -> frozen state
+        self._turns: set[asyncio.Task] = set()
+
+    async def __call__(self, request: Request, response: Response) -> None:
+        method, path = request.method, request.path
+        if method == "GET" and path == "/stats":
+            stats = {"sessions": await self.store.stats()}
+            if self.scheduler:
+                stats["scheduler"] = self.scheduler.stats()
+            if self.hedging:
+                stats["hedging"] = self.hedging.stats()
+            await response.send_json(200, stats)
+        elif method == "GET" and path == "/scenarios":
+            menu = {key: desc for key, (desc, _) in self.scenarios.items()}
+            await response.send_json(200, menu)
+        elif method == "POST" and path == "/sessions":
+            await self.create(request, response)
+        elif m := SESSION_PATH.match(path):
+            await self.session(request, response, *m.groups())
+        else:
+            await error(response, 404, "Not found")
+
+    def _scenario(self, key: str) -> GameState:
+        state = self._frozen.get(key)
+        if state is None:
+            _, factory = self.scenarios[key]
+            state = self._frozen[key] = freeze(factory())
+        return state
+
+    async def create(self, request: Request, response: Response) -> None:
+        try:
+            body = request.json() or {}
+        except ValueError:
+            await error(response, 400, "Body is not valid JSON")
+            return
+        if not isinstance(body, dict):
+            await error(response, 400, "Body is not a JSON object")
+            return
+        scenario = body.get("scenario")
+        try:
+            if "state" in body:
+                state = build_state(body["state"])
+            elif isinstance(scenario, str) and scenario in self.scenarios:
+                state = self._scenario(scenario)
+            else:
+                await error(response, 400, "Give a known `scenario` or a `state`")
+                return
+        except ScenarioError as e:
+            await error(response, 400, str(e))
+            return
+        session = await self.store.create(state)
+        await response.send_json(201, session.summary())
+
+    async def session(
+        self, request: Request, response: Response, session_id: str, action: str
+    ) -> None:
+        method = request.method
+        if method == "DELETE" and not action:
+            found = await self.store.delete(session_id)
+            await response.send(204 if found else 404)
+            return
+
+        try:
+            session = await self.store.get(session_id)
+        except SessionUnavailable:
+            await unavailable(response)
+            return
+        if session is None:
+            await error(response, 404, "No such session")
+        elif session_id in self.store.busy:
+            await error(response, 409, "A question is already streaming")
+        elif method == "GET" and not action:
+            await response.send_json(200, session.summary())
+        elif method == "GET" and action == "/question":
+            await self.question(session, response)
+        elif method == "POST" and action == "/answer":
+            await self.answer(session, request, response)
+        else:
+            await error(response, 405, "Method not allowed")
+
+    async def question(self, session: Session, response: Response) -> None:
+        await response.start(headers={"Cache-Control": "no-cache"})
+        if session.awaiting == "answer":
+            text = session.contents[-1]["parts"][0]["text"]
+            await response.write(sse_event("question", {"text": text}))
+        elif session.awaiting == "question":
+            session = await self._stream_turn(session, response)
+        if session.finished:
+            await response.write(sse_event("end", {}))
+        await response.end()
+
+    async def _stream_turn(self, session: Session, response: Response) -> Session:
+        """Ask the next question. Returns the session as it now stands."""
+        deltas: asyncio.Queue[str | None] = asyncio.Queue()
+        # The turn runs on its own: if the client goes away it still
+        # finishes (its tokens are paid for) and is replayed on reconnect.
+        self.store.busy.add(session.id)
+        turn = asyncio.create_task(self._ask(session, deltas.put_nowait))
+        self._turns.add(turn)
+
+        def done(task: asyncio.Task) -> None:
+            self._turns.discard(task)
+            self.store.busy.discard(session.id)
+            deltas.put_nowait(None)
+            if not task.cancelled():
+                task.exception()  # retrieved here if the client has gone
+
+        turn.add_done_callback(done)
+        while (text := await deltas.get()) is not None:
+            await response.write(sse_event("delta", {"text": text}))
+        try:
+            text = turn.result()
+        except APIError as e:
+            failure = {"code": e.status_code, "message": e.body}
+        except httpx.HTTPError as e:
+            failure = {"code": 502, "message": f"Upstream: {e!r}"}
+        except VersionConflict:
+            # Another worker asked it first: theirs is the question.
+            try:
+                current = await self.store.get(session.id)
+            except SessionUnavailable:
+                current = None  # and by a worker on another version
+            if current is not None and current.awaiting != "question":
+                if current.awaiting == "answer":
+                    text = current.contents[-1]["parts"][0]["text"]
+                    await response.write(sse_event("question", {"text": text}))
+                return current
+            failure = {"code": 409, "message": "The session changed meanwhile"}
+        else:
+            await response.write(sse_event("question", {"text": text}))
+            return session
+        await response.write(sse_event("error", failure))
+        return session
+
+    async def _ask(self, session: Session, on_text) -> str:
+        # On a copy of the history: the session only changes once it's saved.
+        conference = Conference(
+            build_system_prompt(session.state),
+            list(session.contents),
+            encoder=session.encoder,
+        )
+        text = await stream_question(self.transport, conference, on_text)
+        # Only a complete question joins the history.
+        conference.add_question(text)
+        await self.store.save(session, conference.contents, conference.finished)
+        return text
+
+    async def answer(
+        self, session: Session, request: Request, response: Response
+    ) -> None:
+        if session.awaiting != "answer":
+            await error(response, 409, f"Not expecting an answer ({session.awaiting})")
+            return
+        try:
+            text = (request.json() or {}).get("text")
+        except (ValueError, AttributeError):
+            text = None
+        if not isinstance(text, str) or not text.strip():
+            await error(response, 400, 'Give the answer as {"text": "..."}')
+            return
+        contents = [*session.contents, {"role": "user", "parts": [{"text": text}]}]
+        try:
+            await self.store.save(session, contents, session.finished)
+        except VersionConflict:
+            await error(response, 409, "The session changed meanwhile; fetch it")
+            return
+        await response.send_json(200, {"awaiting": session.awaiting})
+
+
+def session_dir() -> Path:
+    """FMPSC_SESSION_DIR, else a directory under the system temp dir."""
+    path = os.environ.get("FMPSC_SESSION_DIR")
+    return Path(path) if path else Path(tempfile.gettempdir()) / "fmpsc-sessions"
+
+
+def session_store() -> str:
+    """FMPSC_SESSION_STORE, else an SQLite file in `session_dir()`."""
+    url = os.environ.get("FMPSC_SESSION_STORE")
+    return url or f"sqlite://{session_dir() / 'sessions.sqlite'}"
+
+
+def run_workers(count: int, sock: socket.socket, work) -> None:
+    """Run `work(sock)` in `count` forked processes that share the listening
+    socket, each taking the connections it accepts, until they exit.
+    SIGINT or SIGTERM stops them all."""
+    pids = []
+    for _ in range(count):
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                signal.signal(signal.SIGTERM, signal.default_int_handler)
+                work(sock)
+                status = 0
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(status)
+        pids.append(pid)
+    sock.close()
+
+    def stop(signum, frame):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--base-url", default=GEMINI_BASE_URL)
+    parser.add_argument("--model", default=GEMINI_MODEL)
+    parser.add_argument("--max-connections", type=int, default=64)
+    parser.add_argument(
+        "--hedge-base-url",
+        default=os.environ.get("GEMINI_HEDGE_BASE_URL"),
+        help="hedge late first tokens to this endpoint (default: "
+        "GEMINI_HEDGE_BASE_URL; --base-url if only --hedge-model is given)",
+    )
+    parser.add_argument(
+        "--hedge-model",
+        default=os.environ.get("GEMINI_HEDGE_MODEL"),
+        help="hedge late first tokens to this model (default: GEMINI_HEDGE_MODEL)",
+    )
+    parser.add_argument(
+        "--store",
+        default=session_store(),
+        metavar="URL",
+        help="where sessions are kept: sqlite:///<path> or memory: (default: "
+        "FMPSC_SESSION_STORE, else sessions.sqlite in FMPSC_SESSION_DIR or a "
+        "temp dir)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="worker processes sharing the port (and --store, which must not "
+        "be memory: then)",
+    )
+    parser.add_argument(
+        "--max-live", type=int, default=1000, help="sessions kept in memory"
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=300.0,
+        metavar="SECONDS",
+        help="drop sessions idle for this long from memory",
+    )
+    parser.add_argument(
+        "--session-ttl",
+        type=float,
+        default=86400.0,
+        metavar="SECONDS",
+        help="delete stored sessions not played for this long (default: a day; "
+        "0 keeps them forever)",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=int,
+        default=os.environ.get("GEMINI_RPM"),
+        help="requests per minute to stay within (default: GEMINI_RPM)",
+    )
+    parser.add_argument(
+        "--tpm",
+        type=int,
+        default=os.environ.get("GEMINI_TPM"),
+        help="tokens per minute to stay within (default: GEMINI_TPM)",
+    )
+    args = parser.parse_args()
+
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        sys.exit("Set GEMINI_API_KEY environment variable first.")
+    if args.workers > 1 and args.store == "memory:":
+        sys.exit("Workers can't share a memory: store; give an SQLite one.")
+    if args.workers > 1 and not hasattr(os, "fork"):
+        sys.exit("--workers needs os.fork, which this platform lacks.")
+
+    async def run(sock: socket.socket | None = None):
+        backend = open_backend(args.store)
+        store = SessionStore(
+            backend, args.max_live, args.idle_timeout, args.session_ttl
+        )
+        transport = AsyncGeminiTransport(
+            api_key,
+            gemini_url(args.model, args.base_url),
+            max_connections=args.max_connections,
+        )
+        alternate = None
+        if args.hedge_base_url or args.hedge_model:
+            alternate = AsyncGeminiTransport(
+                os.environ.get("GEMINI_HEDGE_API_KEY", api_key),
+                gemini_url(
+                    args.hedge_model or args.model,
+                    args.hedge_base_url or args.base_url,
+                ),
+                max_connections=args.max_connections,
+            )
+        scheduler = None
+        if args.rpm or args.tpm:
+            # Each worker keeps to its share of the quota.
+            scheduler = QuotaScheduler(
+                args.rpm and max(1, args.rpm // args.workers),
+                args.tpm and max(1, args.tpm // args.workers),
+            )
+        handler = PressServer(transport, store, scheduler, alternate)
+        server = await serve(handler, args.host, args.port, sock=sock)
+        if sock is None:
+            print(f"Serving on {server_url(server)}", flush=True)
+        sweepers = [
+            asyncio.create_task(store.sweep_forever()),
+            asyncio.create_task(store.expire_forever()),
+        ]
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for sweeper in sweepers:
+                sweeper.cancel()
+            store.close()
+            await transport.aclose()
+            if alternate:
+                await alternate.aclose()
+
+    def work(sock: socket.socket | None = None) -> None:
+        try:
+            asyncio.run(run(sock))
+        except KeyboardInterrupt:
+            pass
+
+    if args.workers == 1:
+        work()
+        return
+    sock = socket.create_server((args.host, args.port), backlog=4096)
+    host, port = sock.getsockname()[:2]
+    print(f"Serving on http://{host}:{port}", flush=True)
+    run_workers(args.workers, sock, work)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Session state kept outside the server process, so any worker can serve it.
+
+A session is stored as a record: a codec.py snapshot of its GameState, the
+fingerprint of the system prompt it was started with (see transcripts.py)
+and its `contents` history, behind a version number. A save names the
+version it read and fails with `VersionConflict` if anyone has saved since,
+so two workers playing the same session can't lose each other's turns: the
+loser reads the session again and sees what the winner did.
+
+Backends, chosen by URL (`open_backend`):
+
+    memory:                 this process only (one worker, or a test)
+    sqlite:///path/to.db    shared by every worker on the host
+    /path/to.db             the same
+
+A backend only maps a session id to (version, bytes) and when it was last
+saved, so another one (a Redis hash and a compare-and-set script, say)
+needs nothing more.
+"""
+
+import json
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Protocol
+
+# Record: snapshot length, codec snapshot, then the rest as JSON.
+RECORD = struct.Struct("<I")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY, version INTEGER NOT NULL, data BLOB NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated);
+"""
+
+
+class VersionConflict(Exception):
+    """The session was saved (or deleted) by someone else since it was read."""
+
+
+@dataclass(slots=True)
+class SessionRecord:
+    snapshot: bytes
+    fingerprint: str
+    contents: list[dict]
+    finished: bool = False
+
+    def encode(self) -> bytes:
+        rest = {
+            "fingerprint": self.fingerprint,
+            "contents": self.contents,
+            "finished": self.finished,
+        }
+        data = json.dumps(rest, ensure_ascii=False, separators=(",", ":"))
+        return RECORD.pack(len(self.snapshot)) + self.snapshot + data.encode("utf-8")
+
+    @classmethod
+    def decode(cls, data: bytes) -> "SessionRecord":
+        """Raises ValueError (or struct.error) if `data` is not a record."""
+        (size,) = RECORD.unpack_from(data)
+        end = RECORD.size + size
+        if end > len(data):
+            raise ValueError("truncated session record")
+        rest = json.loads(data[end:])
+        return cls(
+            data[RECORD.size : end],
+            rest["fingerprint"],
+            rest["contents"],
+            rest["finished"],
+        )
+
+
+class SessionBackend(Protocol):
+    """Where session records live, each under a version starting at 1."""
+
+    def insert(self, session_id: str, data: bytes) -> int: ...
+
+    def version(self, session_id: str) -> int | None: ...
+
+    def load(self, session_id: str) -> tuple[int, bytes] | None: ...
+
+    def save(self, session_id: str, data: bytes, version: int) -> int:
+        """Replace the record if it is still at `version`; the new version.
+        Raises VersionConflict if not."""
+        ...
+
+    def delete(self, session_id: str) -> bool: ...
+
+    def expire(self, before: float) -> int:
+        """Delete the records last saved before `before` (a `time.time()`);
+        how many."""
+        ...
+
+    def __len__(self) -> int: ...
+
+    def close(self) -> None: ...
+
+
+class MemoryBackend:
+    """Records in a dict: a stand-in for a shared store within one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records: dict[str, tuple[int, bytes]] = {}
+        self._updated: dict[str, float] = {}
+
+    def insert(self, session_id: str, data: bytes) -> int:
+        with self._lock:
+            self._records[session_id] = (1, data)
+            self._updated[session_id] = time.time()
+        return 1
+
+    def version(self, session_id: str) -> int | None:
+        record = self._records.get(session_id)
+        return record[0] if record else None
+
+    def load(self, session_id: str) -> tuple[int, bytes] | None:
+        return self._records.get(session_id)
+
+    def save(self, session_id: str, data: bytes, version: int) -> int:
+        with self._lock:
+            if self.version(session_id) != version:
+                raise VersionConflict(session_id)
+            self._records[session_id] = (version + 1, data)
+            self._updated[session_id] = time.time()
+        return version + 1
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            self._updated.pop(session_id, None)
+            return self._records.pop(session_id, None) is not None
+
+    def expire(self, before: float) -> int:
+        with self._lock:
+            expired = [s for s, at in self._updated.items() if at < before]
+            for session_id in expired:
+                del self._records[session_id], self._updated[session_id]
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteBackend:
+    """Records in an SQLite database that every worker on the host opens.
+
+    Each statement commits on its own and a save is a single conditional
+    UPDATE, so SQLite's write lock is all the coordination there is. WAL
+    mode keeps readers from waiting on a writer; with synchronous=NORMAL a
+    power cut may lose the last turns, but never corrupts the database.
+    Calls block (for up to `timeout` seconds on another worker's write
+    lock), so an event loop should make them from a thread; they take
+    turns on the one connection.
+    """
+
+    def __init__(self, path: str | Path, timeout: float = 10.0):
+        import sqlite3  # only needed once a store is opened
+
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            self.path, timeout=timeout, isolation_level=None, check_same_thread=False
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def _execute(self, sql: str, params: tuple = ()) -> tuple[int, tuple | None]:
+        """Rows changed and the first row returned."""
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            return cursor.rowcount, cursor.fetchone()
+
+    def insert(self, session_id: str, data: bytes) -> int:
+        self._execute(
+            "INSERT INTO sessions VALUES (?, 1, ?, ?)", (session_id, data, time.time())
+        )
+        return 1
+
+    def version(self, session_id: str) -> int | None:
+        _, row = self._execute(
+            "SELECT version FROM sessions WHERE id = ?", (session_id,)
+        )
+        return row[0] if row else None
+
+    def load(self, session_id: str) -> tuple[int, bytes] | None:
+        _, row = self._execute(
+            "SELECT version, data FROM sessions WHERE id = ?", (session_id,)
+        )
+        return row
+
+    def save(self, session_id: str, data: bytes, version: int) -> int:
+        updated, _ = self._execute(
+            "UPDATE sessions SET version = version + 1, data = ?, updated = ?"
+            " WHERE id = ? AND version = ?",
+            (data, time.time(), session_id, version),
+        )
+        if updated == 0:
+            raise VersionConflict(session_id)
+        return version + 1
+
+    def delete(self, session_id: str) -> bool:
+        deleted, _ = self._execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        return deleted > 0
+
+    def expire(self, before: float) -> int:
+        deleted, _ = self._execute("DELETE FROM sessions WHERE updated < ?", (before,))
+        return deleted
+
+    def __len__(self) -> int:
+        return self._execute("SELECT COUNT(*) FROM sessions")[1][0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def open_backend(url: str) -> SessionBackend:
+    """The backend for `url`: "memory:", "sqlite:///<path>" or a plain path."""
+    if url == "memory:":
+        return MemoryBackend()
+    if url.startswith("sqlite://"):
+        return SQLiteBackend(url.removeprefix("sqlite://"))
+    if "://" in url:
+        raise ValueError(f"No session backend for {url!r}")
+    return SQLiteBackend(url)
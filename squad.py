@@ -0,0 +1,146 @@
+"""Newsworthiness ranking for large squads.
+
+A full FM export has 40-60 senior players plus loanees; listing them all in
+every request wastes input tokens on players nobody will ask about. Players
+are scored on what makes them newsworthy (captaincy, star status, bad
+morale, transfer rumours, injuries to key players, goal involvement, being
+named in the match events or transfer news), weighted for the conference
+type, and `select` keeps the best of them within a token budget.
+
+Mentions are found through a surname index, so ranking stays linear in the
+squad size plus the length of the news text, however big the database.
+"""
+
+import heapq
+import re
+from collections import defaultdict
+
+from models import ConferenceType, GameState, Player, PlayerMorale
+
+# Position codes by line, for summarising the players left out.
+POSITION_GROUPS = {
+    "GK": "GK",
+    **dict.fromkeys(("CB", "RB", "LB", "RWB", "LWB", "SW", "D", "DF"), "DF"),
+    **dict.fromkeys(("DM", "CDM", "CM", "AM", "CAM", "LM", "RM", "M", "MF"), "MF"),
+    **dict.fromkeys(("ST", "CF", "LW", "RW", "SS", "F", "FW"), "FW"),
+}
+
+FEATURES = {
+    "captain": 3.0,
+    "star": 3.0,
+    "morale": 2.0,  # unhappy; furious counts 1.5x
+    "rumour": 2.0,
+    "injured": 1.0,
+    "key_injury": 3.0,
+    "involvement": 0.3,  # per goal or assist, capped at 10
+    "mentioned": 5.0,
+}
+
+# What each kind of conference is about, as multipliers on FEATURES.
+EMPHASIS: dict[ConferenceType, dict[str, float]] = {
+    ConferenceType.PRE_MATCH: {"injured": 1.5, "key_injury": 1.5},
+    ConferenceType.POST_MATCH: {"mentioned": 1.5, "involvement": 2.0},
+    ConferenceType.TRANSFER_WINDOW: {"rumour": 2.0, "mentioned": 1.5},
+    ConferenceType.CRISIS: {"morale": 1.5, "captain": 1.5},
+    ConferenceType.BIG_SIGNING: {"rumour": 1.5, "mentioned": 2.0},
+    ConferenceType.RIVALRY_PREVIEW: {"star": 1.5, "key_injury": 1.5},
+}
+
+WORD = re.compile(r"[\w'’-]+")
+
+
+def _news(state: GameState) -> str:
+    """Free text that can name players: match events and transfer news."""
+    texts = []
+    if state.post_match:
+        texts += state.post_match.notable_events
+    if state.transfer:
+        t = state.transfer
+        texts += [*t.incoming, *t.outgoing, *t.rumoured, t.new_signing or ""]
+    return "\n".join(texts).lower()
+
+
+def mentioned(squad: list[Player], text: str) -> set[int]:
+    """Indexes of players named in `text` (lowercase), by surname or, where
+    a surname is shared, by full name."""
+    if not text:
+        return set()
+    by_surname: dict[str, list[int]] = defaultdict(list)
+    for i, p in enumerate(squad):
+        names = p.name.lower().split()
+        if names:  # a blank name can't be mentioned
+            by_surname[names[-1]].append(i)
+    found = set()
+    for word in set(WORD.findall(text)):
+        candidates = by_surname.get(word)
+        if not candidates:
+            continue
+        if len(candidates) == 1:
+            found.add(candidates[0])
+        else:
+            found.update(i for i in candidates if squad[i].name.lower() in text)
+    return found
+
+
+def newsworthiness(state: GameState) -> list[float]:
+    """A score per squad member, in squad order."""
+    weights = dict(FEATURES)
+    for feature, factor in EMPHASIS.get(state.conference_type, {}).items():
+        weights[feature] *= factor
+
+    injuries = {inj.player_name: inj for inj in state.injuries}
+    named = mentioned(state.squad, _news(state))
+    scores = []
+    for i, p in enumerate(state.squad):
+        score = 0.0
+        if p.is_captain:
+            score += weights["captain"]
+        if p.is_star_player:
+            score += weights["star"]
+        if p.morale is PlayerMorale.UNHAPPY:
+            score += weights["morale"]
+        elif p.morale is PlayerMorale.FURIOUS:
+            score += weights["morale"] * 1.5
+        if p.transfer_rumour:
+            score += weights["rumour"]
+        injury = injuries.get(p.name)
+        if injury:
+            score += weights["key_injury" if injury.is_key_player else "injured"]
+        score += weights["involvement"] * min(p.goals + p.assists, 10)
+        if i in named:
+            score += weights["mentioned"]
+        scores.append(score)
+    return scores
+
+
+def select(state: GameState, costs: list[int], budget: int, limit: int) -> list[int]:
+    """Indexes (in squad order) of the players to list, given the token cost
+    of each one's line: everyone if they fit in `budget` tokens, else the
+    most newsworthy that fit, at most `limit` of them."""
+    if sum(costs) <= budget and len(costs) <= limit:
+        return list(range(len(costs)))
+
+    scores = newsworthiness(state)
+    # Ties go to the player listed first (squad order is usually FM's own).
+    ranked = heapq.nlargest(limit, range(len(scores)), key=lambda i: (scores[i], -i))
+    chosen = []
+    spent = 0
+    for i in ranked:
+        if spent + costs[i] <= budget:
+            chosen.append(i)
+            spent += costs[i]
+    return sorted(chosen)
+
+
+def summarise(players: list[Player]) -> str:
+    """One line describing the players not listed."""
+    groups: dict[str, int] = defaultdict(int)
+    for p in players:
+        groups[POSITION_GROUPS.get(p.position.upper(), "other")] += 1
+    order = ["GK", "DF", "MF", "FW", "other"]
+    counts = ", ".join(f"{groups[g]} {g}" for g in order if groups[g])
+    ages = [p.age for p in players]
+    return (
+        f"- …and {len(players)} other squad players "
+        f"({counts}; aged {min(ages)}-{max(ages)})"
+    )
@@ -0,0 +1,205 @@
+"""Incremental parser for Gemini's `alt=sse` stream of one journalist turn.
+
+Text is accumulated in chunks (joined once at the end) and the stream is
+watched for the two signs that the turn is over before the server says so:
+the `[END OF PRESS CONFERENCE]` sentinel, or a second `**Name (Outlet):**`
+header, meaning the model has started asking another question. Either may
+be split across SSE frames, so a short tail that could be the start of one
+is held back until it resolves.
+
+If the connection drops mid-turn, the caller can send what was `received`
+back as a partial model turn and feed the continuation to the same parser
+after `resume()`: the start of the continuation is held until any text the
+model repeated at the seam can be cut.
+"""
+
+import json
+import re
+from collections.abc import AsyncIterable, AsyncIterator, Iterable, Iterator
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:  # optional: pip install fmpsc-sim[speedups]
+    _loads = json.loads
+
+END_MARKER = "[END OF PRESS CONFERENCE]"
+
+# A journalist header at the start of a line, e.g. "**Dave Hughes (The Sun):**"
+HEADER = re.compile(r"^[ \t]*\*\*[^*\n]+?\([^)\n]*\):\*\*", re.MULTILINE)
+# Held-back header candidates longer than this are treated as plain text.
+MAX_HEADER_CHARS = 160
+# How much of a continuation to hold before looking for a repeat at the seam,
+# and the shortest repeat that is cut (shorter ones are likely coincidence).
+SEAM_CHARS = 64
+MIN_OVERLAP = 4
+
+
+def overlap(before: str, after: str) -> int:
+    """Length of the longest suffix of `before` that `after` starts with, if
+    at least MIN_OVERLAP characters long, else 0."""
+    for n in range(min(len(before), len(after)), MIN_OVERLAP - 1, -1):
+        if before.endswith(after[:n]):
+            return n
+    return 0
+
+
+def chunk_text(line: str) -> tuple[list[str], dict | None]:
+    """Text parts and `usageMetadata` (if any) of one SSE line."""
+    if not line.startswith("data: "):
+        return [], None
+    chunk = _loads(line[6:])
+    try:
+        parts = chunk["candidates"][0]["content"]["parts"]
+    except (KeyError, IndexError):
+        parts = ()
+    return [p["text"] for p in parts if p.get("text")], chunk.get("usageMetadata")
+
+
+class QuestionStream:
+    """Feed it SSE lines, get back text deltas that are safe to display.
+
+    Once `stopped` is set the turn is complete and the caller should stop
+    reading (closing the response cancels generation upstream). With
+    HTTP/1.1 that also drops the connection, so the next request reconnects;
+    with HTTP/2 only the stream is reset.
+    """
+
+    def __init__(self, stop_early: bool = True):
+        self.stop_early = stop_early
+        self.stopped = False
+        self.usage: dict | None = None
+        self._parts: list[str] = []
+        self._pending = ""
+        self._seen_header = False
+        self._at_line_start = True
+        self._seam: str | None = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    @property
+    def received(self) -> str:
+        """Everything the model has sent, including text still held back."""
+        return self.text + self._pending + self._continuation()
+
+    def resume(self) -> None:
+        """Expect a continuation of `received` from a new response."""
+        # Dropped again before the last seam was resolved: unless all of it
+        # repeats recent text, it is plain received text now.
+        seam = self._seam or ""
+        before = self.text + self._pending
+        if len(seam) < MIN_OVERLAP or seam not in before[-SEAM_CHARS:]:
+            self._pending += self._continuation()
+        self._seam = ""
+
+    def _emit(self, text: str) -> list[str]:
+        if not text:
+            return []
+        self._parts.append(text)
+        self._at_line_start = text.endswith("\n")
+        return [text]
+
+    def feed_line(self, line: str) -> list[str]:
+        texts, usage = chunk_text(line)
+        if usage:
+            self.usage = usage
+        deltas = []
+        for text in texts:
+            deltas += self.feed_text(text)
+        return deltas
+
+    def feed_text(self, delta: str) -> list[str]:
+        if self.stopped:
+            return []
+        if self._seam is not None:
+            self._seam += delta
+            if len(self._seam) < SEAM_CHARS:
+                return []
+            delta = self._join()
+        if not self.stop_early:
+            return self._emit(delta)
+
+        buf = self._pending + delta
+        cut = None
+        end = buf.find(END_MARKER)
+        if end != -1:
+            cut = end + len(END_MARKER)
+
+        for m in HEADER.finditer(buf, 0, cut if cut is not None else len(buf)):
+            if m.start() == 0 and not self._at_line_start:
+                continue
+            if self._seen_header:
+                cut = m.start()
+                break
+            self._seen_header = True
+
+        if cut is not None:
+            self._pending = ""
+            self.stopped = True
+            deltas = self._emit(buf[:cut])
+            # Drop the blank lines that separated the two questions.
+            self._parts = [self.text.rstrip()]
+            return deltas
+
+        hold = self._hold_from(buf)
+        self._pending = buf[hold:]
+        return self._emit(buf[:hold])
+
+    def _hold_from(self, buf: str) -> int:
+        """Index from which `buf` might still become a header or the sentinel."""
+        hold = len(buf)
+
+        line_start = buf.rfind("\n") + 1
+        if line_start or self._at_line_start:
+            line = buf[line_start:].lstrip(" \t")
+            if "**".startswith(line) or (
+                line.startswith("**")
+                and ":**" not in line
+                and len(line) < MAX_HEADER_CHARS
+            ):
+                hold = line_start
+
+        for i in range(max(0, len(buf) - len(END_MARKER) + 1), hold):
+            if END_MARKER.startswith(buf[i:]):
+                return i
+        return hold
+
+    def _continuation(self) -> str:
+        """The held continuation, less whatever it repeats of what came before."""
+        if not self._seam:
+            return ""
+        before = self.text + self._pending
+        seam = self._seam[overlap(before, self._seam) :]
+        if before[-1:].isspace():
+            seam = seam.lstrip(" \t")
+        return seam
+
+    def _join(self) -> str:
+        seam = self._continuation()
+        self._seam = None
+        return seam
+
+    def flush(self) -> list[str]:
+        """Release anything held back once the stream has ended."""
+        deltas = self.feed_text(self._join()) if self._seam is not None else []
+        pending, self._pending = self._pending, ""
+        return deltas if self.stopped else deltas + self._emit(pending)
+
+    def iter_deltas(self, lines: Iterable[str]) -> Iterator[str]:
+        for line in lines:
+            yield from self.feed_line(line)
+            if self.stopped:
+                return
+        yield from self.flush()
+
+    async def aiter_deltas(self, lines: AsyncIterable[str]) -> AsyncIterator[str]:
+        async for line in lines:
+            for delta in self.feed_line(line):
+                yield delta
+            if self.stopped:
+                return
+        for delta in self.flush():
+            yield delta
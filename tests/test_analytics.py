@@ -0,0 +1,118 @@
+import json
+
+import pytest
+
+from analytics import CACHE_FILE, Analytics
+from transcripts import TranscriptStore
+
+PROMPT = """You run a press conference.
+
+# Journalists in the room
+- Tom Richards (Liverpool Echo) — local beat writer
+- Sarah Mitchell (The Guardian) — tactics"""
+OPENING = [{"role": "user", "parts": [{"text": "Begin the press conference."}]}]
+
+
+@pytest.fixture
+def store(tmp_path):
+    with TranscriptStore(tmp_path, sync_interval=0) as store:
+        yield store
+
+
+def conference(store: TranscriptStore, *questions: str):
+    transcript = store.start(PROMPT, OPENING)
+    for question in questions:
+        transcript.append("model", question)
+        transcript.append("user", "No comment.")
+    transcript.end()
+    return transcript
+
+
+def summary(analytics: Analytics) -> tuple:
+    return (
+        len(analytics),
+        analytics.search("striker*"),
+        analytics.by_journalist(),
+        analytics.format_problems(),
+        analytics.question_counts(),
+    )
+
+
+def test_questions_are_indexed(store):
+    conference(
+        store,
+        "**Tom Richards (Liverpool Echo):** Any news on the striker?",
+        "**Sarah Mitchell (The Sun):** Why the back three?",
+        "Just a question with no header?",
+    )
+    analytics = Analytics.open(store)
+    assert analytics.search("striker") == [0]
+    assert analytics.by_journalist()[("Tom Richards", "Liverpool Echo")] == 1
+    problems = analytics.format_problems()
+    assert problems["wrong_outlet"] == 1
+    assert problems["no_header"] == 1
+    assert analytics.question_counts() == {3: 1}
+
+
+def test_cache_round_trip(store):
+    conference(store, "**Tom Richards (Liverpool Echo):** The striker's fitness?")
+    built = Analytics.open(store)
+    assert (store.directory / CACHE_FILE).exists()
+
+    cached = Analytics.open(store)
+    assert cached.offset == built.offset
+    assert summary(cached) == summary(built)
+
+    # Later records are indexed on top of the cached ones.
+    conference(store, "**Sarah Mitchell (The Guardian):** A striker in January?")
+    store.sync()
+    refreshed = Analytics.open(store)
+    assert refreshed.search("striker*") == [0, 1]
+    fresh = Analytics(store)
+    fresh.refresh()
+    assert summary(refreshed) == summary(fresh)
+
+
+def test_refresh_after_compaction(store):
+    kept = "**Tom Richards (Liverpool Echo):** The striker's fitness?"
+    conference(store, kept)
+    dropped = conference(store, "**Sarah Mitchell (The Guardian):** Striker news?")
+    analytics = Analytics.open(store)
+    assert len(analytics) == 2
+
+    store.delete(dropped.id)
+    store.compact()
+    assert analytics.refresh() > 0
+    assert len(analytics) == 1
+    assert analytics.generation == store.generation
+    assert analytics.text == ["The striker's fitness?"]
+    assert analytics.search("striker*") == [0]
+
+    conference(store, "**Sarah Mitchell (The Guardian):** Is the striker fit?")
+    analytics.refresh()
+    assert analytics.search("striker*") == [0, 1]
+
+
+@pytest.mark.parametrize(
+    "cache",
+    [
+        b"not json",
+        b"[]",
+        json.dumps({"version": 2}).encode(),
+    ],
+)
+def test_bad_cache_is_rebuilt(store, cache):
+    conference(store, "**Tom Richards (Liverpool Echo):** The striker's fitness?")
+    (store.directory / CACHE_FILE).write_bytes(cache)
+    analytics = Analytics.open(store)
+    assert analytics.search("striker*") == [0]
+
+
+def test_inconsistent_cache_is_rebuilt(store):
+    conference(store, "**Tom Richards (Liverpool Echo):** The striker's fitness?")
+    Analytics.open(store)
+    path = store.directory / CACHE_FILE
+    doc = json.loads(path.read_bytes())
+    doc["text"].append("A question nobody asked?")
+    path.write_text(json.dumps(doc))
+    assert Analytics.open(store).text == ["The striker's fitness?"]
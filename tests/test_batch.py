@@ -0,0 +1,87 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+import pytest
+
+from batch import Job, completed_jobs, job_matrix, play_job, run_batch
+from mock_server import MockConfig, start_mock
+from transport import AsyncGeminiTransport, gemini_url
+
+PROMPT = "You are a journalist."
+SCRIPTS = {"short": ["No comment.", "Next question."]}
+
+
+class FailingTransport:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+    @asynccontextmanager
+    async def stream(self, body, trace=None):
+        raise self.error
+        yield
+
+
+def record(job: str, status: str) -> bytes:
+    return json.dumps({"job": job, "status": status}).encode() + b"\n"
+
+
+def test_completed_jobs_counts_only_successes(tmp_path):
+    out = tmp_path / "results.jsonl"
+    assert completed_jobs(str(out)) == set()
+    out.write_bytes(record("a:s:0", "ok") + record("a:s:1", "error"))
+    assert completed_jobs(str(out)) == {"a:s:0"}
+
+
+def test_completed_jobs_drops_a_torn_line(tmp_path):
+    out = tmp_path / "results.jsonl"
+    whole = record("a:s:0", "ok") + record("a:s:1", "ok")
+    out.write_bytes(whole + b'{"job": "a:s:2", "sta')
+    assert completed_jobs(str(out)) == {"a:s:0", "a:s:1"}
+    assert out.read_bytes() == whole
+
+
+def test_play_job_records_any_failure():
+    job = Job("derby", "short", 0)
+    record = asyncio.run(
+        play_job(FailingTransport(ValueError("bad JSON")), job, PROMPT, ["Fine."])
+    )
+    assert record["status"] == "error"
+    assert record["error_type"] == "ValueError"
+    assert record["error"] == "bad JSON"
+
+
+def test_play_job_is_cancellable():
+    job = Job("derby", "short", 0)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(
+            play_job(FailingTransport(asyncio.CancelledError()), job, PROMPT, ["Fine."])
+        )
+
+
+def test_rerun_resumes_where_it_stopped(tmp_path, monkeypatch):
+    monkeypatch.setattr("batch.build_system_prompt", lambda state: PROMPT)
+    out = tmp_path / "results.jsonl"
+    registry = {"derby": ("A derby", lambda: None)}
+    jobs = list(job_matrix(["derby"], SCRIPTS, 3))
+
+    async def run(jobs):
+        server, base = await start_mock(MockConfig(first_byte_delay=0, token_rate=0))
+        transport = AsyncGeminiTransport("test", gemini_url(base_url=base))
+        try:
+            return await run_batch(
+                transport, jobs, SCRIPTS, str(out), concurrency=2, registry=registry
+            )
+        finally:
+            await transport.aclose()
+            server.close()
+
+    # An interrupted run: one job done, the next one's line cut short.
+    out.write_bytes(record(jobs[0].id, "ok") + b'{"job": "derby:short:1"')
+    done = completed_jobs(str(out))
+    pending = [j for j in jobs if j.id not in done]
+    assert [j.rep for j in pending] == [1, 2]
+
+    assert asyncio.run(run(pending)) == (2, 0)
+    assert len(out.read_bytes().splitlines()) == 3
+    assert completed_jobs(str(out)) == {j.id for j in jobs}
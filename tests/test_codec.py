@@ -0,0 +1,55 @@
+import pytest
+
+import codec
+from codec import CodecError, SchemaMismatch, decode, encode
+from models import freeze
+from scenarios import SCENARIOS
+
+
+@pytest.fixture(params=list(SCENARIOS))
+def state(request):
+    _, factory = SCENARIOS[request.param]
+    return factory()
+
+
+def test_round_trip(state):
+    data = encode(state)
+    assert data[:4] == codec.MAGIC
+    assert decode(data) == state
+    assert decode(data, frozen=True) is freeze(state)
+    assert encode(freeze(state)) == data
+
+
+@pytest.mark.parametrize(
+    "mangle",
+    [
+        lambda data: b"",
+        lambda data: data[: codec.HEADER.size - 1],
+        lambda data: data[:-1],
+        lambda data: data + b"\x00",
+        lambda data: b"PKL!" + data[4:],
+    ],
+    ids=["empty", "short header", "truncated", "trailing byte", "magic"],
+)
+def test_bad_data_is_refused(state, mangle):
+    with pytest.raises(CodecError) as e:
+        decode(mangle(encode(state)))
+    assert not isinstance(e.value, SchemaMismatch)
+
+
+def test_other_schema_is_refused(state, monkeypatch):
+    data = encode(state)
+    monkeypatch.setattr(codec, "SCHEMA", codec.SCHEMA ^ 1)
+    with pytest.raises(SchemaMismatch):
+        decode(data)
+
+
+def test_corrupt_streams_raise_codec_errors(state):
+    data = encode(state)
+    for i in range(codec.HEADER.size, len(data)):
+        corrupt = bytearray(data)
+        corrupt[i] ^= 0xFF
+        try:
+            decode(bytes(corrupt))
+        except CodecError:
+            pass
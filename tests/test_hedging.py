@@ -0,0 +1,96 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+
+from hedging import HedgePolicy, hedged
+
+
+class Fake:
+    """A transport that answers `body` after `delay`, or raises `error`."""
+
+    def __init__(self, body=b"", delay=0.0, error=None, status=200):
+        self.body = body
+        self.delay = delay
+        self.error = error
+        self.status = status
+        self.opened = self.closed = 0
+
+    @asynccontextmanager
+    async def stream(self, body, trace=None):
+        self.opened += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        try:
+            yield httpx.Response(
+                self.status,
+                stream=httpx.ByteStream(self.body),
+                request=httpx.Request("POST", "http://fake/"),
+            )
+        finally:
+            self.closed += 1
+
+    async def aclose(self):
+        pass
+
+
+def policy() -> HedgePolicy:
+    return HedgePolicy(initial_delay=0.01, budget=1.0)
+
+
+def read(transport, body=None) -> tuple[int, bytes]:
+    async def run():
+        async with transport.stream(body or {"contents": []}) as resp:
+            return resp.status_code, await resp.aread()
+
+    return asyncio.run(run())
+
+
+def test_hedge_wins_when_primary_is_slow():
+    primary, alternate = Fake(b"slow", delay=1.0), Fake(b"fast")
+    transport = hedged(primary, alternate, policy())
+    assert read(transport) == (200, b"fast")
+    assert transport.policy.hedge_wins == 1
+    assert primary.closed == 0  # cancelled before it answered
+
+
+def test_primary_wins_when_hedge_fails():
+    primary = Fake(b"primary", delay=0.05)
+    alternate = Fake(error=httpx.ConnectError("down"))
+    transport = hedged(primary, alternate, policy())
+    assert read(transport) == (200, b"primary")
+    assert alternate.opened == 1
+    assert transport.policy.hedge_wins == 0
+
+
+def test_hedge_wins_when_primary_fails():
+    primary = Fake(delay=0.05, error=httpx.ReadTimeout("late"))
+    transport = hedged(primary, Fake(b"hedge", delay=0.1), policy())
+    assert read(transport) == (200, b"hedge")
+
+
+def test_primary_failure_is_raised_when_both_fail():
+    primary = Fake(delay=0.05, error=httpx.ReadTimeout("primary"))
+    alternate = Fake(error=httpx.ConnectError("hedge"))
+    with pytest.raises(httpx.ReadTimeout, match="primary"):
+        read(hedged(primary, alternate, policy()))
+
+
+def test_unusable_primary_answer_is_reported():
+    primary = Fake(b"overloaded", delay=0.05, status=503)
+    alternate = Fake(error=httpx.ConnectError("down"))
+    assert read(hedged(primary, alternate, policy())) == (503, b"overloaded")
+
+
+def test_no_hedge_over_budget_or_with_a_cache():
+    primary, alternate = Fake(b"primary", delay=0.05), Fake(b"hedge")
+    broke = HedgePolicy(initial_delay=0.01, budget=0, burst=0)
+    transport = hedged(primary, alternate, broke)
+    assert read(transport) == (200, b"primary")
+    assert transport.policy.over_budget == 1
+
+    transport = hedged(primary, alternate, policy())
+    assert read(transport, {"cachedContent": "c"}) == (200, b"primary")
+    assert alternate.opened == 0
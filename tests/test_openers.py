@@ -0,0 +1,67 @@
+import asyncio
+import concurrent.futures
+import time
+from contextlib import contextmanager
+
+from mock_server import MockConfig, start_mock
+from openers import OpenerPool
+from scheduler import QuotaScheduler
+from transport import GeminiTransport, gemini_url
+
+PROMPT = "You are a journalist."
+
+
+class BrokenTransport:
+    def __init__(self, error: Exception):
+        self.error = error
+
+    @contextmanager
+    def stream(self, body, trace=None):
+        raise self.error
+        yield
+
+    def close(self) -> None:
+        pass
+
+
+def test_failed_fill_is_rejected_and_not_waited_for():
+    with OpenerPool(BrokenTransport(ValueError("bad JSON")), size=2) as pool:
+        for future in pool.prefetch(PROMPT):
+            future.result()
+        assert pool.stats()["filling"] == 0
+        assert pool.stats()["rejected"] == 2
+
+        start = time.monotonic()
+        assert pool.take(PROMPT, wait=5) is None
+        assert time.monotonic() - start < 1
+
+
+def test_requests_wait_for_the_scheduler():
+    async def run():
+        server, base = await start_mock(MockConfig(first_byte_delay=0, token_rate=0))
+        scheduler = QuotaScheduler(rpm=1)
+        transport = GeminiTransport("test", gemini_url(base_url=base), max_retries=0)
+        pool = OpenerPool(
+            transport,
+            size=2,
+            scheduler=scheduler,
+            loop=asyncio.get_running_loop(),
+        )
+        try:
+            futures = pool.prefetch(PROMPT)
+            done, _ = await asyncio.to_thread(
+                concurrent.futures.wait, futures, 5, "FIRST_COMPLETED"
+            )
+            assert len(done) == 1
+            await asyncio.sleep(0.1)
+            batch = scheduler.stats()["batch"]
+            assert (batch["admitted"], batch["queued"]) == (1, 1)
+            assert pool.available(PROMPT) == 1
+        finally:
+            await asyncio.to_thread(pool.close)
+            server.close()
+        await asyncio.sleep(0.1)
+        assert scheduler.stats()["batch"]["queued"] == 0
+        assert pool.stats()["filling"] == 0
+
+    asyncio.run(run())
@@ -0,0 +1,35 @@
+import pickle
+
+import pytest
+
+import packs
+from packs import BUNDLED_PACKS, discover
+
+
+@pytest.fixture
+def scenario(tmp_path):
+    (found,) = discover([BUNDLED_PACKS], tmp_path).values()
+    return found
+
+
+def test_compiled_scenario_loads_without_parsing(scenario, monkeypatch):
+    parsed = scenario.load()
+    (compiled,) = scenario.cache.glob("*.fmgs")
+
+    def parse(*args):
+        raise AssertionError("parsed again")
+
+    monkeypatch.setattr(packs, "parse_scenario", parse)
+    assert scenario.load() == parsed
+    assert compiled.exists()
+
+
+def test_cache_is_never_unpickled(scenario, monkeypatch):
+    parsed = scenario.load()
+    (compiled,) = scenario.cache.glob("*.fmgs")
+    compiled.write_bytes(pickle.dumps(parsed))
+    monkeypatch.setattr(pickle, "loads", None)
+    monkeypatch.setattr(pickle, "load", None)
+
+    assert scenario.load() == parsed  # parsed again, and compiled anew
+    assert compiled.read_bytes()[:4] == b"FMGS"
@@ -0,0 +1,31 @@
+from models import freeze
+from prompts import SectionCache, build_system_prompt
+from scenarios import SCENARIOS
+
+
+def scenario():
+    _, factory = next(iter(SCENARIOS.values()))
+    return factory()
+
+
+def test_cached_prompt_matches_uncached():
+    cache = SectionCache()
+    state = scenario()
+    expected = build_system_prompt(state, cache=None)
+    assert build_system_prompt(state, cache) == expected
+    assert build_system_prompt(freeze(state), cache) == expected
+    assert build_system_prompt(freeze(state), cache) == expected
+
+
+def test_only_frozen_states_are_cached():
+    cache = SectionCache()
+    first = build_system_prompt(freeze(scenario()), cache)
+    misses = cache.misses
+    # An equal state, frozen separately, is the same interned one.
+    second = build_system_prompt(freeze(scenario()), cache)
+    assert second is not first and second == first
+    assert (cache.misses, cache.hits) == (misses, misses)
+    assert cache.uncached == 0
+
+    build_system_prompt(scenario(), cache)
+    assert cache.uncached > 0
@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+import pytest
+
+from mock_server import MockConfig, start_mock
+from scheduler import Overloaded, Priority, QuotaScheduler, ScheduledTransport
+from transport import AsyncGeminiTransport, gemini_url
+
+BODY = {"contents": [{"role": "user", "parts": [{"text": "Begin."}]}]}
+
+
+def test_requests_wait_for_the_window():
+    async def run():
+        scheduler = QuotaScheduler(rpm=2, window=0.2)
+        start = time.monotonic()
+        for _ in range(3):
+            await scheduler.acquire(Priority.INTERACTIVE, 10)
+        assert time.monotonic() - start >= 0.2
+        assert scheduler.stats()["requests_in_window"] == 1
+        assert scheduler.stats()["interactive"]["admitted"] == 3
+
+    asyncio.run(run())
+
+
+def test_tokens_are_settled_from_usage():
+    async def run():
+        scheduler = QuotaScheduler(tpm=1000, window=60)
+        grant = await scheduler.acquire(Priority.BATCH, 900)
+        assert scheduler.stats()["tokens_in_window"] == 900
+        scheduler.settle(grant, {"totalTokenCount": 100})
+        assert scheduler.stats()["tokens_in_window"] == 100
+        # Now there is room for another: admitted without waiting.
+        await asyncio.wait_for(scheduler.acquire(Priority.BATCH, 800), 0.1)
+        assert scheduler.stats()["tokens_in_window"] == 900
+
+    asyncio.run(run())
+
+
+def test_interactive_before_batch():
+    async def run():
+        scheduler = QuotaScheduler(rpm=1, window=0.1)
+        await scheduler.acquire(Priority.BATCH, 1)
+        order = []
+
+        async def acquire(priority):
+            await scheduler.acquire(priority, 1)
+            order.append(priority)
+
+        batch = asyncio.create_task(acquire(Priority.BATCH))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(acquire(Priority.INTERACTIVE))
+        await asyncio.gather(batch, interactive)
+        assert order == [Priority.INTERACTIVE, Priority.BATCH]
+
+    asyncio.run(run())
+
+
+def test_full_queue_is_shed():
+    async def run():
+        scheduler = QuotaScheduler(rpm=1, max_queue=1, window=60)
+        await scheduler.acquire(Priority.INTERACTIVE, 1)
+        waiting = asyncio.create_task(scheduler.acquire(Priority.INTERACTIVE, 1))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            await scheduler.acquire(Priority.INTERACTIVE, 1)
+        assert scheduler.stats()["interactive"]["shed"] == 1
+        waiting.cancel()
+
+    asyncio.run(run())
+
+
+def test_each_retry_is_admitted():
+    async def run():
+        config = MockConfig(first_byte_delay=0, token_rate=0, error_rate=1.0)
+        server, base = await start_mock(config)
+        scheduler = QuotaScheduler(rpm=100)
+        inner = AsyncGeminiTransport(
+            "test", gemini_url(base_url=base), max_retries=2, backoff=0.01
+        )
+        async with ScheduledTransport(inner, scheduler) as transport:
+            async with transport.stream(BODY) as resp:
+                assert resp.status_code == 503
+        server.close()
+        assert scheduler.stats()["interactive"]["admitted"] == 3
+        assert scheduler.stats()["requests_in_window"] == 3
+
+    asyncio.run(run())
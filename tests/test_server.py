@@ -0,0 +1,61 @@
+import asyncio
+
+import httpx
+import pytest
+
+from httpserver import serve, server_url
+from mock_server import MockConfig, start_mock
+from server import PressServer, SessionStore
+from sessions import MemoryBackend
+from transport import AsyncGeminiTransport, gemini_url
+
+
+def with_server(test):
+    async def run():
+        mock, base = await start_mock(MockConfig(first_byte_delay=0, token_rate=0))
+        transport = AsyncGeminiTransport("test", gemini_url(base_url=base))
+        handler = PressServer(transport, SessionStore(MemoryBackend()))
+        server = await serve(handler)
+        try:
+            async with httpx.AsyncClient(base_url=server_url(server)) as client:
+                await test(client)
+        finally:
+            server.close()
+            mock.close()
+            await transport.aclose()
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    "body",
+    [b"[1, 2]", b'"1"', b"3", b'{"scenario": ["1"]}', b'{"scenario": "nope"}'],
+)
+def test_create_rejects_bad_bodies(body):
+    async def test(client):
+        resp = await client.post("/sessions", content=body)
+        assert resp.status_code == 400
+        assert resp.json()["error"]["code"] == 400
+
+    with_server(test)
+
+
+def test_a_turn():
+    async def test(client):
+        resp = await client.post("/sessions", json={"scenario": "1"})
+        assert resp.status_code == 201
+        session = resp.json()["id"]
+
+        resp = await client.get(f"/sessions/{session}/question")
+        assert resp.status_code == 200
+        assert "event: question" in resp.text
+
+        resp = await client.post(f"/sessions/{session}/answer", json=["Hi."])
+        assert resp.status_code == 400
+        resp = await client.post(f"/sessions/{session}/answer", json={"text": "Hi."})
+        assert resp.json() == {"awaiting": "question"}
+
+        resp = await client.get(f"/sessions/{session}")
+        assert resp.json()["awaiting"] == "question"
+
+    with_server(test)
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import pytest
+
+from scenarios import SCENARIOS
+from server import SessionStore
+from sessions import SessionRecord, VersionConflict, open_backend
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    url = "memory:" if request.param == "memory" else f"sqlite://{tmp_path}/s.db"
+    backend = open_backend(url)
+    yield backend
+    backend.close()
+
+
+def test_record_round_trip():
+    record = SessionRecord(b"\x00snapshot", "abc", [{"role": "user"}], True)
+    assert SessionRecord.decode(record.encode()) == record
+
+
+def test_save_needs_the_version_read(backend):
+    assert backend.insert("a", b"one") == 1
+    assert backend.save("a", b"two", 1) == 2
+    with pytest.raises(VersionConflict):
+        backend.save("a", b"stale", 1)
+    assert backend.load("a") == (2, b"two")
+    assert backend.delete("a")
+    with pytest.raises(VersionConflict):
+        backend.save("a", b"gone", 2)
+
+
+def test_expire_deletes_only_stale_records(backend):
+    backend.insert("old", b"x")
+    cutoff = time.time()
+    time.sleep(0.01)
+    backend.insert("new", b"y")
+    assert backend.expire(cutoff) == 1
+    assert backend.load("old") is None
+    assert backend.load("new") == (1, b"y")
+    assert len(backend) == 1
+
+
+def test_a_save_keeps_a_session_alive(backend):
+    backend.insert("a", b"x")
+    time.sleep(0.01)
+    cutoff = time.time()
+    time.sleep(0.01)
+    backend.save("a", b"y", 1)
+    assert backend.expire(cutoff) == 0
+
+
+def test_store_expires_after_ttl(backend):
+    async def run():
+        _, factory = next(iter(SCENARIOS.values()))
+        store = SessionStore(backend, ttl=0.05)
+        session = await store.create(factory())
+        assert await store.expire() == 0
+        await asyncio.sleep(0.1)
+        assert await store.expire() == 1
+        assert await store.get(session.id) is None
+        assert (await store.stats())["expired"] == 1
+
+        forever = SessionStore(backend, ttl=0)
+        await forever.create(factory())
+        await asyncio.sleep(0.1)
+        assert await forever.expire() == 0
+
+    asyncio.run(run())
@@ -0,0 +1,24 @@
+from models import Player
+from squad import mentioned
+
+SQUAD = [
+    Player("Dominic Calvert-Lewin", "ST", 27),
+    Player("Ashley Young", "RB", 38),
+    Player("Tyler Young", "LB", 19),
+    Player(" ", "GK", 30),
+    Player("", "CB", 22),
+]
+
+
+def test_by_surname():
+    assert mentioned(SQUAD, "is calvert-lewin fit?") == {0}
+
+
+def test_shared_surname_needs_the_full_name():
+    assert mentioned(SQUAD, "young played well") == set()
+    assert mentioned(SQUAD, "tyler young played well") == {2}
+
+
+def test_blank_names_are_never_mentioned():
+    assert mentioned(SQUAD, "anyone at all") == set()
+    assert mentioned(SQUAD[3:], "") == set()
@@ -0,0 +1,98 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from transcripts import StoreBusy, TranscriptStore
+
+PROMPT = "You are a journalist."
+
+
+def turn(role: str, text: str) -> dict:
+    return {"role": role, "parts": [{"text": text}]}
+
+
+def test_round_trip(tmp_path):
+    opener = [turn("user", "Begin."), turn("model", "A question.")]
+    with TranscriptStore(tmp_path, sync_interval=0) as store:
+        transcript = store.start(PROMPT, opener, scenario="derby", title="Derby")
+        transcript.append("user", "An answer.")
+        transcript.append("model", "Another question.")
+        transcript.end()
+
+    with TranscriptStore(tmp_path, sync_interval=0) as store:
+        resumed = store.load(transcript.id)
+        assert resumed.system_prompt == PROMPT
+        assert resumed.contents == [
+            *opener,
+            turn("user", "An answer."),
+            turn("model", "Another question."),
+        ]
+        assert resumed.info.scenario == "derby"
+        assert resumed.info.status == "finished"
+        assert [info.id for info in store.sessions()] == [transcript.id]
+
+
+def test_round_trip_after_compaction(tmp_path):
+    with TranscriptStore(tmp_path, sync_interval=0) as store:
+        kept = store.start(PROMPT, [turn("user", "Keep me.")])
+        dropped = store.start(PROMPT, [turn("user", "Drop me.")])
+        store.delete(dropped.id)
+        store.compact()
+        kept.append("model", "Still here.")
+        assert store.generation == 1
+
+    with TranscriptStore(tmp_path, sync_interval=0) as store:
+        assert store.load(kept.id).contents == [
+            turn("user", "Keep me."),
+            turn("model", "Still here."),
+        ]
+        assert len(store) == 1
+
+
+def test_one_store_at_a_time(tmp_path):
+    with TranscriptStore(tmp_path, sync_interval=0):
+        with pytest.raises(StoreBusy):
+            TranscriptStore(tmp_path, sync_interval=0)
+    with TranscriptStore(tmp_path, sync_interval=0):
+        pass
+
+
+OTHER_PROCESS = """
+import sys
+from transcripts import StoreBusy, TranscriptStore
+
+try:
+    store = TranscriptStore(sys.argv[1], sync_interval=0, wait=sys.argv[2] == "wait")
+except StoreBusy:
+    sys.exit(3)
+with store:
+    store.start("prompt", [{"role": "user", "parts": [{"text": "Other."}]}])
+"""
+
+
+def other_process(directory, *args: str) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-c", OTHER_PROCESS, str(directory), *args],
+        cwd=Path(__file__).parents[1],
+    )
+
+
+def test_other_process_fails_fast(tmp_path):
+    with TranscriptStore(tmp_path, sync_interval=0) as store:
+        store.start(PROMPT, [turn("user", "Mine.")])
+        assert other_process(tmp_path, "fail").wait(timeout=30) == 3
+        assert len(store) == 1
+
+
+def test_other_process_waits(tmp_path):
+    with TranscriptStore(tmp_path, sync_interval=0) as store:
+        store.start(PROMPT, [turn("user", "Mine.")])
+        waiting = other_process(tmp_path, "wait")
+        with pytest.raises(subprocess.TimeoutExpired):
+            waiting.wait(timeout=0.5)
+    assert waiting.wait(timeout=30) == 0
+
+    with TranscriptStore(tmp_path, sync_interval=0) as store:
+        assert len(store) == 2
@@ -0,0 +1,212 @@
+"""Per-turn instrumentation, exported as Chrome trace events.
+
+A `Tracer` records spans (build_system_prompt, serialise, connect, TLS,
+waiting for the first byte and first token, render, stream) and instants
+(first byte, first token, chunks, end of stream) with their arguments,
+plus the `usageMetadata` token counts of each turn. Load the JSON from
+`write_chrome_trace` in chrome://tracing or https://ui.perfetto.dev.
+
+`NULL_TRACER` is the default everywhere: its methods do nothing, and hot
+paths check `tracer.enabled` before building event arguments at all.
+"""
+
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Any, Iterator
+
+# httpcore trace events worth a span; the rest (e.g. response_closed) are noise.
+_HTTP_STAGES = {
+    "connect_tcp": "connect",
+    "start_tls": "tls",
+    "send_request_headers": "send_headers",
+    "send_request_body": "send_body",
+    "receive_response_headers": "wait_first_byte",
+}
+
+# usageMetadata fields summed per trace.
+_USAGE_FIELDS = (
+    "promptTokenCount",
+    "cachedContentTokenCount",
+    "candidatesTokenCount",
+    "totalTokenCount",
+)
+
+
+def _percentile(ordered: list[float], p: float) -> float:
+    k = (len(ordered) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+class Tracer:
+    """Collects trace events for one lane (`tid`), e.g. one conference."""
+
+    enabled = True
+
+    def __init__(self, tid: int = 1, name: str | None = None, pid: int = 1):
+        self.pid = pid
+        self.tid = tid
+        self.events: list[dict] = []
+        self.usage: dict[str, int] = defaultdict(int)
+        if name:
+            self.events.append(
+                {
+                    "ph": "M",
+                    "name": "thread_name",
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {"name": name},
+                }
+            )
+        self._http_started: dict[str, int] = {}
+
+    @staticmethod
+    def now() -> int:
+        return time.perf_counter_ns()
+
+    def complete(self, name: str, start: int, end: int, **args: Any) -> None:
+        """Record a span from `start` to `end` (perf_counter_ns values)."""
+        self.events.append(
+            {
+                "ph": "X",
+                "name": name,
+                "pid": self.pid,
+                "tid": self.tid,
+                "ts": start / 1000,
+                "dur": (end - start) / 1000,
+                "args": args,
+            }
+        )
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[dict]:
+        """Time the block; the yielded dict can be filled with extra args."""
+        start = self.now()
+        try:
+            yield args
+        finally:
+            self.complete(name, start, self.now(), **args)
+
+    def instant(self, name: str, **args: Any) -> None:
+        self.events.append(
+            {
+                "ph": "i",
+                "s": "t",
+                "name": name,
+                "pid": self.pid,
+                "tid": self.tid,
+                "ts": self.now() / 1000,
+                "args": args,
+            }
+        )
+
+    def record_usage(self, usage: dict | None) -> None:
+        """Add a turn's `usageMetadata` to the totals and the trace."""
+        if not usage:
+            return
+        counts = {k: usage[k] for k in _USAGE_FIELDS if k in usage}
+        for key, value in counts.items():
+            self.usage[key] += value
+        self.events.append(
+            {
+                "ph": "C",
+                "name": "tokens",
+                "pid": self.pid,
+                "tid": self.tid,
+                "ts": self.now() / 1000,
+                "args": counts,
+            }
+        )
+
+    async def http_hook(self, event: str, info: dict) -> None:
+        """httpx `trace` extension: turns httpcore events into spans."""
+        _, _, stage = event.partition(".")
+        stage, _, phase = stage.rpartition(".")
+        if stage not in _HTTP_STAGES:
+            return
+        if phase == "started":
+            self._http_started[stage] = self.now()
+        elif stage in self._http_started:
+            start = self._http_started.pop(stage)
+            args = {"failed": True} if phase == "failed" else {}
+            self.complete(_HTTP_STAGES[stage], start, self.now(), **args)
+
+    def chrome_trace(self) -> dict:
+        return {"traceEvents": self.events, "displayTimeUnit": "ms"}
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """Per-span statistics in milliseconds."""
+        durations: dict[str, list[float]] = defaultdict(list)
+        for event in self.events:
+            if event["ph"] == "X":
+                durations[event["name"]].append(event["dur"] / 1000)
+        stats = {}
+        for name, values in durations.items():
+            values.sort()
+            stats[name] = {
+                "count": len(values),
+                "total": sum(values),
+                "mean": sum(values) / len(values),
+                "p50": _percentile(values, 50),
+                "p95": _percentile(values, 95),
+                "max": values[-1],
+            }
+        return stats
+
+    def summary_table(self) -> str:
+        lines = [
+            f"{'stage':<20}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}"
+            f"{'max':>10}{'total':>11}"
+        ]
+        for name, s in sorted(self.summary().items(), key=lambda kv: -kv[1]["total"]):
+            lines.append(
+                f"{name:<20}{s['count']:>7}{s['mean']:>8.2f}ms{s['p50']:>8.2f}ms"
+                f"{s['p95']:>8.2f}ms{s['max']:>8.2f}ms{s['total']:>9.1f}ms"
+            )
+        if self.usage:
+            tokens = ", ".join(f"{k} {v:,}" for k, v in self.usage.items())
+            lines.append(f"tokens: {tokens}")
+        return "\n".join(lines)
+
+
+class NullTracer(Tracer):
+    """Does nothing, as cheaply as possible."""
+
+    enabled = False
+
+    def __init__(self):
+        self.events = []
+        self.usage = {}
+
+    def complete(self, name, start, end, **args) -> None:
+        pass
+
+    def span(self, name, **args):
+        return nullcontext(args)
+
+    def instant(self, name, **args) -> None:
+        pass
+
+    def record_usage(self, usage) -> None:
+        pass
+
+
+NULL_TRACER = NullTracer()
+
+
+def merged(tracers: list[Tracer]) -> Tracer:
+    """One tracer holding the events and token totals of all `tracers`."""
+    combined = Tracer(tid=0)
+    for tracer in tracers:
+        combined.events.extend(tracer.events)
+        for key, value in tracer.usage.items():
+            combined.usage[key] += value
+    return combined
+
+
+def write_chrome_trace(tracer: Tracer, path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(tracer.chrome_trace(), f)
@@ -0,0 +1,690 @@
+"""Append-only log of every conference turn, durable and resumable.
+
+    python transcripts.py list
+    python transcripts.py show <id>
+    python transcripts.py delete <id>
+    python transcripts.py compact
+
+A store is a directory holding `transcripts.<generation>.log` and an
+`index.sqlite` of offsets into it, like a cassette (see cassette.py). The
+log is a sequence of records:
+
+    header  kind, payload length, CRC-32 of the payload, and the offset of
+            the session's previous record (-1 for its first)
+    payload JSON
+
+A `prompt` record holds a system prompt, written once per distinct prompt
+and named by its fingerprint (SHA-256). A `start` record opens a session
+with its scenario and prompt fingerprint, each `contents` entry follows as a
+`turn` record, and an `end` record closes it. The index keeps each session's
+tail, so resuming one reads only its own records, walking back from the
+tail, however large the log grows.
+
+Appends are buffered, and a background thread fsyncs them in batches every
+`sync_interval` seconds (0 to sync every write), committing the index only
+once the records it points to are on disk. Records written after the last
+index commit are recovered from the log the next time the store is opened,
+and a torn final record is cut off. Deleted sessions leave garbage in the
+log; once it outweighs the live data, a background thread rewrites the log
+as a new generation, with each session's records contiguous.
+
+A store belongs to one `TranscriptStore` at a time: it holds an exclusive
+lock on the directory's `lock` file while open, and another one (in this
+process or any other) fails with `StoreBusy`, or waits with `wait=True`.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import uuid
+import zlib
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: stores aren't locked
+    fcntl = None
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:  # optional: pip install fmpsc-sim[speedups]
+    _loads = json.loads
+
+RECORD = struct.Struct("<BIIq")
+PROMPT, START, TURN, END = 1, 2, 3, 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY, scenario TEXT NOT NULL, title TEXT NOT NULL,
+    fingerprint TEXT NOT NULL, created REAL NOT NULL, updated REAL NOT NULL,
+    status TEXT NOT NULL, turns INTEGER NOT NULL, tail INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated);
+CREATE TABLE IF NOT EXISTS prompts (
+    fingerprint TEXT PRIMARY KEY, offset INTEGER NOT NULL, bytes INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+COLUMNS = (
+    "id",
+    "scenario",
+    "title",
+    "fingerprint",
+    "created",
+    "updated",
+    "status",
+    "turns",
+    "tail",
+    "bytes",
+)
+
+
+class TranscriptError(Exception):
+    """A session the store doesn't hold, or a damaged log."""
+
+
+class StoreBusy(TranscriptError):
+    """The store is open elsewhere (see `TranscriptStore`)."""
+
+
+def fingerprint(system_prompt: str) -> str:
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+
+
+def default_directory() -> Path:
+    base = os.environ.get("XDG_DATA_HOME") or Path.home() / ".local" / "share"
+    return Path(base) / "fmpsc" / "transcripts"
+
+
+@dataclass
+class SessionInfo:
+    id: str
+    scenario: str
+    title: str
+    fingerprint: str
+    created: float
+    updated: float
+    status: str  # "live", "finished" or "abandoned"
+    turns: int
+
+
+@dataclass
+class Resumed:
+    """A logged session, ready to continue."""
+
+    info: SessionInfo
+    system_prompt: str
+    contents: list[dict]
+
+
+def _info(row: dict) -> SessionInfo:
+    return SessionInfo(**{k: row[k] for k in COLUMNS[:8]})
+
+
+class Transcript:
+    """One session's handle on the store, given to `Conference` to log turns."""
+
+    def __init__(self, store: "TranscriptStore", session_id: str):
+        self.store = store
+        self.id = session_id
+
+    def append(self, role: str, text: str) -> None:
+        self.store._write(TURN, {"session": self.id, "role": role, "text": text})
+
+    def end(self, abandoned: bool = False) -> None:
+        self.store._write(END, {"session": self.id, "abandoned": abandoned})
+
+
+class TranscriptStore:
+    """Sessions in an append-only log under `directory`, indexed by SQLite."""
+
+    def __init__(
+        self,
+        directory: str | Path,
+        sync_interval: float = 0.2,
+        compact_min_bytes: int = 1 << 20,
+        wait: bool = False,
+    ):
+        import sqlite3  # only needed once a store is opened
+
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Held until close: the log offsets, index and generation below are
+        # only right while nobody else appends, compacts or recovers.
+        self._lockfile = open(self.directory / "lock", "ab")
+        if fcntl:
+            try:
+                flags = fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB
+                fcntl.flock(self._lockfile, flags)
+            except BlockingIOError:
+                self._lockfile.close()
+                raise StoreBusy(f"{self.directory} is in use elsewhere") from None
+        self.sync_interval = sync_interval
+        self.compact_min_bytes = compact_min_bytes
+        self.syncs = self.compactions = self.recovered = 0
+
+        self._db = sqlite3.connect(
+            self.directory / "index.sqlite", check_same_thread=False
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        meta = dict(self._db.execute("SELECT key, value FROM meta"))
+        self._gen = meta.get("gen", 0)
+        self._end = meta.get("end", 0)  # length of the log the index covers
+        for path in self.directory.glob("transcripts.*.log"):
+            if path != self._path(self._gen):  # left by an interrupted compaction
+                path.unlink()
+
+        # Appends hold `_lock`; a sync or the end of a compaction also holds
+        # `_sync_lock`, so index commits and generation swaps never overlap.
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._compacting = threading.Lock()
+        self._log = open(self._path(self._gen), "ab")
+        self._reader = open(self._path(self._gen), "rb")
+        # Rows of sessions touched since opening (newest state), prompt
+        # offsets, and what has changed since the last index commit.
+        self._rows: dict[str, dict] = {}
+        self._prompts: dict[str, tuple[int, int]] = {
+            fp: (offset, size)
+            for fp, offset, size in self._db.execute("SELECT * FROM prompts")
+        }
+        self._dirty_rows: set[str] = set()
+        self._dirty_prompts: set[str] = set()
+        self._deleted: set[str] = set()
+        self._recover()
+        self._garbage = self._count_garbage()
+
+        self._closed = threading.Event()
+        self._syncer = None
+        if sync_interval > 0:
+            self._syncer = threading.Thread(
+                target=self._sync_loop, name="transcript-sync", daemon=True
+            )
+            self._syncer.start()
+        self.maybe_compact()
+
+    def __enter__(self) -> "TranscriptStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _path(self, gen: int) -> Path:
+        return self.directory / f"transcripts.{gen}.log"
+
+    # --- Writing ---
+
+    def start(
+        self,
+        system_prompt: str,
+        contents: list[dict],
+        scenario: str = "",
+        title: str = "",
+    ) -> Transcript:
+        """Open a session, logging its prompt and any `contents` so far."""
+        fp = fingerprint(system_prompt)
+        session_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            if fp not in self._prompts:
+                self._append(PROMPT, {"fingerprint": fp, "text": system_prompt})
+            start = {"session": session_id, "scenario": scenario, "title": title}
+            self._append(START, {**start, "fingerprint": fp})
+            for content in contents:
+                self._append(TURN, _turn(session_id, content))
+        if not self.sync_interval:
+            self.sync()
+        return Transcript(self, session_id)
+
+    def transcript(self, session_id: str) -> Transcript:
+        """A handle to log further turns of an existing session."""
+        with self._lock:
+            if self._row(session_id) is None:
+                raise TranscriptError(f"No session {session_id!r}")
+        return Transcript(self, session_id)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            if self._row(session_id) is None:
+                raise TranscriptError(f"No session {session_id!r}")
+            self._garbage += self._rows.pop(session_id)["bytes"]
+            self._dirty_rows.discard(session_id)
+            self._deleted.add(session_id)
+        self.maybe_compact()
+
+    def _write(self, kind: int, payload: dict) -> None:
+        with self._lock:
+            self._append(kind, payload)
+        if not self.sync_interval:
+            self.sync()
+
+    def _append(self, kind: int, payload: dict) -> None:
+        session_id = payload.get("session")
+        row = self._row(session_id) if kind in (TURN, END) else None
+        if kind in (TURN, END) and row is None:
+            return  # deleted while still being played
+        payload["at"] = round(time.time(), 3)
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        prev = row["tail"] if row else -1
+        offset = self._log.tell()
+        self._log.write(RECORD.pack(kind, len(data), zlib.crc32(data), prev) + data)
+        self._apply(kind, payload, offset, RECORD.size + len(data))
+
+    def _apply(self, kind: int, payload: dict, offset: int, size: int) -> None:
+        """Update the in-memory index for a record written at `offset`."""
+        if kind == PROMPT:
+            self._prompts[payload["fingerprint"]] = (offset, size)
+            self._dirty_prompts.add(payload["fingerprint"])
+            return
+        session_id = payload["session"]
+        if kind == START:
+            row = self._rows[session_id] = {
+                "id": session_id,
+                "scenario": payload["scenario"],
+                "title": payload["title"],
+                "fingerprint": payload["fingerprint"],
+                "created": payload["at"],
+                "status": "live",
+                "turns": 0,
+                "bytes": 0,
+            }
+        else:
+            row = self._row(session_id)
+            if row is None:
+                return
+            if kind == TURN:
+                row["turns"] += 1
+                row["status"] = "live"  # an abandoned session can be resumed
+            else:
+                row["status"] = "abandoned" if payload["abandoned"] else "finished"
+        row["updated"] = payload["at"]
+        row["tail"] = offset
+        row["bytes"] += size
+        self._dirty_rows.add(session_id)
+
+    def _row(self, session_id: str) -> dict | None:
+        row = self._rows.get(session_id)
+        if row is None and session_id not in self._deleted:
+            found = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM sessions WHERE id = ?",
+                (session_id,),
+            ).fetchone()
+            if found:
+                row = self._rows[session_id] = dict(zip(COLUMNS, found))
+        return row
+
+    # --- Durability ---
+
+    def sync(self) -> None:
+        """Get buffered records onto disk and commit the index to match."""
+        with self._sync_lock:
+            with self._lock:
+                if not (self._dirty_rows or self._dirty_prompts or self._deleted):
+                    return
+                self._log.flush()
+                changes = self._changes()
+            os.fsync(self._log.fileno())  # appends carry on meanwhile
+            with self._lock:
+                self._commit(*changes)
+            self.syncs += 1
+
+    def _changes(self) -> tuple[list[dict], list[tuple], list[str], int]:
+        rows = [dict(self._rows[i]) for i in self._dirty_rows]
+        prompts = [(fp, *self._prompts[fp]) for fp in self._dirty_prompts]
+        deleted = list(self._deleted)
+        self._dirty_rows.clear()
+        self._dirty_prompts.clear()
+        self._deleted.clear()
+        return rows, prompts, deleted, self._log.tell()
+
+    def _commit(
+        self,
+        rows: list[dict],
+        prompts: list[tuple],
+        deleted: list[str],
+        end: int,
+        gen: int | None = None,
+    ) -> None:
+        placeholders = ", ".join(f":{c}" for c in COLUMNS)
+        with self._db:
+            self._db.executemany(
+                f"INSERT OR REPLACE INTO sessions VALUES ({placeholders})", rows
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO prompts VALUES (?, ?, ?)", prompts
+            )
+            self._db.executemany(
+                "DELETE FROM sessions WHERE id = ?", [(i,) for i in deleted]
+            )
+            meta = [("end", end)] + ([("gen", gen)] if gen is not None else [])
+            self._db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", meta)
+        self._end = end
+        # Closed sessions won't change again: no need to keep them in memory.
+        for row in rows:
+            if row["status"] != "live" and row["id"] not in self._dirty_rows:
+                self._rows.pop(row["id"], None)
+
+    def _sync_loop(self) -> None:
+        while not self._closed.wait(self.sync_interval):
+            self.sync()
+
+    def _recover(self) -> None:
+        """Index records written after the last index commit and cut off a
+        torn final record."""
+        size = self._log.tell()
+        if size < self._end:
+            raise TranscriptError(
+                f"{self._path(self._gen)} is shorter than its index says "
+                f"({size} < {self._end} bytes)"
+            )
+        offset = self._end
+        self._reader.seek(offset)
+        while offset < size:
+            header = self._reader.read(RECORD.size)
+            if len(header) < RECORD.size:
+                break
+            kind, length, crc, _ = RECORD.unpack(header)
+            data = self._reader.read(length)
+            if len(data) < length or zlib.crc32(data) != crc:
+                break
+            self._apply(kind, json.loads(data), offset, RECORD.size + length)
+            offset += RECORD.size + length
+            self.recovered += 1
+        if offset < size:
+            self._log.truncate(offset)
+            self._log.seek(0, os.SEEK_END)
+        self.sync()
+
+    # --- Reading ---
+
+    def _read(self, reader, offset: int) -> tuple[int, bytes, int]:
+        """(kind, payload, previous offset) of the record at `offset`."""
+        reader.seek(offset)
+        kind, length, crc, prev = RECORD.unpack(reader.read(RECORD.size))
+        data = reader.read(length)
+        if zlib.crc32(data) != crc:
+            raise TranscriptError(f"Damaged record at offset {offset}")
+        return kind, data, prev
+
+    @property
+    def generation(self) -> int:
+        """Bumped by every compaction, which moves all records."""
+        return self._gen
+
+    def scan(
+        self, start: int = 0, generation: int | None = None
+    ) -> Iterator[tuple[int, int, int, dict]]:
+        """(offset, size, kind, payload) of each synced record from `start`
+        on, in log order, deleted sessions included.
+
+        Offsets only hold within a generation: pass the one `start` came
+        from to get a TranscriptError if compaction has replaced it since.
+        """
+        self.sync()
+        with self._lock:
+            if generation is not None and generation != self._gen:
+                raise TranscriptError("The log has been compacted since")
+            reader = open(self._path(self._gen), "rb")
+            end = self._end
+        return self._records(reader, start, end)
+
+    def _records(self, reader, offset: int, end: int):
+        with reader:
+            reader.seek(offset)
+            while offset < end:
+                kind, length, crc, _ = RECORD.unpack(reader.read(RECORD.size))
+                data = reader.read(length)
+                if zlib.crc32(data) != crc:
+                    raise TranscriptError(f"Damaged record at offset {offset}")
+                yield offset, RECORD.size + length, kind, _loads(data)
+                offset += RECORD.size + length
+
+    def load(self, session_id: str) -> Resumed:
+        """A session's system prompt and `contents`, exactly as logged."""
+        with self._lock:
+            row = self._row(session_id)
+            if row is None:
+                raise TranscriptError(f"No session {session_id!r}")
+            self._log.flush()
+            records = []
+            offset = row["tail"]
+            while offset != -1:
+                kind, data, offset = self._read(self._reader, offset)
+                records.append((kind, json.loads(data)))
+            _, prompt, _ = self._read(
+                self._reader, self._prompts[row["fingerprint"]][0]
+            )
+            info = _info(row)
+
+        system_prompt = json.loads(prompt)["text"]
+        if fingerprint(system_prompt) != info.fingerprint:
+            raise TranscriptError(f"Prompt of session {session_id!r} doesn't match")
+        contents = [
+            {"role": p["role"], "parts": [{"text": p["text"]}]}
+            for kind, p in reversed(records)
+            if kind == TURN
+        ]
+        return Resumed(info, system_prompt, contents)
+
+    def sessions(self, limit: int = 20, status: str | None = None) -> list[SessionInfo]:
+        """The most recently updated sessions, optionally with a given status."""
+        self.sync()
+        with self._lock:
+            query = f"SELECT {', '.join(COLUMNS)} FROM sessions"
+            args: tuple = ()
+            if status:
+                query += " WHERE status = ?"
+                args = (status,)
+            query += " ORDER BY updated DESC LIMIT ?"
+            rows = self._db.execute(query, (*args, limit)).fetchall()
+        return [_info(dict(zip(COLUMNS, row))) for row in rows]
+
+    def __len__(self) -> int:
+        self.sync()
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def _count_garbage(self) -> int:
+        """Bytes of the log no indexed session or prompt uses (once synced)."""
+        self.sync()
+        with self._lock:
+            (live,) = self._db.execute(
+                "SELECT COALESCE(SUM(bytes), 0) FROM sessions"
+            ).fetchone()
+            live += sum(size for _, size in self._prompts.values())
+            return self._end - live
+
+    def stats(self) -> dict:
+        self.sync()
+        with self._lock:
+            (sessions,) = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()
+            return {
+                "sessions": sessions,
+                "prompts": len(self._prompts),
+                "log_bytes": self._end,
+                "garbage_bytes": self._garbage,
+                "generation": self._gen,
+                "syncs": self.syncs,
+                "compactions": self.compactions,
+                "recovered_records": self.recovered,
+            }
+
+    # --- Compaction ---
+
+    def maybe_compact(self) -> threading.Thread | None:
+        """Compact in the background once garbage outweighs live data."""
+        with self._lock:
+            garbage, size = self._garbage, self._log.tell()
+        if garbage < max(self.compact_min_bytes, size - garbage):
+            return None
+        if self._compacting.locked():
+            return None
+        thread = threading.Thread(
+            target=self.compact, name="transcript-compact", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def compact(self) -> None:
+        """Rewrite the log as a new generation holding only indexed sessions
+        and the prompts they use, each session's records together.
+
+        The bulk of the copy runs without blocking appends; records appended
+        meanwhile are carried over at the end.
+        """
+        with self._compacting:
+            self.sync()
+            with self._lock:
+                gen, copied_to = self._gen, self._end
+                tails = self._db.execute(
+                    "SELECT tail FROM sessions ORDER BY created"
+                ).fetchall()
+                # All of them: a session may yet start with an unused one.
+                prompts = [offset for offset, _ in self._prompts.values()]
+
+            moved: dict[int, int] = {}  # old offset -> new offset
+            path = self._path(gen + 1)
+            with open(self._path(gen), "rb") as old, open(path, "wb") as new:
+
+                def copy(offset: int, kind: int, data: bytes, prev: int) -> None:
+                    moved[offset] = new.tell()
+                    new.write(RECORD.pack(kind, len(data), zlib.crc32(data), prev))
+                    new.write(data)
+
+                for offset in prompts:
+                    kind, data, _ = self._read(old, offset)
+                    copy(offset, kind, data, -1)
+                for (tail,) in tails:
+                    chain = []
+                    offset = tail
+                    while offset != -1:
+                        kind, data, prev = self._read(old, offset)
+                        chain.append((offset, kind, data))
+                        offset = prev
+                    prev = -1
+                    for offset, kind, data in reversed(chain):
+                        copy(offset, kind, data, prev)
+                        prev = moved[offset]
+
+                with self._sync_lock, self._lock:
+                    self._log.flush()
+                    end = self._log.tell()
+                    offset = copied_to
+                    while offset < end:
+                        kind, data, prev = self._read(old, offset)
+                        if kind in (PROMPT, START) or prev in moved:
+                            copy(offset, kind, data, moved.get(prev, -1))
+                        offset += RECORD.size + len(data)
+                    new.flush()
+                    os.fsync(new.fileno())
+                    self._swap(gen + 1, moved)
+            self._path(gen).unlink()
+            self.compactions += 1
+            self._garbage = self._count_garbage()
+
+    def _swap(self, gen: int, moved: dict[int, int]) -> None:
+        """Point the index and the open files at the compacted log, dropping
+        prompts no session uses any more."""
+        retail = [
+            (moved[tail], session_id)
+            for session_id, tail in self._db.execute("SELECT id, tail FROM sessions")
+            if tail in moved
+        ]
+        for row in self._rows.values():
+            row["tail"] = moved[row["tail"]]
+        used = {row["fingerprint"] for row in self._rows.values()}
+        used.update(
+            fp
+            for (fp,) in self._db.execute("SELECT DISTINCT fingerprint FROM sessions")
+        )
+        self._prompts = {
+            fp: (moved[offset], size)
+            for fp, (offset, size) in self._prompts.items()
+            if fp in used
+        }
+        self._log.close()
+        self._reader.close()
+        self._log = open(self._path(gen), "ab")
+        self._reader = open(self._path(gen), "rb")
+        self._gen = gen
+
+        self._db.executemany("UPDATE sessions SET tail = ? WHERE id = ?", retail)
+        self._db.execute("DELETE FROM prompts")
+        self._dirty_prompts.update(self._prompts)
+        self._commit(*self._changes(), gen=gen)
+
+    def close(self) -> None:
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self._syncer:
+            self._syncer.join()
+        with self._compacting:  # let a running compaction finish
+            self.sync()
+            self._log.close()
+            self._reader.close()
+            self._db.close()
+        self._lockfile.close()  # and with it the lock
+
+
+def _turn(session_id: str, content: dict) -> dict:
+    text = "".join(p.get("text", "") for p in content["parts"])
+    return {"session": session_id, "role": content["role"], "text": text}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--dir",
+        default=os.environ.get("FMPSC_TRANSCRIPTS") or default_directory(),
+        help="the store (default: FMPSC_TRANSCRIPTS or a per-user data dir)",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    listing = commands.add_parser("list", help="recent sessions")
+    listing.add_argument("--limit", type=int, default=20)
+    listing.add_argument("--status", choices=["live", "finished", "abandoned"])
+    commands.add_parser("show", help="a session's transcript").add_argument("id")
+    commands.add_parser("delete", help="delete a session").add_argument("id")
+    commands.add_parser("compact", help="drop deleted sessions from the log")
+    commands.add_parser("stats", help="store statistics")
+    args = parser.parse_args()
+
+    try:
+        store = TranscriptStore(args.dir)
+    except StoreBusy as e:
+        sys.exit(f"{e}: try again once the conference is over")
+    with store:
+        try:
+            if args.command == "list":
+                for s in store.sessions(args.limit, args.status):
+                    when = time.strftime("%Y-%m-%d %H:%M", time.localtime(s.updated))
+                    print(
+                        f"{s.id}  {when}  {s.status:<9}  {s.turns:>2} turns  {s.title}"
+                    )
+            elif args.command == "show":
+                resumed = store.load(args.id)
+                for content in resumed.contents:
+                    print(f"[{content['role']}] {content['parts'][0]['text']}\n")
+            elif args.command == "delete":
+                store.delete(args.id)
+            elif args.command == "compact":
+                store.compact()
+                print(json.dumps(store.stats(), indent=2))
+            else:
+                print(json.dumps(store.stats(), indent=2))
+        except TranscriptError as e:
+            sys.exit(str(e))
+
+
+if __name__ == "__main__":
+    main()
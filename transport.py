@@ -0,0 +1,294 @@
+import asyncio
+import functools
+import importlib.util
+import itertools
+import json
+import os
+import random
+import ssl
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator
+
+import httpx
+
+# Both can be overridden to point at a local stand-in (see mock_server.py).
+GEMINI_BASE_URL = os.environ.get(
+    "GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta"
+)
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash")
+
+
+def gemini_url(model: str = GEMINI_MODEL, base_url: str = GEMINI_BASE_URL) -> str:
+    return f"{base_url.rstrip('/')}/models/{model}:streamGenerateContent"
+
+
+GEMINI_URL = gemini_url()
+
+# httpcore scans its whole pool on every request, which turns quadratic with
+# hundreds of connections; AsyncGeminiTransport shards into pools this size.
+CONNECTIONS_PER_POOL = 16
+
+# Statuses worth retrying: rate limiting and transient server-side failures.
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (`pip install fmpsc-sim[http2]`)."""
+    return importlib.util.find_spec("h2") is not None
+
+
+@functools.cache
+def ssl_context() -> ssl.SSLContext:
+    """The verifying TLS context every client shares. Loading the CA bundle
+    takes tens of milliseconds, which each client (and pool shard) would
+    otherwise pay again at startup."""
+    return httpx.create_ssl_context()
+
+
+def backoff_delay(
+    attempt: int, base: float, cap: float, retry_after: str | None = None
+) -> float:
+    """Seconds to wait before retry number `attempt` (0-based)."""
+    if retry_after:
+        try:
+            return min(cap, max(0.0, float(retry_after)))
+        except ValueError:
+            pass  # HTTP-date form; fall back to exponential backoff
+    return min(cap, base * 2**attempt) * random.uniform(0.5, 1.0)
+
+
+def encode_json(body: dict) -> bytes:
+    """Serialise a request body exactly as httpx does for `json=`."""
+    return json.dumps(
+        body, ensure_ascii=False, separators=(",", ":"), allow_nan=False
+    ).encode("utf-8")
+
+
+class _TransportConfig:
+    """Settings shared by the blocking and asyncio transports."""
+
+    def __init__(
+        self,
+        api_key: str,
+        url: str = GEMINI_URL,
+        *,
+        http2: bool | None = None,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 8.0,
+        timeout: float = 60,
+        max_connections: int = 10,
+    ):
+        self.api_key = api_key
+        self.url = url
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_connections = max_connections
+        tls = url.startswith("https:")
+        if http2 is None:
+            http2 = tls and http2_available()  # only negotiated over TLS
+        self._client_kwargs = dict(
+            # Plain-http endpoints (the mock) don't need the CA bundle at all.
+            verify=ssl_context() if tls else False,
+            http2=http2,
+            timeout=httpx.Timeout(timeout, connect=10),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=120,
+            ),
+        )
+
+    @property
+    def origin(self) -> httpx.URL:
+        return httpx.URL(self.url).copy_with(path="/", query=None)
+
+    @property
+    def params(self) -> dict[str, str]:
+        return {"alt": "sse", "key": self.api_key}
+
+    @property
+    def api_root(self) -> str:
+        """The `.../v1beta` part of `url`, for non-streaming endpoints."""
+        return self.url.rsplit("/models/", 1)[0]
+
+    @property
+    def model(self) -> str:
+        """Resource name of the model `url` points at, e.g. `models/gemini-...`."""
+        return "models/" + self.url.rsplit("/models/", 1)[1].split(":", 1)[0]
+
+    def retry_delay(self, attempt: int, resp: httpx.Response | None = None) -> float:
+        retry_after = resp.headers.get("retry-after") if resp is not None else None
+        return backoff_delay(attempt, self.backoff, self.max_backoff, retry_after)
+
+    def should_retry(self, attempt: int, resp: httpx.Response) -> bool:
+        return resp.status_code in RETRY_STATUSES and attempt < self.max_retries
+
+    def build_request(
+        self, client: httpx.Client | httpx.AsyncClient, body: dict | bytes, trace=None
+    ) -> httpx.Request:
+        """POST to `url`; `body` may be pre-encoded JSON. `trace` is passed
+        to httpcore as the `trace` extension (see tracing.Tracer.http_hook)."""
+        extensions = {"trace": trace} if trace else None
+        if isinstance(body, bytes):
+            return client.build_request(
+                "POST",
+                self.url,
+                params=self.params,
+                content=body,
+                headers={"Content-Type": "application/json"},
+                extensions=extensions,
+            )
+        return client.build_request(
+            "POST", self.url, params=self.params, json=body, extensions=extensions
+        )
+
+
+class GeminiTransport(_TransportConfig):
+    """Long-lived Gemini client that keeps a warm connection pool across turns.
+
+    One instance should be shared for a whole session so that every question
+    after the first reuses an open (and already TLS-negotiated) connection.
+    """
+
+    def __init__(self, api_key: str, url: str = GEMINI_URL, **kwargs):
+        super().__init__(api_key, url, **kwargs)
+        self.client = httpx.Client(**self._client_kwargs)
+
+    def __enter__(self) -> "GeminiTransport":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.client.close()
+
+    def warm(self) -> None:
+        """Open a pooled connection (DNS + TCP + TLS) ahead of the first request."""
+        try:
+            self.client.head(self.origin)
+        except httpx.HTTPError:
+            pass  # best effort — the real request will surface any problem
+
+    def warm_in_background(self) -> threading.Thread:
+        thread = threading.Thread(target=self.warm, name="gemini-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    @contextmanager
+    def stream(self, body: dict | bytes, trace=None) -> Iterator[httpx.Response]:
+        """POST `body` and yield the streaming response.
+
+        Connection errors and 429/5xx responses are retried with bounded
+        exponential backoff before any of the body has been consumed. The
+        final response is yielded whatever its status; callers check it.
+        """
+        attempt = 0
+        while True:
+            request = self.build_request(self.client, body, trace)
+            try:
+                resp = self.client.send(request, stream=True)
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self.retry_delay(attempt))
+                attempt += 1
+                continue
+
+            if self.should_retry(attempt, resp):
+                resp.close()
+                time.sleep(self.retry_delay(attempt, resp))
+                attempt += 1
+                continue
+
+            try:
+                yield resp
+            finally:
+                resp.close()
+            return
+
+
+class AsyncGeminiTransport(_TransportConfig):
+    """asyncio counterpart of `GeminiTransport`, built on `httpx.AsyncClient`.
+
+    A single instance can serve many concurrent conferences; raise
+    `max_connections` accordingly. Large pools are split across several
+    clients of at most `CONNECTIONS_PER_POOL` connections each.
+    """
+
+    def __init__(self, api_key: str, url: str = GEMINI_URL, **kwargs):
+        super().__init__(api_key, url, **kwargs)
+        shards = -(-self.max_connections // CONNECTIONS_PER_POOL)
+        per_shard = -(-self.max_connections // shards)
+        limits = httpx.Limits(
+            max_connections=per_shard,
+            max_keepalive_connections=per_shard,
+            keepalive_expiry=120,
+        )
+        kwargs = {**self._client_kwargs, "limits": limits}
+        self.clients = [httpx.AsyncClient(**kwargs) for _ in range(shards)]
+        self.client = self.clients[0]
+        self._next_shard = itertools.cycle(self.clients)
+
+    async def __aenter__(self) -> "AsyncGeminiTransport":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        for client in self.clients:
+            await client.aclose()
+
+    async def warm(self) -> None:
+        """Open a pooled connection ahead of the first request."""
+        try:
+            await self.client.head(self.origin)
+        except httpx.HTTPError:
+            pass
+
+    async def call(
+        self, method: str, path: str, body: dict | None = None, **params: str
+    ) -> httpx.Response:
+        """Non-streaming request to `{api_root}/{path}`, e.g. `cachedContents`."""
+        return await self.client.request(
+            method,
+            f"{self.api_root}/{path}",
+            params={"key": self.api_key, **params},
+            json=body,
+        )
+
+    @asynccontextmanager
+    async def stream(
+        self, body: dict | bytes, trace=None
+    ) -> AsyncIterator[httpx.Response]:
+        """POST `body` and yield the streaming response, retrying like
+        `GeminiTransport.stream`."""
+        client = next(self._next_shard)
+        attempt = 0
+        while True:
+            request = self.build_request(client, body, trace)
+            try:
+                resp = await client.send(request, stream=True)
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(self.retry_delay(attempt))
+                attempt += 1
+                continue
+
+            if self.should_retry(attempt, resp):
+                await resp.aclose()
+                await asyncio.sleep(self.retry_delay(attempt, resp))
+                attempt += 1
+                continue
+
+            try:
+                yield resp
+            finally:
+                await resp.aclose()
+            return
@@ -0,0 +1,786 @@
+"""Procedural GameStates from simulated league seasons, for load testing.
+
+A `Season` plays a double round robin between 20-100 made-up clubs with all
+the matches of a round drawn at once. Goals are Poisson draws from the two
+sides' attack and defence ratings plus home advantage. The tables after
+every round are cumulative sums of those results, so the standings always
+add up (points = 3W + D, goals for and against match the scores). Every goal
+is credited to a scorer, so player goals sum to the club's tally.
+
+`generate` turns (club, round) points of many seasons into `GameState`s of
+any conference type. Form, injuries, morale, board confidence and transfer
+rumours all follow from the table. Output is seeded and deterministic:
+
+    python worldgen.py --count 10000 --clubs 40 --seed 7 --out states.jsonl
+
+Each output line is a GameState document, ready for `POST /sessions` as
+{"state": ...} (see server.py) or as a scenario pack file (see packs.py).
+Needs numpy (`pip install fmpsc-sim[sim]`).
+"""
+
+import argparse
+import dataclasses
+import json
+import random
+import sys
+import time
+from collections.abc import Iterable, Iterator
+from enum import Enum
+
+from models import (
+    BoardConfidence,
+    Club,
+    ConferenceType,
+    GameState,
+    Injury,
+    Journalist,
+    JournalistPersonality,
+    LeagueStanding,
+    Manager,
+    MatchRecord,
+    MatchResult,
+    Player,
+    PlayerMorale,
+    PostMatchContext,
+    Rivalry,
+    TransferContext,
+    UpcomingMatch,
+)
+
+try:
+    import numpy as np
+except ImportError:  # optional: pip install fmpsc-sim[sim]
+    np = None
+
+BASE_GOALS = 1.3  # expected goals of an average side away from home
+HOME_ADVANTAGE = 0.2  # log-rate bonus for playing at home
+FORM_MATCHES = 5
+FIRST_SEASON = 2024
+
+TOWNS = (
+    "Ashford Bramley Calder Dunmore Eastleigh Fenwick Garside Harrowby Ingleby "
+    "Kelso Langley Marsden Newbold Oakham Penrith Quarry Radcliffe Selby "
+    "Thornaby Ullswater Wetherby Yarm Alston Brigham Castleton Dalby Elmswell "
+    "Frodsham Glossop Hexham Ilkley Keswick Ludlow Malton Norham Otley Pickering "
+    "Redcar Skipton Tadcaster"
+).split()
+SUFFIXES = "United City Town Rovers Athletic Albion Wanderers County".split()
+NICKNAMES = (
+    "Millers Hatters Robins Saints Magpies Foxes Owls Blades Potters Seagulls "
+    "Tigers Bantams Cobblers Shrimpers Quakers Mariners Lions Stags"
+).split()
+GROUNDS = "Park Road Lane Ground Stadium Meadow".split()
+LEAGUES = ("Premier Division", "Championship", "National League", "First Division")
+
+FIRST_NAMES = (
+    "James Tom Ben Jack Harry Luke Sam Dan Joe Ryan Kyle Lewis Callum Josh Adam "
+    "Matt Rhys Owen Liam Jamie Connor Ethan Aaron Marcus Jordan Kieran Mateo "
+    "Luca Nico Andrei Tomas Yusuf Kofi Emeka Hugo Jonas Sven Diego Rafael Ivan"
+).split()
+SURNAMES = (
+    "Walker Hughes Ward Barnes Cole Fletcher Hart Dixon Pearce Ashworth Brennan "
+    "Carver Doyle Ellison Farrell Gibbs Holt Irwin Jenkins Kerr Lowe Mason "
+    "Nolan Osei Price Quinn Reid Shaw Tierney Vance Webb Young Adeyemi Bakker "
+    "Costa Duarte Eriksen Fofana Novak Okafor Petrov Silva Traoré Varga Zielinski"
+).split()
+NATIONALITIES = (
+    "English Scottish Welsh Irish Dutch German Spanish Portuguese Italian French"
+).split()
+REPUTATIONS = (
+    "combative and no-nonsense",
+    "media-savvy and charming",
+    "reserved, gives little away",
+    "emotional, wears his heart on his sleeve",
+    "tactically obsessed, loves a whiteboard",
+)
+FOREIGN_CLUBS = (
+    "Benfica",
+    "Ajax",
+    "Porto",
+    "Sporting CP",
+    "PSV",
+    "Club Brugge",
+    "Red Bull Salzburg",
+    "Lyon",
+)
+
+# A realistic matchday squad: position, weight as a scorer, as a provider.
+SQUAD = (
+    ("GK", 0.0, 0.01),
+    ("RB", 0.03, 0.08),
+    ("CB", 0.04, 0.02),
+    ("CB", 0.04, 0.02),
+    ("LB", 0.03, 0.08),
+    ("CM", 0.07, 0.12),
+    ("CM", 0.07, 0.12),
+    ("AM", 0.1, 0.15),
+    ("RW", 0.14, 0.13),
+    ("LW", 0.14, 0.13),
+    ("ST", 0.22, 0.07),
+    ("GK", 0.0, 0.0),
+    ("CB", 0.02, 0.01),
+    ("CM", 0.04, 0.04),
+    ("RW", 0.05, 0.03),
+    ("ST", 0.1, 0.03),
+)
+ASSIST_RATE = 0.7
+
+INJURIES = (
+    ("hamstring", 2, 6),
+    ("ankle", 1, 8),
+    ("knee ligament", 6, 30),
+    ("groin", 1, 4),
+    ("calf", 1, 5),
+    ("broken metatarsal", 8, 14),
+    ("concussion", 1, 2),
+    ("illness", 1, 1),
+)
+JOURNALISTS = (
+    ("The Sun", JournalistPersonality.TABLOID_HOSTILE),
+    ("Daily Mirror", JournalistPersonality.TABLOID_SENSATIONALIST),
+    ("Daily Mail", JournalistPersonality.TABLOID_HOSTILE),
+    ("The Guardian", JournalistPersonality.BROADSHEET_NEUTRAL),
+    ("The Times", JournalistPersonality.BROADSHEET_NEUTRAL),
+    ("The Telegraph", JournalistPersonality.BROADSHEET_SUPPORTIVE),
+    ("The Athletic", JournalistPersonality.BROADSHEET_NEUTRAL),
+)
+LOCAL_PAPERS = ("Echo", "Gazette", "Chronicle", "Evening Post")
+RELATIONSHIPS = {
+    JournalistPersonality.TABLOID_HOSTILE: (
+        "openly hostile, ran a back-page campaign against the manager",
+        "still bitter about being frozen out of briefings",
+    ),
+    JournalistPersonality.TABLOID_SENSATIONALIST: (
+        "after a headline, any headline",
+        "friendly enough, but will twist a throwaway line",
+    ),
+    JournalistPersonality.BROADSHEET_NEUTRAL: (
+        "fair but probing, will ask difficult tactical questions",
+        "measured, has followed the club for a decade",
+    ),
+    JournalistPersonality.BROADSHEET_SUPPORTIVE: (
+        "respects the manager's project",
+        "sympathetic, wrote a long piece defending his methods",
+    ),
+    JournalistPersonality.LOCAL_PRESS_FRIENDLY: (
+        "sympathetic to the club but under pressure to get headlines",
+        "close to the dressing room, knows the fans' mood",
+    ),
+}
+
+MORALE = tuple(PlayerMorale)  # best first
+MORALE_FLOORS = (0.7, 0.25, -0.35, -0.9)  # lowest mood score of each but the last
+BOARD = (  # (highest pressure, confidence)
+    (-0.15, BoardConfidence.FULL),
+    (0.05, BoardConfidence.SATISFIED),
+    (0.2, BoardConfidence.WAVERING),
+    (0.35, BoardConfidence.UNDER_PRESSURE),
+)
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError(
+            "the season simulator needs numpy: pip install fmpsc-sim[sim]"
+        )
+
+
+def fixtures(clubs: int) -> tuple["np.ndarray", "np.ndarray"]:
+    """Home and away club indices, shape (rounds, matches per round), of a
+    double round robin (circle method; with an odd number of clubs one sits
+    out each round). The second half repeats the first with venues swapped."""
+    _require_numpy()
+    slots = clubs + clubs % 2
+    rounds = slots - 1
+    rotation = (np.arange(rounds)[:, None] + np.arange(rounds)) % rounds + 1
+    order = np.concatenate([np.zeros((rounds, 1), int), rotation], axis=1)
+    first, second = order[:, : slots // 2], order[:, ::-1][:, : slots // 2]
+    swap = (np.arange(rounds) % 2 == 1)[:, None]  # alternate venues by round
+    home, away = np.where(swap, second, first), np.where(swap, first, second)
+    if clubs % 2:
+        playing = (home != clubs) & (away != clubs)
+        home = home[playing].reshape(rounds, -1)
+        away = away[playing].reshape(rounds, -1)
+    return np.concatenate([home, away]), np.concatenate([away, home])
+
+
+class Season:
+    """One simulated league season of `clubs` made-up clubs.
+
+    Per-round arrays have shape (rounds, clubs): `opponent` (-1 for a bye),
+    `at_home`, `scored`, `conceded`. Tables have shape (rounds + 1, clubs),
+    row r being the standings after r rounds: `played`, `won`, `drawn`,
+    `lost`, `goals_for`, `goals_against`, `points`, `position`.
+    """
+
+    def __init__(self, clubs: int = 20, seed: int | Iterable[int] = 0):
+        _require_numpy()
+        if not 4 <= clubs <= len(TOWNS) * len(SUFFIXES):
+            raise ValueError(f"clubs must be 4-{len(TOWNS) * len(SUFFIXES)}")
+        rng = np.random.default_rng(seed)
+        n = self.size = clubs
+        self.quality = rng.normal(0, 0.25, n)
+        attack = self.quality + rng.normal(0, 0.12, n)
+        defence = self.quality + rng.normal(0, 0.12, n)
+
+        labels = rng.permutation(n)  # so fixture order says nothing about a club
+        home, away = (labels[side] for side in fixtures(n))
+        home_goals = rng.poisson(
+            BASE_GOALS * np.exp(HOME_ADVANTAGE + attack[home] - defence[away])
+        )
+        away_goals = rng.poisson(BASE_GOALS * np.exp(attack[away] - defence[home]))
+
+        rounds = self.rounds = len(home)
+        at = np.arange(rounds)[:, None]
+        self.opponent = np.full((rounds, n), -1)
+        self.opponent[at, home], self.opponent[at, away] = away, home
+        self.at_home = np.zeros((rounds, n), bool)
+        self.at_home[at, home] = True
+        self.scored = np.zeros((rounds, n), int)
+        self.scored[at, home], self.scored[at, away] = home_goals, away_goals
+        self.conceded = np.zeros((rounds, n), int)
+        self.conceded[at, home], self.conceded[at, away] = away_goals, home_goals
+
+        def table(per_round):
+            return np.concatenate([np.zeros((1, n), int), np.cumsum(per_round, 0)])
+
+        played = self.opponent >= 0
+        self.played = table(played)
+        self.won = table(played & (self.scored > self.conceded))
+        self.drawn = table(played & (self.scored == self.conceded))
+        self.lost = table(played & (self.scored < self.conceded))
+        self.goals_for = table(self.scored)
+        self.goals_against = table(self.conceded)
+        self.points = 3 * self.won + self.drawn
+
+        # Last seasons' finishes, noisy around quality; the most recent one
+        # breaks ties in the table (so it is the pre-season order too).
+        history = self.quality + rng.normal(0, 0.2, (3, n))
+        self.previous = np.argsort(np.argsort(-history, axis=1), axis=1) + 1
+        self.expected = np.argsort(np.argsort(-self.quality)) + 1
+        self.position = self._positions()
+        self._name(rng)
+        self._allocate_goals(rng)
+        self._morale(rng)
+
+    def _positions(self) -> "np.ndarray":
+        """League position of every club after every round: points, goal
+        difference, goals scored, then last season's finish."""
+        gd = self.goals_for - self.goals_against
+        key = (self.points * 4096 + gd + 2048) * 4096 + self.goals_for
+        tiebreak = np.argsort(self.previous[0])
+        order = tiebreak[np.argsort(-key[:, tiebreak], axis=1, kind="stable")]
+        position = np.empty_like(order)
+        ranks = np.broadcast_to(np.arange(1, self.size + 1), order.shape)
+        np.put_along_axis(position, order, ranks, axis=1)
+        return position
+
+    def _name(self, rng) -> None:
+        n, slots = self.size, len(SQUAD)
+        picks = rng.choice(len(TOWNS) * len(SUFFIXES), n, replace=False)
+        self.towns = [TOWNS[i // len(SUFFIXES)] for i in picks.tolist()]
+        self.names = [
+            f"{town} {SUFFIXES[i % len(SUFFIXES)]}"
+            for town, i in zip(self.towns, picks.tolist())
+        ]
+        self.nicknames = [NICKNAMES[i] for i in rng.integers(len(NICKNAMES), size=n)]
+        self.league = LEAGUES[int(rng.integers(len(LEAGUES)))]
+        # Rivals: a club from the same town, else the nearest in quality.
+        self.rival = []
+        for c, town in enumerate(self.towns):
+            same = [o for o, t in enumerate(self.towns) if t == town and o != c]
+            gaps = np.abs(self.quality - self.quality[c])
+            gaps[c] = np.inf
+            self.rival.append(same[0] if same else int(np.argmin(gaps)))
+
+        self.squads = [
+            [
+                f"{FIRST_NAMES[f]} {SURNAMES[s]}"
+                for f, s in zip(
+                    rng.integers(len(FIRST_NAMES), size=slots).tolist(),
+                    rng.choice(len(SURNAMES), slots, replace=False).tolist(),
+                )
+            ]
+            for _ in range(n)
+        ]
+        self.ages = rng.integers(18, 35, (n, slots)).tolist()
+        self.talent = rng.lognormal(0, 0.35, (n, slots))
+        self.captain = rng.integers(1, 11, n).tolist()  # an outfield starter
+        self.stars = np.argsort(-self.talent[:, :11], axis=1)[:, :2].tolist()
+        self.managers = [
+            (
+                f"{FIRST_NAMES[f]} {SURNAMES[s]}",
+                NATIONALITIES[nat],
+                age,
+                tenure,
+                REPUTATIONS[rep],
+            )
+            for f, s, nat, age, tenure, rep in zip(
+                *(
+                    rng.integers(hi, size=n).tolist()
+                    for hi in (len(FIRST_NAMES), len(SURNAMES), len(NATIONALITIES))
+                ),
+                rng.integers(38, 68, n).tolist(),
+                rng.integers(1, 60, n).tolist(),
+                rng.integers(len(REPUTATIONS), size=n).tolist(),
+            )
+        ]
+        titles = 3 + 8 * self.quality + rng.normal(0, 1.5, n)
+        self.titles = np.maximum(titles, 0).astype(int).tolist()
+        self.founded = rng.integers(1865, 1925, n).tolist()
+        self.capacity = (
+            np.round(18_000 * np.exp(self.quality * 1.5 + rng.normal(0, 0.2, n)), -2)
+            .astype(int)
+            .tolist()
+        )
+
+    def _allocate_goals(self, rng) -> None:
+        """Credit every goal a club scored to one of its players (and most to
+        a provider), in match order, with a minute. Running totals per player
+        go in `player_goals` and `player_assists`, (rounds + 1, clubs, squad)."""
+        weights = np.array([s for _, s, _ in SQUAD]) * self.talent
+        providers = np.array([a for _, _, a in SQUAD]) * self.talent
+        self.goal_round, self.scorer, self.assister, self.minute = [], [], [], []
+        goals = np.zeros((self.rounds + 1, self.size, len(SQUAD)), int)
+        assists = np.zeros_like(goals)
+        for c in range(self.size):
+            rounds = np.repeat(np.arange(self.rounds), self.scored[:, c])
+            total = len(rounds)
+            scorer = _draw(rng, weights[c], total)
+            assister = _draw(rng, providers[c], total)
+            assister[(assister == scorer) | (rng.random(total) > ASSIST_RATE)] = -1
+            self.goal_round.append(rounds)
+            self.scorer.append(scorer)
+            self.assister.append(assister)
+            self.minute.append(rng.integers(1, 91, total))
+            np.add.at(goals, (rounds + 1, c, scorer), 1)
+            assisted = assister >= 0
+            np.add.at(assists, (rounds[assisted] + 1, c, assister[assisted]), 1)
+        self.player_goals = np.cumsum(goals, 0)
+        self.player_assists = np.cumsum(assists, 0)
+
+    def _morale(self, rng) -> None:
+        """Each player's morale after every round, as an index into MORALE:
+        the team's recent form, his goal involvement, a personal baseline and
+        some week-to-week noise, with the bench a little less happy."""
+        played = np.arange(self.rounds + 1)[:, None]
+        window = np.minimum(played, FORM_MATCHES)
+        form = self.points - np.roll(self.points, FORM_MATCHES, axis=0)
+        form[:FORM_MATCHES] = self.points[:FORM_MATCHES]
+        mood = np.where(window > 0, 1.2 * form / (3 * np.maximum(window, 1)) - 0.6, 0.2)
+        involvement = (self.player_goals + self.player_assists) / np.maximum(
+            self.played, 1
+        )[..., None]
+        bench = np.arange(len(SQUAD)) >= 11
+        score = (
+            mood[..., None]
+            + 1.5 * involvement
+            - 0.4 * bench
+            + rng.normal(0, 0.3, (self.size, len(SQUAD)))
+            + rng.normal(0, 0.2, involvement.shape)
+        )
+        self.morale = np.searchsorted(-np.array(MORALE_FLOORS), -score, side="right")
+
+    def standing(self, club: int, played: int) -> LeagueStanding:
+        """The club's line in the table after `played` rounds."""
+        return LeagueStanding(
+            position=int(self.position[played, club]),
+            played=int(self.played[played, club]),
+            won=int(self.won[played, club]),
+            drawn=int(self.drawn[played, club]),
+            lost=int(self.lost[played, club]),
+            goals_for=int(self.goals_for[played, club]),
+            goals_against=int(self.goals_against[played, club]),
+            points=int(self.points[played, club]),
+        )
+
+    def match(self, club: int, rnd: int) -> MatchRecord | None:
+        opponent = int(self.opponent[rnd, club])
+        if opponent < 0:
+            return None
+        scored, conceded = int(self.scored[rnd, club]), int(self.conceded[rnd, club])
+        result = (
+            MatchResult.WIN
+            if scored > conceded
+            else MatchResult.DRAW
+            if scored == conceded
+            else MatchResult.LOSS
+        )
+        return MatchRecord(
+            self.names[opponent],
+            home=bool(self.at_home[rnd, club]),
+            score=f"{scored}-{conceded}",
+            result=result,
+            competition=self.league,
+        )
+
+    def form(self, club: int, played: int) -> list[MatchRecord]:
+        """Up to the last FORM_MATCHES league results, latest first."""
+        form = []
+        for rnd in range(played - 1, -1, -1):
+            if len(form) == FORM_MATCHES:
+                break
+            if (record := self.match(club, rnd)) is not None:
+                form.append(record)
+        return form
+
+    def goals_in(self, club: int, rnd: int) -> list[tuple[int, str]]:
+        """(minute, player) of the club's goals in round `rnd`."""
+        rounds = self.goal_round[club]
+        lo, hi = np.searchsorted(rounds, [rnd, rnd + 1]).tolist()
+        names = self.squads[club]
+        return [
+            (minute, names[scorer])
+            for minute, scorer in zip(
+                self.minute[club][lo:hi].tolist(), self.scorer[club][lo:hi].tolist()
+            )
+        ]
+
+    def candidates(self, kind: ConferenceType) -> "np.ndarray":
+        """(round, club) pairs a conference of `kind` fits, as a mask over the
+        tables: rounds played before it, and the club."""
+        played = np.arange(self.rounds + 1)[:, None]
+        nxt = np.vstack([self.opponent, np.full((1, self.size), -1)])
+        last = np.vstack([np.full((1, self.size), -1), self.opponent])
+        if kind in (ConferenceType.TRANSFER_WINDOW, ConferenceType.BIG_SIGNING):
+            windows = (played == 0) | (played == self.rounds // 2)
+            return np.broadcast_to(windows, self.points.shape)
+        if kind is ConferenceType.POST_MATCH:
+            return last >= 0
+        if kind is ConferenceType.RIVALRY_PREVIEW:
+            return nxt == np.array(self.rival)
+        if kind is ConferenceType.CRISIS:
+            recent = self.lost - np.roll(self.lost, FORM_MATCHES, axis=0)
+            slump = (played >= FORM_MATCHES) & (recent >= FORM_MATCHES - 1)
+            bottom = (played >= 10) & (self.position > self.size - 3)
+            return (nxt >= 0) & (slump | bottom)
+        return (nxt >= 0) & (played >= 1)  # PRE_MATCH
+
+
+def _draw(rng, weights: "np.ndarray", size: int) -> "np.ndarray":
+    """`size` indices drawn in proportion to `weights`."""
+    cdf = np.cumsum(weights)
+    return np.minimum(np.searchsorted(cdf, rng.random(size) * cdf[-1]), len(cdf) - 1)
+
+
+def _confidence(pressure: float) -> BoardConfidence:
+    for limit, confidence in BOARD:
+        if pressure < limit:
+            return confidence
+    return BoardConfidence.ON_THE_BRINK
+
+
+class _StateBuilder:
+    """Builds one GameState for a club of a season at a point in it."""
+
+    def __init__(self, season: Season, club: int, played: int, rng: random.Random):
+        self.s, self.c, self.r, self.rng = season, club, played, rng
+        self.names = season.squads[club]
+
+    def club(self) -> Club:
+        s, c = self.s, self.c
+        rival = s.rival[c]
+        kind = (
+            "local derby"
+            if s.towns[rival] == s.towns[c]
+            else "title race"
+            if max(s.expected[c], s.expected[rival]) <= 4
+            else "historical grudge"
+        )
+        titles = s.titles[c]
+        honours = [f"{titles}x {s.league} Champions"] if titles else []
+        previous = s.previous[:, c].tolist()
+        return Club(
+            name=s.names[c],
+            nickname=f"The {s.nicknames[c]}",
+            founded=s.founded[c],
+            stadium=f"{s.towns[c]} {GROUNDS[s.founded[c] % len(GROUNDS)]}",
+            capacity=s.capacity[c],
+            honours=honours,
+            recent_seasons=[
+                f"{FIRST_SEASON - i - 1}-{(FIRST_SEASON - i) % 100:02d}: "
+                f"{_ordinal(pos)}"
+                for i, pos in enumerate(previous)
+            ],
+            rivalries=[
+                Rivalry(
+                    opponent=s.names[rival],
+                    rivalry_type=kind,
+                    description=f"{s.names[rival]} finished "
+                    f"{_ordinal(s.previous[0, rival])} last season.",
+                )
+            ],
+        )
+
+    def pressure(self) -> float:
+        """How far below expectations the club is, from table and form."""
+        s, c, r = self.s, self.c, self.r
+        recent = s.lost[r, c] - s.lost[max(0, r - FORM_MATCHES), c]
+        table = (s.position[r, c] - s.expected[c]) / s.size if r else 0.0
+        return float(table + 0.08 * (recent - 2 if r >= FORM_MATCHES else 0))
+
+    def manager(self) -> Manager:
+        s, c, r = self.s, self.c, self.r
+        name, nationality, age, tenure, reputation = s.managers[c]
+        played = int(s.played[r, c])
+        win_rate = s.won[r, c] / played if played else 0.35 + 0.3 * s.quality[c]
+        others = self.rng.sample(range(s.size), 2)
+        return Manager(
+            name=name,
+            age=age,
+            nationality=nationality,
+            tenure_months=tenure + r * 9 // s.rounds,
+            board_confidence=_confidence(self.pressure()),
+            media_reputation=reputation,
+            previous_clubs=[s.names[o] for o in others if o != c],
+            win_percentage=round(100 * float(win_rate), 1),
+        )
+
+    def squad(self, top: list[str]) -> list[Player]:
+        s, c, r, rng = self.s, self.c, self.r, self.rng
+        goals = s.player_goals[r, c].tolist()
+        assists = s.player_assists[r, c].tolist()
+        moods = s.morale[r, c].tolist()
+        stars = s.stars[c]
+        squad = []
+        for i, (position, _, _) in enumerate(SQUAD):
+            morale = MORALE[moods[i]]
+            rumour = None
+            if i in stars and top and s.position[r, c] > 4 and rng.random() < 0.5:
+                rumour = f"linked with {rng.choice(top)}"
+            elif morale in (PlayerMorale.UNHAPPY, PlayerMorale.FURIOUS):
+                if rng.random() < 0.4:
+                    rumour = rng.choice(
+                        ("wants to leave", "agent says he needs minutes elsewhere")
+                    )
+            elif self.s.ages[c][i] <= 21 and rng.random() < 0.1:
+                rumour = f"{rng.choice(top or FOREIGN_CLUBS)} scouts watching"
+            squad.append(
+                Player(
+                    self.names[i],
+                    position,
+                    s.ages[c][i],
+                    is_captain=i == s.captain[c],
+                    is_star_player=i in stars,
+                    morale=morale,
+                    transfer_rumour=rumour,
+                    goals=goals[i],
+                    assists=assists[i],
+                )
+            )
+        return squad
+
+    def injuries(self, squad: list[Player]) -> list[Injury]:
+        rng = self.rng
+        count = rng.choices(range(5), weights=(30, 35, 20, 10, 5))[0]
+        injured = []
+        for player in rng.sample(squad, count):
+            injury, shortest, longest = rng.choice(INJURIES)
+            injured.append(
+                Injury(
+                    player.name,
+                    injury,
+                    weeks_out=rng.randint(shortest, longest),
+                    is_key_player=player.is_star_player or player.is_captain,
+                )
+            )
+        return injured
+
+    def journalists(self) -> list[Journalist]:
+        rng = self.rng
+        press = rng.sample(JOURNALISTS, rng.randint(2, 3))
+        local = f"{self.s.towns[self.c]} {LOCAL_PAPERS[self.c % len(LOCAL_PAPERS)]}"
+        press.append((local, JournalistPersonality.LOCAL_PRESS_FRIENDLY))
+        return [
+            Journalist(
+                f"{rng.choice(FIRST_NAMES)} {rng.choice(SURNAMES)}",
+                outlet,
+                personality,
+                rng.choice(RELATIONSHIPS[personality]),
+            )
+            for outlet, personality in press
+        ]
+
+    def upcoming(self) -> UpcomingMatch:
+        s, c, r = self.s, self.c, self.r
+        opponent = int(s.opponent[r, c])
+        ours, theirs = s.position[r, c], s.position[r, opponent]
+        if opponent == s.rival[c]:
+            significance = f"{s.names[c]} v {s.names[opponent]}, the big rivalry game"
+        elif r and max(ours, theirs) <= 4:
+            significance = f"Top-four clash: {_ordinal(ours)} v {_ordinal(theirs)}"
+        elif r and min(ours, theirs) > s.size - 4:
+            significance = "Relegation six-pointer"
+        elif ours > s.size - 3 and r:
+            significance = f"Must-win, sitting {_ordinal(ours)} of {s.size}"
+        else:
+            significance = f"They sit {_ordinal(theirs)}" if r else "Opening day"
+        return UpcomingMatch(
+            opponent=s.names[opponent],
+            competition=s.league,
+            home=bool(s.at_home[r, c]),
+            significance=significance,
+        )
+
+    def post_match(self, last: MatchRecord) -> PostMatchContext:
+        s, c, rnd, rng = self.s, self.c, self.r - 1, self.rng
+        opponent = int(s.opponent[rnd, c])
+        goals = [(m, f"Goal: {name} {m}'") for m, name in s.goals_in(c, rnd)]
+        goals += [
+            (m, f"Goal for {s.names[opponent]}: {name} {m}'")
+            for m, name in s.goals_in(opponent, rnd)
+        ]
+        if rng.random() < 0.1:
+            m = rng.randint(20, 89)
+            goals.append((m, f"Red card for {rng.choice(self.names[1:11])} {m}'"))
+        return PostMatchContext(
+            opponent=last.opponent,
+            score=last.score,
+            result=last.result,
+            notable_events=[event for _, event in sorted(goals)],
+        )
+
+    def transfer(self, squad: list[Player], signing: bool) -> TransferContext:
+        s, c, rng = self.s, self.c, self.rng
+        budget = max(1, round(30 * float(np.exp(2 * s.quality[c])) * rng.random()))
+        others = [s.names[o] for o in rng.sample(range(s.size), 3) if o != c]
+        incoming = [
+            f"{rng.choice(FIRST_NAMES)} {rng.choice(SURNAMES)} "
+            f"({rng.choice(SQUAD)[0]}) from {rng.choice(others)}, "
+            f"£{rng.randint(1, max(2, budget))}M"
+            for _ in range(rng.randint(0, 2))
+        ]
+        bench = [p for p in squad[11:] if not p.is_captain]
+        outgoing = [
+            f"{p.name} to {rng.choice(others)} (loan)"
+            for p in rng.sample(bench, rng.randint(0, 2))
+        ]
+        new_signing = None
+        if signing:
+            fee = rng.randint(2 * budget, 4 * budget + 10)
+            new_signing = (
+                f"{rng.choice(FIRST_NAMES)} {rng.choice(SURNAMES)} "
+                f"({rng.choice(('ST', 'AM', 'CB', 'LW'))}) from "
+                f"{rng.choice(FOREIGN_CLUBS)} for £{fee}M, a club record"
+            )
+            incoming.insert(0, new_signing)
+        return TransferContext(
+            window="summer" if self.r < s.rounds // 2 else "january",
+            incoming=incoming,
+            outgoing=outgoing,
+            rumoured=[
+                f"{p.name}: {p.transfer_rumour}" for p in squad if p.transfer_rumour
+            ],
+            budget_remaining=f"£{budget}M",
+            new_signing=new_signing,
+        )
+
+    def build(self, kind: ConferenceType) -> GameState:
+        s, r = self.s, self.r
+        leaders = np.argsort(s.position[r])[:4].tolist()
+        top = [s.names[o] for o in leaders if o != self.c]
+        squad = self.squad(top)
+        form = s.form(self.c, r)
+        state = GameState(
+            club=self.club(),
+            manager=self.manager(),
+            squad=squad,
+            injuries=self.injuries(squad),
+            journalists=self.journalists(),
+            league_standing=s.standing(self.c, r),
+            recent_form=form,
+            conference_type=kind,
+        )
+        if kind is ConferenceType.POST_MATCH:
+            state.post_match = self.post_match(form[0])
+        elif kind in (ConferenceType.TRANSFER_WINDOW, ConferenceType.BIG_SIGNING):
+            state.transfer = self.transfer(squad, kind is ConferenceType.BIG_SIGNING)
+        else:
+            state.upcoming_match = self.upcoming()
+        return state
+
+
+def _ordinal(n: int) -> str:
+    n = int(n)
+    suffix = (
+        "th" if 10 <= n % 100 <= 20 else {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+    )
+    return f"{n}{suffix}"
+
+
+def generate(
+    count: int,
+    clubs: int = 20,
+    seed: int = 0,
+    types: Iterable[ConferenceType] | None = None,
+    per_season: int | None = None,
+) -> Iterator[GameState]:
+    """`count` GameStates from as many simulated seasons as it takes, taking
+    up to `per_season` (default 4 per club) from each, spread evenly over
+    `types` (default: every conference type) and over the season."""
+    _require_numpy()
+    types = list(types or ConferenceType)
+    per_type = max(1, (per_season or 4 * clubs) // len(types))
+    league = 0
+    while count > 0:
+        season = Season(clubs, seed=(seed, league))
+        rng = np.random.default_rng((seed, league, 1))
+        picks = []
+        for kind in types:
+            spots = np.flatnonzero(season.candidates(kind))
+            chosen = rng.choice(spots, min(per_type, len(spots)), replace=False)
+            picks += [(kind, *divmod(int(spot), clubs)) for spot in chosen]
+        for i in rng.permutation(len(picks))[:count].tolist():
+            kind, played, club = picks[i]
+            state_rng = random.Random(f"{seed}:{league}:{kind.name}:{played}:{club}")
+            yield _StateBuilder(season, club, played, state_rng).build(kind)
+        count -= min(count, len(picks))
+        league += 1
+
+
+def state_doc(state: GameState) -> dict:
+    """The GameState as a JSON-able document that `packs.build_state` reads."""
+
+    def factory(items):
+        return {k: v.value if isinstance(v, Enum) else v for k, v in items}
+
+    return dataclasses.asdict(state, dict_factory=factory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--clubs", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--types",
+        help="comma-separated conference types, by value or name (default: all)",
+    )
+    parser.add_argument("--out", help="write one JSON GameState per line here")
+    args = parser.parse_args()
+
+    types = None
+    if args.types:
+        by_name = {t.name: t for t in ConferenceType} | {
+            t.value: t for t in ConferenceType
+        }
+        try:
+            types = [by_name[t.strip()] for t in args.types.split(",")]
+        except KeyError as e:
+            parser.error(f"unknown conference type {e}")
+
+    start = time.perf_counter()
+    states = list(generate(args.count, args.clubs, args.seed, types))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{len(states):,} states in {elapsed:.2f} s ({len(states) / elapsed:,.0f}/s)",
+        file=sys.stderr,
+    )
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            for state in states:
+                f.write(json.dumps(state_doc(state), ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()